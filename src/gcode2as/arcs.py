@@ -0,0 +1,119 @@
+"""Module for translating G2/G3 arcs to circular interpolation moves
+
+The circular moves of AS (C1MOVE followed by C2MOVE) move the robot along the circle through its
+position, an intermediate point and an end point. An arc is split into parts of at most half a
+circle, so the three points of every part define the circle unambiguously, and every part is
+translated to an intermediate and an end point. Only arcs in the XY plane (G17) are supported, a
+change of z is spread evenly over the parts of the arc.
+"""
+
+from math import atan2, ceil, cos, hypot, pi, sin, sqrt
+from typing import List, Tuple
+
+from gcode2as.toolpath import Position
+
+# angles and lengths closer than this are considered equal
+EPSILON = 1e-9
+
+# the largest arc translated to a single pair of circular moves
+MAX_PART_ANGLE = pi
+
+# the computed points are rounded to this many decimals, so e.g. cos(pi / 2) is printed as 0.0
+POINT_DIGITS = 6
+
+ArcPart = Tuple[Position, Position]
+
+
+def radius_center(start: Position, end: Position, radius: float, clockwise: bool) -> Tuple[float, float]:
+    """Returns the center of the arc of the R form of G2/G3
+
+    The arc is the shorter one for a positive radius and the longer one for a negative radius.
+    """
+    chord_x = end[0] - start[0]
+    chord_y = end[1] - start[1]
+    chord = hypot(chord_x, chord_y)
+
+    if chord < EPSILON:
+        raise ValueError('The end point of an arc given with a radius must differ from its start point')
+
+    height_squared = radius ** 2 - (chord / 2) ** 2
+
+    if height_squared < -EPSILON * max(1.0, radius ** 2):
+        raise ValueError(f'The arc radius {abs(radius)} is too small for a chord of {chord:.4f}')
+
+    # the distance of the center from the middle of the chord, towards the left of the chord direction
+    height = sqrt(max(height_squared, 0.0)) / chord
+
+    if clockwise == (radius > 0):
+        height = -height
+
+    return (
+        (start[0] + end[0]) / 2 - chord_y * height,
+        (start[1] + end[1]) / 2 + chord_x * height
+    )
+
+
+def arc_parts(
+        start: Position,
+        end: Position,
+        clockwise: bool,
+        offset: Tuple[float, float] | None = None,
+        radius: float | None = None
+) -> List[ArcPart]:
+    """Splits an arc into the intermediate and end points of its circular moves
+
+    Args:
+        start (Position): the position the arc starts at
+        end (Position): the target of the arc
+        clockwise (bool): True for G2, False for G3
+        offset (Tuple[float, float] | None): the I and J offsets of the center from the start
+        radius (float | None): the R word, only used if the offsets are not given
+
+    Raises:
+        ValueError: if the arc has no center or it is not on a circle
+
+    Returns:
+        List[ArcPart]: the (intermediate point, end point) pair of every part of the arc
+    """
+    if offset is not None:
+        center_x, center_y = start[0] + offset[0], start[1] + offset[1]
+
+    elif radius is not None:
+        center_x, center_y = radius_center(start, end, radius, clockwise)
+
+    else:
+        raise ValueError('An arc needs the I and J offsets or the R radius of its center')
+
+    arc_radius = hypot(start[0] - center_x, start[1] - center_y)
+
+    if arc_radius < EPSILON:
+        raise ValueError('The center of an arc can not be its start point')
+
+    start_angle = atan2(start[1] - center_y, start[0] - center_x)
+    sweep = atan2(end[1] - center_y, end[0] - center_x) - start_angle
+
+    # an arc ending at its start point is a full circle
+    if clockwise and sweep > -EPSILON:
+        sweep -= 2 * pi
+
+    elif not clockwise and sweep < EPSILON:
+        sweep += 2 * pi
+
+    count = max(1, ceil(abs(sweep) / MAX_PART_ANGLE - EPSILON))
+    rise = end[2] - start[2]
+
+    def point(fraction: float) -> Position:
+        angle = start_angle + sweep * fraction
+
+        return (
+            round(center_x + arc_radius * cos(angle), POINT_DIGITS) + 0.0,
+            round(center_y + arc_radius * sin(angle), POINT_DIGITS) + 0.0,
+            round(start[2] + rise * fraction, POINT_DIGITS) + 0.0
+        )
+
+    parts = [(point((index + 0.5) / count), point((index + 1) / count)) for index in range(count)]
+
+    # the arc ends exactly at its target, not at the rounded point of the circle
+    parts[-1] = (parts[-1][0], end)
+
+    return parts
@@ -0,0 +1,337 @@
+"""Module for converting G-code files without user interaction"""
+
+import glob
+import json
+import shutil
+import signal
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext, redirect_stdout
+from dataclasses import dataclass, field, replace
+from io import StringIO
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, Iterable, Iterator, List, TextIO
+from click import echo
+from colorama import Fore
+
+from gcode2as.cache import ConversionCache, cache_key, settings_key
+from gcode2as.cli import CLICommand, CLICommandOptions
+from gcode2as.cli.modes import MODES
+from gcode2as.formatter import MAX_PROGRAM_BYTES, MAX_PROGRAM_LENGTH, write_program
+from gcode2as.incremental import LayerStore, convert_incremental
+from gcode2as.mapped import MappedFile
+from gcode2as.optimizer import Optimizer
+from gcode2as.parallel import convert_layers
+from gcode2as.pipeline import ReadAhead, WriteBehind
+from gcode2as.simplify import DEFAULT_MIN_DISTANCE, DEFAULT_TOLERANCE, SIMPLIFICATIONS, SIMPLIFY_DISTANCE
+
+
+@dataclass
+class ConversionJob:
+    """Everything a worker process needs to convert a single file"""
+    input_path: str
+    output_path: str
+    mode: str
+    min_distance: float = DEFAULT_MIN_DISTANCE
+    simplification: str = SIMPLIFY_DISTANCE
+    tolerance: float = DEFAULT_TOLERANCE
+    precision: float | None = None
+    arc_tolerance: float | None = None
+    max_steps: int = MAX_PROGRAM_LENGTH
+    max_bytes: int = MAX_PROGRAM_BYTES
+    split_files: bool = False
+    optimize: bool = False
+    # the estimated cycle time is printed in the log of the job
+    estimate: bool = False
+    settings: Dict[str, Any] = field(default_factory=dict)
+    verbose: bool = False
+    workers: int = 1
+    cache_dir: str | None = None
+    incremental: bool = False
+    pipeline: bool = False
+    mapped: bool = False
+
+
+@dataclass
+class JobResult:
+    """The outcome of a conversion job"""
+    input_path: str
+    output_path: str
+    succeeded: bool
+    elapsed: float
+    error: str | None = None
+    log: str = ''
+    cached: bool = False
+
+
+def load_profile(path: Path) -> Dict[str, Any]:
+    """Loads a conversion profile from a JSON or a TOML file
+
+    Args:
+        path (Path): the path of the profile, the format is selected by its suffix
+
+    Returns:
+        Dict[str, Any]: the profile values, the mode specific options are under the "settings" key
+    """
+    if path.suffix.lower() == '.toml':
+        try:
+            import tomllib
+
+        except ImportError as error:  # pragma: no cover - python < 3.11
+            raise ValueError('TOML profiles require Python 3.11 or newer, use a JSON profile') from error
+
+        with open(path, 'rb') as f_open:
+            return tomllib.load(f_open)
+
+    with open(path, 'r', encoding='utf8') as f_open:
+        return json.load(f_open)
+
+
+def profile_job(
+        values: Dict[str, Any],
+        input_path: str | Path,
+        output_path: str | Path,
+        cache_dir: str | None = None
+) -> ConversionJob:
+    """Creates the conversion job of a file from the values of a profile
+
+    Args:
+        values (Dict[str, Any]): the profile values, the mode is required and the mode specific options
+            are under the "settings" key
+        input_path (str | Path): the G-code file to convert
+        output_path (str | Path): the path of the generated program
+        cache_dir (str | None): the directory of the conversion cache, None to always convert the file
+
+    Returns:
+        ConversionJob: the job, the values missing from the profile are the defaults
+
+    Raises:
+        ValueError: if a value of the profile is invalid
+    """
+    precision = values.get('precision')
+    arc_tolerance = values.get('arc_tolerance')
+
+    if values.get('mode') not in MODES:
+        raise ValueError(f'The mode must be one of {", ".join(MODES)}, got {values.get("mode")!r}')
+
+    if values.get('simplification', SIMPLIFY_DISTANCE) not in SIMPLIFICATIONS:
+        raise ValueError(f'Unknown simplification {values["simplification"]!r}')
+
+    if not isinstance(values.get('settings', {}), dict):
+        raise ValueError('The mode specific settings must be a mapping')
+
+    return ConversionJob(
+        input_path=str(input_path),
+        output_path=str(output_path),
+        mode=values['mode'],
+        min_distance=float(values.get('min_distance', DEFAULT_MIN_DISTANCE)),
+        simplification=values.get('simplification', SIMPLIFY_DISTANCE),
+        tolerance=float(values.get('tolerance', DEFAULT_TOLERANCE)),
+        precision=float(precision) if precision is not None else None,
+        arc_tolerance=float(arc_tolerance) if arc_tolerance is not None else None,
+        max_steps=int(values.get('max_steps', MAX_PROGRAM_LENGTH)),
+        max_bytes=int(values.get('max_bytes', MAX_PROGRAM_BYTES)),
+        split_files=bool(values.get('split_files', False)),
+        optimize=bool(values.get('optimize', False)),
+        estimate=bool(values.get('estimate', False)),
+        settings=dict(values.get('settings', {})),
+        verbose=bool(values.get('verbose', False)),
+        cache_dir=cache_dir,
+        incremental=bool(values.get('incremental', False)),
+        pipeline=bool(values.get('pipeline', False)),
+        mapped=bool(values.get('mmap', False))
+    )
+
+
+def expand_paths(patterns: Iterable[str]) -> List[Path]:
+    """Expands the glob patterns to the list of the matching files, keeping the given order"""
+    paths: Dict[Path, None] = {}
+
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+
+        for match in matches:
+            path = Path(match)
+
+            if path.is_file():
+                paths.setdefault(path)
+
+    return list(paths)
+
+
+def job_options(job: ConversionJob, file: TextIO) -> CLICommandOptions:
+    """Returns the conversion options of the job reading the opened input file"""
+    options = CLICommandOptions(
+        file=file,
+        min_distance=job.min_distance,
+        verbose=job.verbose,
+        simplification=job.simplification,
+        tolerance=job.tolerance,
+        precision=job.precision,
+        arc_tolerance=job.arc_tolerance,
+        max_steps=job.max_steps,
+        max_bytes=job.max_bytes,
+        optimize=job.optimize,
+        mapped=job.mapped
+    )
+
+    if job.mapped:
+        return replace(options, file=MappedFile(job.input_path))
+
+    if job.pipeline:
+        return replace(options, file=ReadAhead(file))
+
+    return options
+
+
+def write_job(
+        job: ConversionJob,
+        mode: CLICommand,
+        options: CLICommandOptions,
+        output: TextIO,
+        program_name: str,
+        subprogram_dir: Path | None = None,
+        store: LayerStore | None = None
+) -> None:
+    """Converts the input of the options with the configured mode, writing the program as it is generated
+
+    Args:
+        job (ConversionJob): the job, its workers convert the layers of the file in parallel
+        mode (CLICommand): the configured mode
+        options (CLICommandOptions): the options of the job, see job_options
+        output (TextIO): the file the program is written to
+        program_name (str): the name of the AS program
+        subprogram_dir (Path | None): the directory of the subprogram files, see write_program
+        store (LayerStore | None): if given, only the layers missing from the store are converted
+    """
+    if store is not None:
+        lines = convert_incremental(mode, options, store)
+
+    else:
+        lines = convert_layers(mode, job.settings, options, job.workers)
+
+    optimizer = Optimizer(mode.split_rules()) if options.optimize else None
+
+    if optimizer is not None:
+        lines = optimizer.optimize(lines)
+
+    estimator = None
+
+    if job.estimate:
+        from gcode2as.estimate import CycleEstimator
+
+        estimator = CycleEstimator(mode.split_rules())
+        lines = estimator.observe(lines)
+
+    write_program(lines, program_name, output, options.budget, mode.split_rules(), subprogram_dir)
+
+    if optimizer is not None:
+        echo(f'[{Fore.BLUE}Info{Fore.RESET}]: The optimizer removed {optimizer.summary()}')
+
+    if estimator is not None:
+        echo(f'[{Fore.BLUE}Info{Fore.RESET}]: Estimated cycle time {estimator.estimate().describe()}')
+
+
+def warm_up(modes: Iterable[str]) -> None:
+    """Imports the modes in a worker process, so the first conversion does not wait for them"""
+    # the Ctrl+C of the terminal reaches the workers too, their pool stops them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    for mode in modes:
+        _ = MODES[mode]
+
+
+def run_job(job: ConversionJob) -> JobResult:
+    """Converts a single file, the messages of the mode are captured instead of printed
+
+    This function runs in the worker processes, so it never raises: the errors are returned in the
+    result.
+    """
+    start = perf_counter()
+    log = StringIO()
+    cached = False
+
+    try:
+        with redirect_stdout(log):
+            mode = MODES[job.mode]()
+            mode.configure(job.settings)
+            program_name = Path(job.input_path).stem
+
+            with open(job.input_path, 'r', encoding='utf8') as file:
+                options = job_options(job, file)
+
+                # the cache only stores a single file
+                use_cache = job.cache_dir is not None and not job.split_files
+                cache = ConversionCache(Path(job.cache_dir)) if use_cache else None
+                key = cache_key(job.input_path, program_name, mode, job.settings, options) if cache else None
+                cached_path = cache.get(key) if cache is not None else None
+
+                if cached_path is not None:
+                    shutil.copyfile(cached_path, job.output_path)
+                    cached = True
+
+                else:
+                    store = None
+
+                    if job.incremental and cache is not None:
+                        store = LayerStore(cache, settings_key(program_name, mode, job.settings, options))
+
+                    with open(job.output_path, 'w', encoding='utf8') as f_open, \
+                            (WriteBehind(f_open) if job.pipeline else nullcontext(f_open)) as output:
+                        write_job(
+                            job,
+                            mode,
+                            options,
+                            output,
+                            program_name,
+                            subprogram_dir=Path(job.output_path).parent if job.split_files else None,
+                            store=store
+                        )
+
+                    # a partial program fails the job, it is deleted like the output of any other error
+                    if mode.error is not None:
+                        raise ValueError(mode.error)
+
+                    if cache is not None:
+                        cache.put(key, Path(job.output_path))
+
+    except Exception as error:  # pylint: disable=broad-except
+        Path(job.output_path).unlink(missing_ok=True)
+
+        return JobResult(
+            job.input_path,
+            job.output_path,
+            succeeded=False,
+            elapsed=perf_counter() - start,
+            error=f'{type(error).__name__}: {error}',
+            log=log.getvalue()
+        )
+
+    return JobResult(
+        job.input_path,
+        job.output_path,
+        succeeded=True,
+        elapsed=perf_counter() - start,
+        log=log.getvalue(),
+        cached=cached
+    )
+
+
+def run_jobs(jobs: List[ConversionJob], workers: int) -> Iterator[JobResult]:
+    """Runs the jobs in a pool of worker processes, yielding the results as they finish
+
+    A single file is split at its layers and the workers convert its chunks instead.
+    """
+    if len(jobs) == 1:
+        yield run_job(replace(jobs[0], workers=workers))
+        return
+
+    if workers <= 1:
+        yield from map(run_job, jobs)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        futures = [executor.submit(run_job, job) for job in jobs]
+
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,252 @@
+"""Benchmark of the conversion modes on synthetic G-code
+
+The generators write G-code shaped like the output of the slicers of each mode, so the conversion
+can be measured at any size without shipping large resource files. Every case runs in a fresh
+process, so its peak memory usage is not affected by the previous cases.
+"""
+
+import json
+import os
+import platform
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass
+from io import StringIO, TextIOBase
+from math import cos, pi, sin
+from multiprocessing import get_context
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, TextIO
+
+from gcode2as import __version__
+from gcode2as.cli import CLICommandOptions
+from gcode2as.cli.modes import MODES
+from gcode2as.formatter import write_program
+from gcode2as.profiling import peak_rss
+from gcode2as.simplify import DEFAULT_MIN_DISTANCE, DEFAULT_TOLERANCE, SIMPLIFY_DISTANCE
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000, 10_000_000)
+
+# the number of moves around a layer or a contour
+SEGMENTS = 120
+LAYER_HEIGHT = 0.2
+
+# the vase mode parts are this many layers high, each part is welded as a single spiral
+PART_LAYERS = 50
+
+
+def generate_fdm(length: int) -> Iterator[str]:
+    """Generates the G-code of an FDM print of cylindrical walls
+
+    Every layer starts with a layer comment and a travel, the walls are extruded with an increasing
+    E value and the extrusion is retracted at the end of every layer.
+    """
+    extrusion = 0.0
+    layer = 0
+
+    yield ';FLAVOR:Marlin\n'
+    yield 'G28\n'
+    yield 'G92 E0\n'
+
+    count = 3
+
+    while True:
+        z_pos = round((layer + 1) * LAYER_HEIGHT, 3)
+        layer_lines = [f';LAYER:{layer}\n', f'G0 F3000 X70.000 Y50.000 Z{z_pos}\n', 'G1 F1200\n']
+
+        for segment in range(1, SEGMENTS + 1):
+            angle = 2 * pi * segment / SEGMENTS
+            extrusion += 0.05
+            layer_lines.append(
+                f'G1 X{50 + 20 * cos(angle):.3f} Y{50 + 20 * sin(angle):.3f} E{extrusion:.5f}\n'
+            )
+
+        extrusion -= 1
+        layer_lines.append(f'G1 F2400 E{extrusion:.5f}\n')
+
+        for line in layer_lines:
+            if count >= length:
+                return
+
+            count += 1
+            yield line
+
+        layer += 1
+
+
+def generate_metal(length: int) -> Iterator[str]:
+    """Generates the G-code of metal parts sliced in vase mode
+
+    After the travel to the start point of a part its wall is a single spiral, every move raises z.
+    """
+    yield ';FLAVOR:Marlin\n'
+
+    part_length = PART_LAYERS * SEGMENTS + 1
+
+    for index in range(length - 1):
+        part, move = divmod(index, part_length)
+        center_x = 50 + 50 * (part % 10)
+        center_y = 50 + 50 * (part // 10 % 10)
+
+        if move == 0:
+            yield f'G0 F3000 X{center_x + 20:.3f} Y{center_y:.3f} Z{LAYER_HEIGHT}\n'
+            continue
+
+        angle = 2 * pi * move / SEGMENTS
+        x_pos = center_x + 20 * cos(angle)
+        y_pos = center_y + 20 * sin(angle)
+        z_pos = LAYER_HEIGHT + LAYER_HEIGHT * move / SEGMENTS
+
+        yield f'G1 X{x_pos:.3f} Y{y_pos:.3f} Z{z_pos:.4f} E{move * 0.05:.5f}\n'
+
+
+def generate_laser(length: int) -> Iterator[str]:
+    """Generates the G-code of laser cut contours, a travel to every contour and the cut around it"""
+    yield 'G21\n'
+    yield 'G90\n'
+
+    count = 2
+    contour = 0
+
+    while True:
+        center_x = 20 + 40 * (contour % 10)
+        center_y = 20 + 40 * (contour // 10 % 10)
+        radius = 5 + contour % 7
+
+        contour_lines = [f'G0 F6000 X{center_x + radius:.3f} Y{center_y:.3f}\n', 'G1 F1500\n']
+
+        for segment in range(1, SEGMENTS + 1):
+            angle = 2 * pi * segment / SEGMENTS
+            contour_lines.append(
+                f'G1 X{center_x + radius * cos(angle):.3f} Y{center_y + radius * sin(angle):.3f}\n'
+            )
+
+        for line in contour_lines:
+            if count >= length:
+                return
+
+            count += 1
+            yield line
+
+        contour += 1
+
+
+GENERATORS: Dict[str, Callable[[int], Iterator[str]]] = {
+    'fdm': generate_fdm,
+    'metal': generate_metal,
+    'laser': generate_laser,
+}
+
+# the answers to the mode specific questions used in the benchmark
+SETTINGS: Dict[str, Dict[str, Any]] = {
+    'fdm': {'extrude': 2001, 'retract': 2002},
+    'metal': {'vase_mode': True, 'speed': 15},
+    'laser': {'laser_control_first_signal': 10, 'laser_control_second_signal': 11},
+}
+
+
+@dataclass
+class BenchmarkCase:
+    """The parameters of a single measurement"""
+    mode: str
+    lines: int
+    simplification: str = SIMPLIFY_DISTANCE
+    min_distance: float = DEFAULT_MIN_DISTANCE
+    tolerance: float = DEFAULT_TOLERANCE
+
+
+@dataclass
+class BenchmarkResult:
+    """The measurements of a case, the peak memory usage is None where it can not be measured"""
+    case: BenchmarkCase
+    seconds: float
+    lines_per_second: float
+    output_lines: int
+    peak_rss_bytes: int | None
+
+
+def write_gcode(mode: str, length: int, file: TextIO) -> None:
+    """Writes synthetic G-code of the given number of lines for the mode"""
+    file.writelines(GENERATORS[mode](length))
+
+
+class _LineCounter(TextIOBase):
+    """Text sink counting the written lines, so the output is formatted but not kept in memory"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        self.lines += text.count('\n')
+        return len(text)
+
+
+def run_case(case: BenchmarkCase, directory: str) -> BenchmarkResult:
+    """Generates the G-code of the case and measures its conversion and formatting"""
+    path = Path(directory).joinpath(f'{case.mode}_{case.lines}.gcode')
+
+    if not path.exists():
+        with open(path, 'w', encoding='utf8') as file:
+            write_gcode(case.mode, case.lines, file)
+
+    sink = _LineCounter()
+
+    with redirect_stdout(StringIO()):
+        mode = MODES[case.mode]()
+        mode.configure(SETTINGS[case.mode])
+
+        with open(path, 'r', encoding='utf8') as file:
+            options = CLICommandOptions(
+                file=file,
+                min_distance=case.min_distance,
+                verbose=False,
+                simplification=case.simplification,
+                tolerance=case.tolerance
+            )
+
+            start = perf_counter()
+            write_program(mode.convert(options), path.stem, sink, rules=mode.split_rules())
+            seconds = perf_counter() - start
+
+    return BenchmarkResult(
+        case,
+        seconds=seconds,
+        lines_per_second=case.lines / seconds if seconds > 0 else 0.0,
+        output_lines=sink.lines,
+        peak_rss_bytes=peak_rss()
+    )
+
+
+def run_benchmark(cases: List[BenchmarkCase]) -> Iterator[BenchmarkResult]:
+    """Runs the cases one after the other, each in a new process"""
+    with TemporaryDirectory(prefix='gcode2as-benchmark-') as directory:
+        for case in cases:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                yield executor.submit(run_case, case, directory).result()
+
+            # the generated file of the case is not needed by the next ones
+            Path(directory).joinpath(f'{case.mode}_{case.lines}.gcode').unlink(missing_ok=True)
+
+
+def environment() -> Dict[str, Any]:
+    """Describes the environment of the benchmark, so the results of different runs can be compared"""
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def dump_results(results: List[BenchmarkResult], file: TextIO) -> None:
+    """Writes the results with the environment as JSON"""
+    json.dump(
+        {'environment': environment(), 'results': [asdict(result) for result in results]},
+        file,
+        indent=2
+    )
+    file.write('\n')
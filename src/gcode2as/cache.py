@@ -0,0 +1,194 @@
+"""Module for caching the generated programs on disk
+
+The programs are stored under a key hashed from everything the output depends on: the bytes of the
+G-code file, the name of the program, the mode with its specific options and the conversion
+options. Converting the same file with the same settings again returns the stored program.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import fields
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any, Dict
+
+from gcode2as import __version__
+from gcode2as.cli import CLICommand, CLICommandOptions
+
+CACHE_DIR_ENV = 'GCODE2AS_CACHE_DIR'
+CACHE_SIZE_ENV = 'GCODE2AS_CACHE_SIZE'
+
+# the least recently used programs are evicted once the cache grows larger than this
+DEFAULT_CACHE_SIZE = 1 << 30
+
+# the size of the blocks the G-code file is hashed in
+READ_SIZE = 1 << 20
+
+SUFFIX = '.pg'
+TEMPORARY_SUFFIX = '.tmp'
+
+# the options the output does not depend on
+RUNTIME_OPTIONS = ('file', 'mapped', 'profiler', 'progress')
+
+
+def default_cache_dir() -> Path:
+    """Returns the cache directory set in the environment, or the user cache directory"""
+    directory = os.environ.get(CACHE_DIR_ENV)
+
+    if directory:
+        return Path(directory)
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or Path.home().joinpath('.cache')
+
+    return Path(cache_home).joinpath('gcode2as')
+
+
+def settings_key(
+        program_name: str,
+        mode: CLICommand,
+        settings: Dict[str, Any],
+        options: CLICommandOptions
+) -> str:
+    """Hashes the settings of a conversion, i.e. everything its output depends on but the G-code
+
+    Args:
+        program_name (str): the name of the generated AS program
+        mode (CLICommand): the mode of the conversion
+        settings (Dict[str, Any]): the answers to the mode specific questions
+        options (CLICommandOptions): the options of the conversion, the file and the
+            instrumentation are left out
+
+    Returns:
+        str: the hex digest of the settings
+    """
+    description = {
+        'version': __version__,
+        'program': program_name,
+        'mode': type(mode).__name__,
+        # the answers can come as strings from the prompts or as numbers from a profile
+        'settings': {key: str(value) for key, value in settings.items()},
+        'options': {
+            option.name: getattr(options, option.name)
+            for option in fields(options) if option.name not in RUNTIME_OPTIONS
+        },
+    }
+
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def cache_key(
+        path: str | Path,
+        program_name: str,
+        mode: CLICommand,
+        settings: Dict[str, Any],
+        options: CLICommandOptions
+) -> str:
+    """Hashes the input of a conversion into the key of its program
+
+    Args:
+        path (str | Path): the path of the G-code file, it is hashed by its content
+        program_name (str): the name of the generated AS program
+        mode (CLICommand): the mode of the conversion
+        settings (Dict[str, Any]): the answers to the mode specific questions
+        options (CLICommandOptions): the options of the conversion
+
+    Returns:
+        str: the hex digest identifying the program
+    """
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        while block := file.read(READ_SIZE):
+            digest.update(block)
+
+    digest.update(settings_key(program_name, mode, settings, options).encode('utf8'))
+
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """Directory of generated programs with size based least recently used eviction"""
+
+    def __init__(self, directory: Path | None = None, max_size: int | None = None) -> None:
+        self.__directory = directory if directory is not None else default_cache_dir()
+
+        if max_size is None:
+            max_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+
+        self.__max_size = max_size
+
+    @property
+    def directory(self) -> Path:
+        return self.__directory
+
+    def get(self, key: str) -> Path | None:
+        """Returns the path of the cached program, or None on a miss
+
+        The modification time of the program is updated on a hit, the eviction removes the programs
+        with the oldest modification times first.
+        """
+        path = self.__path(key)
+
+        try:
+            os.utime(path)
+
+        except FileNotFoundError:
+            return None
+
+        return path
+
+    def put(self, key: str, program: Path) -> None:
+        """Stores a copy of the generated program and evicts the least recently used ones"""
+        self.__directory.mkdir(parents=True, exist_ok=True)
+
+        # the program is copied under a temporary name first, so a concurrent get never sees it partially
+        with NamedTemporaryFile(dir=self.__directory, suffix=TEMPORARY_SUFFIX, delete=False) as temporary:
+            with open(program, 'rb') as source:
+                shutil.copyfileobj(source, temporary)
+
+        os.replace(temporary.name, self.__path(key))
+
+        self.evict()
+
+    def evict(self) -> int:
+        """Removes the least recently used files until the cache fits in its maximum size
+
+        The files stored next to the programs, e.g. the layers of the incremental conversion, are
+        evicted the same way.
+
+        Returns:
+            int: the number of removed files
+        """
+        entries = []
+
+        for path in self.__directory.iterdir():
+            if path.suffix == TEMPORARY_SUFFIX or not path.is_file():
+                continue
+
+            try:
+                stat = path.stat()
+
+            except FileNotFoundError:
+                # removed by another process in the meantime
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        removed = 0
+
+        for _, size, path in entries:
+            if total_size <= self.__max_size:
+                break
+
+            path.unlink(missing_ok=True)
+            total_size -= size
+            removed += 1
+
+        return removed
+
+    def __path(self, key: str) -> Path:
+        return self.__directory.joinpath(f'{key}{SUFFIX}')
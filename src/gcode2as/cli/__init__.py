@@ -1,21 +1,152 @@
 from abc import ABC, abstractmethod, abstractproperty
 from dataclasses import dataclass
 from io import TextIOWrapper
-from typing import List
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List
+from click import echo
+from colorama import Back, Style
+
+from gcode2as.formatter import MAX_PROGRAM_BYTES, MAX_PROGRAM_LENGTH, ProgramBudget, SplitRules
+from gcode2as.simplify import DEFAULT_TOLERANCE, SIMPLIFY_DISTANCE
+
+if TYPE_CHECKING:
+    import inquirer
+
+    from gcode2as.converter import ConversionStats, Converter
+    from gcode2as.mapped import MappedFile
+    from gcode2as.profiling import Profiler, Progress
 
 
 @dataclass
 class CLICommandOptions:
-    file: TextIOWrapper
+    file: 'TextIOWrapper | MappedFile'
     min_distance: float
     verbose: bool
+    simplification: str = SIMPLIFY_DISTANCE
+    tolerance: float = DEFAULT_TOLERANCE
+    # the coordinates are rounded to this precision in mm, None prints them in full
+    precision: float | None = None
+    # the runs of moves lying on a circle within this tolerance in mm are replaced with arcs, None
+    # keeps the moves linear
+    arc_tolerance: float | None = None
+    # the size limits of the subprograms the generated program is split into
+    max_steps: int = MAX_PROGRAM_LENGTH
+    max_bytes: int = MAX_PROGRAM_BYTES
+    # the redundant instructions are removed from the generated program by the peephole optimizer
+    optimize: bool = False
+    # the file is parsed from a memory mapping, the lines are the same as those read in text mode
+    mapped: bool = False
+    # the instrumentation of the conversion, it does not change the output
+    profiler: 'Profiler | None' = None
+    progress: 'Progress | None' = None
+
+    @property
+    def budget(self) -> ProgramBudget:
+        """The size limits of the subprograms"""
+        return ProgramBudget(self.max_steps, self.max_bytes)
 
 
 class CLICommand(ABC):
+    # the error that stopped the last conversion, None if it converted the whole file
+    error: str | None = None
+
     @abstractproperty
     def message(self) -> str:
         pass
 
     @abstractmethod
-    def execute(self, options: CLICommandOptions) -> List[str] | None:
-        pass
+    def questions(self) -> List['inquirer.questions.Question']:
+        """Returns the questions asking for the mode specific options"""
+
+    @abstractmethod
+    def configure(self, answers: Dict[str, Any]) -> None:
+        """Sets the mode specific options from the answers of the questions
+
+        The answers can also come from a profile or the command line, so the missing keys fall back to
+        their defaults and the values may be given as strings.
+        """
+
+    @abstractmethod
+    def prepare(self, options: CLICommandOptions) -> 'Converter':
+        """Creates the converter of the file with the handlers of the mode registered"""
+
+    def header(self) -> List[str]:
+        """Returns the lines of the program before the converted G-code"""
+        return []
+
+    def finish(self) -> List[str]:
+        """Returns the lines still buffered by the mode once the whole file is converted"""
+        return []
+
+    def split_rules(self) -> SplitRules:
+        """Returns the sections of the generated program it should not be split into subprograms in"""
+        return SplitRules()
+
+    @abstractmethod
+    def report(self, stats: 'ConversionStats', as_length: int) -> None:
+        """Prints the stats of the finished conversion"""
+
+    @abstractmethod
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the state of the mode and its converter carried from one G-code line to the next"""
+
+    @abstractmethod
+    def restore(self, state: Dict[str, Any]) -> None:
+        """Continues the conversion from a state returned by snapshot, must be called after prepare"""
+
+    def complete(self, options: CLICommandOptions, stats: 'ConversionStats', as_length: int) -> None:
+        """Ends the progress display, records the stats in the profiler and reports them"""
+        if options.progress is not None:
+            options.progress.finish()
+
+        if options.profiler is not None:
+            options.profiler.record(stats, as_length)
+
+        self.report(stats, as_length)
+
+    def stop(self, options: CLICommandOptions, error: str) -> None:
+        """Ends the conversion at an error, the lines converted before it are kept as a partial program"""
+        self.error = error
+
+        if options.progress is not None:
+            options.progress.finish()
+
+        echo(error)
+        echo(f'{Back.YELLOW}The file will only be generated partially.{Style.RESET_ALL}')
+
+    def convert(self, options: CLICommandOptions) -> Iterator[str]:
+        """Converts the file of the options with the configured mode"""
+        self.error = None
+        converter = self.prepare(options)
+        as_length = 0
+
+        for line in self.header():
+            as_length += 1
+            yield line
+
+        for line in converter.stream():
+            as_length += 1
+            yield line
+
+        for line in self.finish():
+            as_length += 1
+            yield line
+
+        self.complete(options, converter.stats, as_length)
+
+    def ask(self) -> Dict[str, Any] | None:
+        """Asks for the mode specific options and configures the mode with the answers"""
+        import inquirer
+
+        answers = inquirer.prompt(self.questions())
+
+        if answers is not None:
+            self.configure(answers)
+
+        return answers
+
+    def execute(self, options: CLICommandOptions) -> Iterator[str] | None:
+        """Asks for the mode specific options and converts the file"""
+        if self.ask() is None:
+            return None
+
+        return self.convert(options)
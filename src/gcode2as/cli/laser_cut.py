@@ -1,72 +1,65 @@
-import math
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional
 from click import echo
 from colorama import Back, Style
 
-from gcodeparser.gcode_parser import GcodeLine
-import inquirer
 from gcode2as.cli import CLICommand, CLICommandOptions
 from gcode2as.cli.utils.validation import validate_is_int
-from gcode2as.converter import Converter
+from gcode2as.converter import G0, G1, G2, G3, ConversionStats, Converter
+from gcode2as.formatter import SplitRules
+from gcode2as.records import GcodeRecord
+from gcode2as.toolpath import Position
 
 
 class LaserCut(CLICommand):
 
-    def __init__(self) -> None:
-        self.__x_pos = 0
-        self.__y_pos = 0
-        self.__z_pos = 0
+    ONE_SIGNAL = 'One signal'
+    TWO_SIGNALS = 'Two signals'
+
+    # keys for the inquirer
+    CONTROL_TYPE_KEY = 'laser_control_type'
+    ON_SIGNAL_KEY = 'laser_control_first_signal'
+    OFF_SIGNAL_KEY = 'laser_control_second_signal'
 
+    def __init__(self) -> None:
         self.__laser_on_signal: int = 0
         self.__laser_off_signal: Optional[int] = None
         self.__is_laser_on = False
 
-        self.__skipped_distance = 0
-        self.__skipped_moves = 0
-
         self.__execute_options: Optional[CLICommandOptions] = None
+        self.__converter: Optional[Converter] = None
 
     @property
     def message(self) -> str:
         return "Laser cutting"
 
-    def execute(self, options: CLICommandOptions) -> List[str] | None:
-        self.__execute_options = options
+    def questions(self):
+        import inquirer
 
-        laser_control_type_key = 'laser_control_type'
-        one_signal_key = 'One signal'
-        two_signal_key = 'Two signals'
-        
-        vase_mode_key = 'vase_mode'
-        laser_control_signal_first_key = 'laser_control_first_signal'
-        laser_control_signal_second_key = 'laser_control_second_signal'
-
-        questions = [
+        return [
             inquirer.List(
-                laser_control_type_key,
+                LaserCut.CONTROL_TYPE_KEY,
                 message='How is the laser controlled?',
-                choices=[one_signal_key, two_signal_key]
+                choices=[LaserCut.ONE_SIGNAL, LaserCut.TWO_SIGNALS]
             ),
             inquirer.Text(
-                laser_control_signal_first_key,
+                LaserCut.ON_SIGNAL_KEY,
                 message='Enter the signal number to turn on the laser',
                 validate=validate_is_int
             ),
             inquirer.Text(
-                laser_control_signal_second_key,
+                LaserCut.OFF_SIGNAL_KEY,
                 message='Enter the signal number to turn off the laser',
                 validate=validate_is_int,
-                ignore=lambda answers: answers[laser_control_type_key] == one_signal_key
+                ignore=lambda answers: answers[LaserCut.CONTROL_TYPE_KEY] == LaserCut.ONE_SIGNAL
             )
         ]
 
-        answers = inquirer.prompt(questions)
-
-        if answers is None:
-            return
+    def configure(self, answers: Dict[str, Any]) -> None:
+        if answers.get(LaserCut.ON_SIGNAL_KEY) is None:
+            raise ValueError(f'The "{LaserCut.ON_SIGNAL_KEY}" option is required in laser cutting mode')
 
-        self.__laser_on_signal = int(answers[laser_control_signal_first_key])
-        laser_off_string = answers.get(laser_control_signal_second_key)
+        self.__laser_on_signal = int(answers[LaserCut.ON_SIGNAL_KEY])
+        laser_off_string = answers.get(LaserCut.OFF_SIGNAL_KEY)
 
         if laser_off_string is None:
             self.__laser_off_signal = None
@@ -74,87 +67,54 @@ class LaserCut(CLICommand):
         else:
             self.__laser_off_signal = int(laser_off_string)
 
-        converter = Converter(options.file)
+    def prepare(self, options: CLICommandOptions) -> Converter:
+        self.__execute_options = options
 
-        lines = converter.convert(self.__process_line)
+        converter = Converter(options)
+        converter.register(G0, self.__process_g0)
+        converter.register(G1, self.__process_g1, continues_path=True)
+        converter.register(G2, self.__process_arc)
+        converter.register(G3, self.__process_arc)
 
-        echo(f'Conversion {Back.GREEN}done{Style.RESET_ALL}.')
-        echo(f'{Back.CYAN}Stats:{Style.RESET_ALL}')
-        echo(f'\tGCODE file had {converter.file_length} lines')
-        echo(f'\tOmitted {self.__skipped_moves} lines')
-        echo(f'\tAS file length is {len(lines)} lines')
+        self.__converter = converter
 
-        return lines
+        return converter
 
-    def __process_line(self, line: GcodeLine):
-
-        processed_lines: List[str] = []
-
-        # check for parameters
-        feed = line.params.get('F')
-        position = (
-            line.params.get('X'),
-            line.params.get('Y'),
-            line.params.get('Z')
-        )
-
-        # process comment-only lines
-        if line.command[0] == ';':
-            processed_lines.append(f'; {line.comment}')
-
-        # process G0 commands
-        elif line.command[0] == 'G' and line.command[1] == 0:
-            processed_lines.extend(
-                self.__process_g0(
-                    line,
-                    feed,
-                    position
-                )
-            )
+    def split_rules(self) -> SplitRules:
+        # the cut would pause at the call of the next subprogram
+        if self.__laser_off_signal is None:
+            return SplitRules((f'SIGNAL {self.__laser_on_signal}\n',), (f'SIGNAL -{self.__laser_on_signal}\n',))
 
-        # process G1 commmand
-        elif line.command[0] == 'G' and line.command[1] == 1:
-            processed_lines.extend(
-                self.__process_g1(
-                    line,
-                    feed,
-                    position
-                )
-            )
+        return SplitRules((f'PULSE {self.__laser_on_signal}\n',), (f'PULSE -{self.__laser_off_signal}\n',))
 
-        # process G2 command
-        elif line.command[0] == 'G' and line.command[1] == 2:
-            echo(f'{Back.YELLOW}G2 command is not implemented{Style.RESET_ALL}')
+    def report(self, stats: ConversionStats, as_length: int) -> None:
+        echo(f'Conversion {Back.GREEN}done{Style.RESET_ALL}.')
+        echo(f'{Back.CYAN}Stats:{Style.RESET_ALL}')
+        echo(f'\tGCODE file had {stats.file_length} lines')
+        echo(f'\tOmitted {stats.skipped_moves} lines')
+        echo(f'\tAS file length is {as_length} lines')
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'converter': self.__converter.snapshot(),
+            'is_laser_on': self.__is_laser_on,
+        }
 
-        return processed_lines
+    def restore(self, state: Dict[str, Any]) -> None:
+        self.__converter.restore(state['converter'])
+        self.__is_laser_on = state['is_laser_on']
 
-    def __process_g0(
-            self,
-            line: GcodeLine,
-            feed: float | None,
-            position: Tuple[float | None, float | None, float | None]
-    ):
+    def __process_g0(self, line: GcodeRecord, position: Position):
         lines = []
-        x_pos, y_pos, z_pos = position
 
         # feed
-        if line.params.get('F') is not None:
+        feed = line.f
+
+        if feed is not None:
             # append the command
             lines.append(f'SPEED {feed} MM/MIN ALWAYS')
 
-        # xyz positions
-        self.__x_pos = x_pos if x_pos is not None else self.__x_pos
-        self.__y_pos = y_pos if y_pos is not None else self.__y_pos
-        self.__z_pos = z_pos if z_pos is not None else self.__z_pos
-
-        move_command = f'LMOVE SHIFT(a BY {self.__x_pos}, {self.__y_pos}, {self.__z_pos})'
-
-        if line.comment:
-            move_command += f' ;{line.command}'
-
-        move_command += '\n'
-
-        lines.append(move_command)
+        lines.append(self.__converter.linear_move(line, position))
 
         if self.__is_laser_on:
             if self.__laser_off_signal is None:
@@ -165,19 +125,23 @@ class LaserCut(CLICommand):
                 # two signal laser control
                 lines.append(f'PULSE -{self.__laser_off_signal}')
 
+            self.__is_laser_on = False
+
         return lines
 
-    def __process_g1(
-            self,
-            line: GcodeLine,
-            feed: float | None,
-            position: Tuple[float | None, float | None, float | None]
-    ):
-        lines = []
+    def __process_g1(self, line: GcodeRecord, position: Position):
+        return self.__converter.path_move(line, position, self.__process_cut(line))
+
+    def __process_arc(self, line: GcodeRecord, position: Position):
+        return self.__converter.circular_move(line, position, self.__process_cut(line))
 
-        x_pos, y_pos, z_pos = position
+    def __process_cut(self, line: GcodeRecord) -> List[str]:
+        """Returns the speed change and switches the laser on for a cutting move (G1-G3)"""
+        lines = []
 
         # feed
+        feed = line.f
+
         if feed is not None:
             # append the command
             lines.append(f'SPEED {feed} MM/MIN ALWAYS\n')
@@ -194,38 +158,4 @@ class LaserCut(CLICommand):
 
             self.__is_laser_on = True
 
-        # xyz positions
-        # simplification of path is only possible if the line has the same z coordinate
-        if z_pos is None or z_pos == self.__z_pos:
-            delta_x = self.__x_pos - x_pos if x_pos is not None else 0
-            delta_y = self.__y_pos - y_pos if y_pos is not None else 0
-
-            xy_delta = math.sqrt(delta_x ** 2 + delta_y ** 2)
-
-            # check if the delta is smaller than the specified minimum distance
-            if xy_delta <= self.__execute_options.min_distance:
-                # check if the already skipped distance is smaller than the minimum distance
-                if self.__skipped_distance < self.__execute_options.min_distance:
-                    self.__skipped_distance += xy_delta
-                    self.__skipped_moves += 1
-                    return lines
-
-                # if not, append the move and reset the counter
-                else:
-                    self.__skipped_distance = 0
-
-        # append the xyz move
-        self.__x_pos = x_pos if x_pos is not None else self.__x_pos
-        self.__y_pos = y_pos if y_pos is not None else self.__y_pos
-        self.__z_pos = z_pos if z_pos is not None else self.__z_pos
-
-        move_command = f'LMOVE SHIFT(a BY {self.__x_pos}, {self.__y_pos}, {self.__z_pos})'
-
-        if line.comment:
-            move_command += f' ;{line.command}'
-
-        move_command += '\n'
-
-        lines.append(move_command)
-
         return lines
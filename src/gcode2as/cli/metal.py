@@ -1,180 +1,209 @@
 
-import math
-from typing import List, Optional, Tuple
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from click import echo
 from colorama import Back, Fore, Style
-import inquirer
-from gcodeparser.gcode_parser import GcodeLine
 
+from gcode2as.arcs import ArcPart
 from gcode2as.cli import CLICommand, CLICommandOptions
-from gcode2as.cli.utils.validation import validate_is_float
-from gcode2as.converter import Converter
+from gcode2as.cli.utils.validation import to_bool, validate_is_float
+from gcode2as.converter import G0, G1, G2, G3, ConversionStats, Converter
+from gcode2as.formatter import SplitRules
+from gcode2as.records import GcodeRecord
+from gcode2as.toolpath import Position
+
+# the weld moves a weld can be ended at, the intermediate points of the arcs (C1WC) can not end it
+CONTINUED_WELD_PATTERN = re.compile(r'(LWC|C2WC) (SHIFT\(a BY [^)]*\)), 1')
+
+
+def cut_weld(line: str) -> Tuple[str, str] | None:
+    """Ends the weld at the weld move of the line and restarts it at the same point, see SplitRules"""
+    match = CONTINUED_WELD_PATTERN.match(line)
+
+    if match is None:
+        return None
+
+    ending = 'LWE' if match.group(1) == 'LWC' else 'C2WE'
+
+    return f'{ending} {match.group(2)}, 1, 1{line[match.end():]}', f'LWS {match.group(2)}\n'
 
 
 class Metal(CLICommand):
 
-    def __init__(self) -> None:
-        self.__x_pos = 0
-        self.__y_pos = 0
-        self.__z_pos = 0
+    DEFAULT_WELDING_SPEED = 15
 
-        self.__welding_speed: float | None = None
+    # keys for the inquirer
+    SPEED_KEY = 'speed'
+    VASE_MODE_KEY = 'vase_mode'
+    INVERTED_KEY = 'inverted'
 
-        self.__skipped_distance = 0
-        self.__skipped_moves = 0
-        self.__lines_comment = 0
+    def __init__(self) -> None:
+        self.__welding_speed: float | None = None
 
-        self.__last_g0: Optional[GcodeLine] = None
-        self.__weld: List[GcodeLine] = []
+        self.__last_g0: Optional[Tuple[GcodeRecord, Position]] = None
+        self.__weld: List[Tuple[GcodeRecord, Position]] = []
 
         self.__is_using_vase_mode = False
         self.__is_inverted = False
 
         self.__execute_options: CLICommandOptions = None
+        self.__converter: Converter = None
 
     @property
     def message(self) -> str:
         return "Metal 3D Printing"
 
-    def execute(self, options: CLICommandOptions):
-        self.__execute_options = options
-        echo(f'[{Fore.YELLOW}Warning{Fore.RESET}]: The generated code will only work with robots that have a welding card installed.')
+    def questions(self):
+        import inquirer
 
-        speed_key = 'speed'
-        vase_mode_key = 'vase mode'
-        inverted_key = 'inverted'
-
-        questions = [
+        return [
             inquirer.Confirm(
-                vase_mode_key,
+                Metal.VASE_MODE_KEY,
                 message="Is the model sliced in vase mode (spiralise outer contours)?",
             ),
             inquirer.Text(
-                speed_key,
+                Metal.SPEED_KEY,
                 message='Set the welding speed',
                 validate=validate_is_float,
-                default=15
+                default=Metal.DEFAULT_WELDING_SPEED
             ),
             inquirer.Confirm(
-                inverted_key,
+                Metal.INVERTED_KEY,
                 message="Is the model inverted (upside down)?",
                 default=False,
             )
         ]
 
-        answers = inquirer.prompt(questions)
+    def configure(self, answers: Dict[str, Any]) -> None:
+        speed = answers.get(Metal.SPEED_KEY, Metal.DEFAULT_WELDING_SPEED)
 
-        if answers is None:
-            return
+        self.__is_using_vase_mode = to_bool(answers.get(Metal.VASE_MODE_KEY, False))
 
-        speed = answers[speed_key]
+        self.__is_inverted = to_bool(answers.get(Metal.INVERTED_KEY, False))
 
-        self.__is_using_vase_mode = answers[vase_mode_key]
+        self.__welding_speed = float(speed)
 
-        self.__is_inverted = answers[inverted_key]
+        echo(f'[{Fore.YELLOW}Warning{Fore.RESET}]: The generated code will only work with robots that have a welding card installed.')
 
-        self.__welding_speed = float(speed)
+    def prepare(self, options: CLICommandOptions) -> Converter:
+        self.__execute_options = options
 
-        converter = Converter(options.file)
+        converter = Converter(options)
+        converter.register(G0, self.__process_travel)
+        converter.register(G1, self.__process_g1)
+        converter.register(G2, self.__process_arc)
+        converter.register(G3, self.__process_arc)
 
-        lines = []
+        self.__converter = converter
+
+        return converter
 
+    def header(self) -> List[str]:
         # set the welding conditions
-        lines.append(
-            converter.format_to_as_line_comment(
+        return [
+            Converter.format_to_as_line_comment(
                 "WELDING CONDITIONS",
                 pad=True
-            )
-        )
-        lines.append(f'W1SET 1 = {self.__welding_speed}, 1, 1, 0, 0\n')
-        lines.append(f'W2SET 1 = 0.1, 1, 1\n')
-        lines.append(
-            converter.format_to_as_line_comment('', pad=True)
-        )
-
-        try:
-            lines.extend(
-                converter.convert(self.__process_line)
-            )
-
-        except ValueError as error:
-            echo(error)
-
-            if options.verbose:
-                if self.__weld:
-                    echo(f'Weld move list: ')
-                    [echo(f'\t{weld}') for weld in self.__weld]
-
-                if self.__last_g0:
-                    echo(f'Stored G0: {self.__last_g0}')
-
-            echo(
-                f'{Back.YELLOW}The file will only be generated partially.{Style.RESET_ALL}')
-            return lines
+            ),
+            f'W1SET 1 = {self.__welding_speed}, 1, 1, 0, 0\n',
+            f'W2SET 1 = 0.1, 1, 1\n',
+            Converter.format_to_as_line_comment('', pad=True)
+        ]
 
+    def finish(self) -> List[str]:
         # flush the last weld instruction
         if self.__weld:
-            lines.extend(self.__process_weld())
+            return self.__process_weld()
+
+        return []
 
+    def split_rules(self) -> SplitRules:
+        # a weld can not be continued in another program, a very long one is ended and started again
+        return SplitRules(('LWS ',), ('LWE ', 'C2WE '), strict=True, cut=cut_weld)
+
+    def report(self, stats: ConversionStats, as_length: int) -> None:
         echo(f'[{Fore.BLUE}Info{Fore.RESET}]: Model converted. Stats:')
         echo(
-            f'\t{Fore.LIGHTBLACK_EX}GCode lines: {converter.file_length} -> AS lines: {len(lines)}'
+            f'\t{Fore.LIGHTBLACK_EX}GCode lines: {stats.file_length} -> AS lines: {as_length}'
         )
-        echo(f'\tOmitted lines: {self.__skipped_moves}')
+        echo(f'\tOmitted lines: {stats.skipped_moves}')
         echo(
-            f'\tThe code contains {self.__lines_comment} comments, which is {self.__lines_comment / len(lines) * 100}% of the file{Style.RESET_ALL}'
+            f'\tThe code contains {stats.comment_count} comments, which is {stats.comment_count / as_length * 100}% of the file{Style.RESET_ALL}'
         )
 
-        return lines
-
-    def __process_line(self, line: GcodeLine) -> Optional[List[str]]:
-        """Gets called on each GcodeLine object to convert it to a list of strings"""
-        processed_lines: List[str] = []
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'converter': self.__converter.snapshot(),
+            'last_g0': self.__last_g0,
+            'weld': list(self.__weld),
+        }
 
-        # process comment-only lines
-        if line.command[0] == ';':
-            processed_lines.append(f'; {line.comment}')
-            self.__lines_comment += 1
+    def restore(self, state: Dict[str, Any]) -> None:
+        self.__converter.restore(state['converter'])
+        self.__last_g0 = state['last_g0']
+        self.__weld = list(state['weld'])
 
-        # G0 move
-        elif line.command[0] == 'G' and line.command[1] == 0:
+    def stop(self, options: CLICommandOptions, error: str) -> None:
+        super().stop(options, error)
 
-            # if the weld line has to be ended
+        if options.verbose:
             if self.__weld:
-                processed_lines.extend(self.__process_weld())
+                echo(f'Weld move list: ')
+                [echo(f'\t{weld}') for weld in self.__weld]
 
-            # if this comes after a G0 then process the last one
-            elif self.__last_g0 is not None:
-                processed_lines.extend(
-                    self.__process_g0(self.__last_g0)
-                )
+            if self.__last_g0:
+                echo(f'Stored G0: {self.__last_g0}')
 
-            self.__last_g0 = line
+    def convert(self, options: CLICommandOptions) -> Iterator[str]:
+        self.error = None
+        converter = self.prepare(options)
+        as_length = 0
 
-        # G1 move
-        elif line.command[0] == 'G' and line.command[1] == 1:
-            self.__process_g1(line)
+        for line in self.header():
+            as_length += 1
+            yield line
 
-        return processed_lines
+        try:
+            for line in converter.stream():
+                as_length += 1
+                yield line
 
-    def __process_g0(self, line: GcodeLine, weld_start: bool = False):
-        """Processes a single line of G0 code instruction"""
-        lines = []
+        except ValueError as error:
+            self.stop(options, str(error))
+            return
+
+        for line in self.finish():
+            as_length += 1
+            yield line
 
-        feed, position = Metal.get_line_params(line)
+        self.complete(options, converter.stats, as_length)
 
-        x_pos, y_pos, z_pos = position
+    def __process_travel(self, line: GcodeRecord, position: Position) -> List[str]:
+        """Stores the G0 move, it is only known after the next move whether it starts a weld"""
+        processed_lines: List[str] = []
+
+        # if the weld line has to be ended
+        if self.__weld:
+            processed_lines.extend(self.__process_weld())
+
+        # if this comes after a G0 then process the last one
+        elif self.__last_g0 is not None:
+            processed_lines.extend(
+                self.__process_g0(*self.__last_g0)
+            )
+
+        self.__last_g0 = (line, position)
 
-        if self.__is_inverted and z_pos is not None:
-            z_pos = -z_pos
+        return processed_lines
+
+    def __process_g0(self, line: GcodeRecord, position: Position, weld_start: bool = False):
+        """Processes a single line of G0 code instruction"""
+        lines = []
 
-        # xyz positions
-        self.__x_pos = x_pos if x_pos is not None else self.__x_pos
-        self.__y_pos = y_pos if y_pos is not None else self.__y_pos
-        self.__z_pos = z_pos if z_pos is not None else self.__z_pos
+        feed = line.f
 
         if weld_start:
-            move_command = f'LWS SHIFT(a BY {self.__x_pos}, {self.__y_pos}, {self.__z_pos})'
+            move_command = self.__converter.format_move('LWS', self.__orient(position))
 
         else:
             # feed
@@ -182,13 +211,13 @@ class Metal(CLICommand):
                 # append the command
                 lines.append(f'SPEED {feed} MM/MIN ALWAYS')
 
-            move_command = f'LMOVE SHIFT(a BY {self.__x_pos}, {self.__y_pos}, {self.__z_pos})'
+            move_command = self.__converter.format_move('LMOVE', self.__orient(position))
 
         if line.comment:
             move_command += f' ;{line.command}'
 
         if self.__execute_options.verbose:
-            move_command += f' ;{line.gcode_str}'
+            move_command += f' ;{line.text}'
 
         move_command += '\n'
 
@@ -196,23 +225,20 @@ class Metal(CLICommand):
 
         return lines
 
-    def __process_g1(self, line: GcodeLine):
+    def __process_g1(self, line: GcodeRecord, position: Position):
         """Processes a single line of G1 G-code command"""
 
-        _, position = Metal.get_line_params(line)
-
-        x_pos, y_pos, z_pos = position
-
-        if x_pos is None and y_pos is None and z_pos is None:
+        if not line.has_coordinates:
             # irrelevant command
             return ""
 
-        self.__weld.append(line)
+        self.__weld.append((line, position))
 
-        # xyz positions
-        self.__x_pos = x_pos if x_pos is not None else self.__x_pos
-        self.__y_pos = y_pos if y_pos is not None else self.__y_pos
-        self.__z_pos = z_pos if z_pos is not None else self.__z_pos
+        return ""
+
+    def __process_arc(self, line: GcodeRecord, position: Position):
+        """Processes a G2/G3 arc, it is welded with circular moves"""
+        self.__weld.append((line, position))
 
         return ""
 
@@ -226,96 +252,125 @@ class Metal(CLICommand):
 
         # process the weld start point
         lines.extend(
-            self.__process_g0(self.__last_g0, weld_start=True)
+            self.__process_g0(*self.__last_g0, weld_start=True)
         )
+        start = self.__last_g0[1]
         self.__last_g0 = None
 
-        for weld in self.__weld:
-            _, position = Metal.get_line_params(weld)
+        last_index = len(self.__weld) - 1
+        index = 0
 
-            x_pos, y_pos, z_pos = position
+        while index <= last_index:
+            weld, position = self.__weld[index]
 
-            # check if the model is inverted
-            if self.__is_inverted and z_pos is not None:
-                z_pos = -z_pos
+            if weld.arc is not None:
+                lines.extend(self.__process_weld_arc(weld, start, position, index == last_index))
+                index += 1
 
-            skip_move = self.__check_if_move_skip(x_pos, y_pos, z_pos)
+            else:
+                # the linear moves up to the next arc are simplified together, the arcs have to start
+                # exactly where the G-code starts them
+                end = index
 
-            self.__x_pos = x_pos if x_pos is not None else self.__x_pos
-            self.__y_pos = y_pos if y_pos is not None else self.__y_pos
-            self.__z_pos = z_pos if z_pos is not None else self.__z_pos
+                while end < last_index and self.__weld[end + 1][0].arc is None:
+                    end += 1
 
-            move_command = ''
+                lines.extend(self.__process_weld_moves(self.__weld[index:end + 1], end == last_index))
+                index = end + 1
 
-            if weld == self.__weld[-1]:
-                # process the last weld
+            start = self.__weld[index - 1][1]
 
-                move_command = f'LWE SHIFT(a BY {self.__x_pos}, {self.__y_pos}, {self.__z_pos}), 1, 1'
+        self.__weld = []
 
-                if self.__execute_options.verbose:
-                    move_command += f' ;{weld.gcode_str}'
+        return lines
 
-            elif skip_move:
+    def __process_weld_moves(self, moves: List[Tuple[GcodeRecord, Position]], ends_weld: bool) -> List[str]:
+        """Processes a run of linear weld moves, the last move ends the weld if ends_weld is True"""
+        lines = []
+
+        positions = [self.__orient(position) for _, position in moves]
+        kept = self.__converter.fit_moves(
+            positions,
+            keep_z_changes=not self.__is_using_vase_mode,
+            weld_order=True
+        )
+
+        last_index = len(moves) - 1
+
+        for index, parts in kept:
+            weld = moves[index][0]
+
+            # the runs of moves fitted with an arc are welded with circular moves
+            if parts is not None:
+                lines.extend(self.__weld_arc(weld, parts, index == last_index and ends_weld))
                 continue
 
-            else:
+            if index == last_index and ends_weld:
+                # process the last weld
+                move_command = self.__converter.format_move('LWE', positions[index]) + ', 1, 1'
 
-                move_command = f'LWC SHIFT(a BY {self.__x_pos}, {self.__y_pos}, {self.__z_pos}), 1'
+                if self.__execute_options.verbose:
+                    move_command += f' ;{weld.text}'
+
+            else:
+                move_command = self.__converter.format_move('LWC', positions[index]) + ', 1'
 
                 if weld.comment:
                     move_command += f' ;{weld.command}'
 
                 if self.__execute_options.verbose:
-                    move_command += f' ;{weld.gcode_str} dist: {self.__skipped_distance}'
-
-            if move_command:
-                move_command += '\n'
+                    move_command += f' ;{weld.text} dist: {self.__converter.skipped_distance}'
 
-            lines.append(move_command)
-
-        self.__weld = []
+            lines.append(move_command + '\n')
 
         return lines
 
-    def __check_if_move_skip(self, x_pos: Optional[float], y_pos: Optional[float], z_pos: Optional[float]) -> bool:
-        # the move can only be skipped if the z coordinate matches or we are using vase mode
-        abs_delta = 0
+    def __process_weld_arc(
+            self,
+            weld: GcodeRecord,
+            start: Position,
+            position: Position,
+            ends_weld: bool
+    ) -> List[str]:
+        """Processes an arc of the weld with C1WC/C2WC pairs, the last one is C2WE if ends_weld is True"""
+        parts = self.__converter.arc_parts(weld, start, position)
+
+        if not parts:
+            return self.__process_weld_moves([(weld, position)], ends_weld)
+
+        return self.__weld_arc(
+            weld, [(self.__orient(via), self.__orient(end)) for via, end in parts], ends_weld
+        )
 
-        if not self.__is_using_vase_mode:
-            if z_pos is None or z_pos == self.__z_pos:
-                delta_x = self.__x_pos - x_pos if x_pos is not None else 0
-                delta_y = self.__y_pos - y_pos if y_pos is not None else 0
+    def __weld_arc(self, weld: GcodeRecord, parts: List[ArcPart], ends_weld: bool) -> List[str]:
+        """Formats the C1WC/C2WC pairs of the oriented parts of an arc"""
+        lines = []
+        last_index = len(parts) - 1
 
-                abs_delta = math.sqrt(delta_x ** 2 + delta_y ** 2)
+        for index, (via, end) in enumerate(parts):
+            lines.append(self.__converter.format_move('C1WC', via) + ', 1\n')
 
-        else:
-            delta_x = self.__x_pos - x_pos if x_pos is not None else 0
-            delta_y = self.__y_pos - y_pos if y_pos is not None else 0
-            delta_z = self.__z_pos - z_pos if z_pos is not None else 0
+            if index == last_index and ends_weld:
+                move_command = self.__converter.format_move('C2WE', end) + ', 1, 1'
 
-            abs_delta = math.sqrt(delta_x ** 2 + delta_y ** 2 + delta_z ** 2)
+            else:
+                move_command = self.__converter.format_move('C2WC', end) + ', 1'
 
-        # check if the delta is smaller than the specified minimum distance
-        if abs_delta <= self.__execute_options.min_distance:
-            self.__skipped_distance += abs_delta
-            # check if the already skipped distance is smaller than the minimum distance
-            if self.__skipped_distance < self.__execute_options.min_distance:
-                self.__skipped_moves += 1
-                return True
+            if index == last_index:
+                if weld.comment and not ends_weld:
+                    move_command += f' ;{weld.command}'
 
-            # if not, append the move and reset the counter
-            else:
-                self.__skipped_distance = 0
+                if self.__execute_options.verbose:
+                    move_command += f' ;{weld.text}'
 
-        return False
+            lines.append(move_command + '\n')
 
-    @staticmethod
-    def get_line_params(line: GcodeLine) -> Tuple[float | None, Tuple[float | None, float | None, float | None]]:
-        feed = line.params.get('F')
-        position = (
-            line.params.get('X'),
-            line.params.get('Y'),
-            line.params.get('Z'),
-        )
+        return lines
+
+    def __orient(self, position: Position) -> Position:
+        """Mirrors the z coordinate of the position if the model is inverted"""
+        if self.__is_inverted:
+            x_pos, y_pos, z_pos = position
+            return x_pos, y_pos, -z_pos
 
-        return feed, position
+        return position
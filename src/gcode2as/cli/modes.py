@@ -0,0 +1,39 @@
+"""Registry of the conversion modes
+
+The modes are imported on first use, so listing their names (e.g. for the command line choices)
+does not load them and their dependencies.
+"""
+
+from importlib import import_module
+from typing import Dict, Iterator, Mapping, Tuple, Type
+
+from gcode2as.cli import CLICommand
+
+
+class LazyModes(Mapping[str, Type[CLICommand]]):
+    """Mapping of the mode names to their classes, importing the module of a mode when it is looked up"""
+
+    def __init__(self, modes: Dict[str, Tuple[str, str]]) -> None:
+        self.__modes = modes
+        self.__loaded: Dict[str, Type[CLICommand]] = {}
+
+    def __getitem__(self, name: str) -> Type[CLICommand]:
+        if name not in self.__loaded:
+            module, class_name = self.__modes[name]
+            self.__loaded[name] = getattr(import_module(module), class_name)
+
+        return self.__loaded[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__modes)
+
+    def __len__(self) -> int:
+        return len(self.__modes)
+
+
+# the modes by the name used in the profiles and on the command line
+MODES: Mapping[str, Type[CLICommand]] = LazyModes({
+    'fdm': ('gcode2as.cli.fdm', 'FDM'),
+    'metal': ('gcode2as.cli.metal', 'Metal'),
+    'laser': ('gcode2as.cli.laser_cut', 'LaserCut'),
+})
@@ -1,5 +1,3 @@
-import inquirer
-
 from gcode2as.cli.utils.validation import validate_is_float
 
 OVERRIDE_SPEED_KEY = 'override_speed'
@@ -8,6 +6,8 @@ OVERRIDE_SPEED_VALUE_KEY = 'override_speed_value'
 
 def ask_override_speed():
     """Returns a sequence of questions to ask the user if they want to override the printing speed"""
+    import inquirer
+
     return [
         inquirer.Confirm(
             OVERRIDE_SPEED_KEY,
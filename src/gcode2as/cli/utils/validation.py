@@ -1,7 +1,7 @@
-from inquirer.errors import ValidationError
-
-
 def validate_is_float(_, current: str):
+    # the validators only run in the prompts, so inquirer is imported when it is already loaded
+    from inquirer.errors import ValidationError
+
     try:
         float(current)
 
@@ -12,6 +12,8 @@ def validate_is_float(_, current: str):
 
 
 def validate_is_int(_, current: str):
+    from inquirer.errors import ValidationError
+
     try:
         int(current)
 
@@ -19,3 +21,11 @@ def validate_is_int(_, current: str):
         raise ValidationError('', reason='Input must be integer')
 
     return True
+
+
+def to_bool(value: bool | str) -> bool:
+    """Converts an answer given as a string (e.g. from the command line) to a bool"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'y', 'yes', 'true', 'on')
+
+    return bool(value)
@@ -0,0 +1,321 @@
+"""Module for loading the programs on the controller through its AS terminal while they are generated
+
+Instead of writing a .pg file, copying it and loading it on the controller, the program can be typed
+into the AS terminal of the controller over TCP, so the upload overlaps the conversion and the first
+subprograms are on the controller long before the conversion finishes. The controller receives the
+output of write_program: every .PROGRAM block is entered with the editor of the terminal.
+
+The dialog of the terminal:
+
+    login: as                       the terminal may ask for the user first
+    >EDIT name,1                    the editor is opened at the first step of the program
+       1 ?LMOVE TRANS(...)          every step is answered with the prompt of the next one
+       2 ?E                         E closes the editor
+    >DELETE/P name                  a program is deleted before it is entered again
+    Are you sure ? (Yes:1, No:0)1
+
+The steps are sent ahead of the prompts within a window, so the round trips of the network do not
+add up over the thousands of steps, while the controller never has more than a window of steps
+waiting to be read. An error message of the controller, e.g. (P1013) for a step it can not parse,
+stops the upload. A dropped connection is reconnected a few times: the program being entered is
+deleted and entered again from its first step. Only the steps of a single program are kept for this,
+which the program splitting bounds to the step and byte budget.
+"""
+
+import re
+import shutil
+import socket
+from dataclasses import dataclass
+from pathlib import Path
+from time import sleep
+from typing import Callable, List, Pattern, TextIO, TypeVar
+
+DEFAULT_PORT = 23
+DEFAULT_USER = 'as'
+
+# the seconds a response of the controller is waited for
+TIMEOUT = 10.0
+
+# a dropped connection is reconnected this many times, after a delay doubled on every attempt
+RETRIES = 3
+RETRY_DELAY = 0.5
+
+# the number of steps sent before their prompts are read
+WINDOW = 16
+
+LOGIN_PROMPT = re.compile(r'login: ?')
+COMMAND_PROMPT = re.compile(r'(?:^|\n)>')
+STEP_PROMPT = re.compile(r'(?:^|\n) *\d+ \?')
+CONFIRM_PROMPT = re.compile(r'\(Yes:1, No:0\)')
+ANY_PROMPT = re.compile('|'.join(
+    prompt.pattern for prompt in (LOGIN_PROMPT, COMMAND_PROMPT, STEP_PROMPT, CONFIRM_PROMPT)
+))
+
+# the error messages of the controller, e.g. (P1013) Illegal value.
+ERROR_MESSAGE = re.compile(r'\([EP]\d{4}\)[^\r\n]*')
+
+PROGRAM_START = '.PROGRAM'
+PROGRAM_END = '.END'
+
+T = TypeVar('T')
+
+
+@dataclass(frozen=True)
+class ControllerSettings:
+    """The address of the AS terminal of a controller and the settings of the upload
+
+    Args:
+        host (str): the address of the controller
+        port (int): the TCP port of the AS terminal
+        user (str): the user logged in if the terminal asks for it
+        timeout (float): the seconds a response is waited for
+        retries (int): the number of times a dropped connection is reconnected
+        retry_delay (float): the seconds before the first reconnection, doubled on every attempt
+        window (int): the number of steps sent before their prompts are read
+    """
+    host: str
+    port: int = DEFAULT_PORT
+    user: str = DEFAULT_USER
+    timeout: float = TIMEOUT
+    retries: int = RETRIES
+    retry_delay: float = RETRY_DELAY
+    window: int = WINDOW
+
+    @classmethod
+    def parse(cls, address: str, **settings) -> 'ControllerSettings':
+        """Creates the settings of a HOST or HOST:PORT address"""
+        host, _, port = address.rpartition(':') if ':' in address else (address, '', '')
+
+        return cls(host, int(port) if port else DEFAULT_PORT, **settings)
+
+
+class Terminal:
+    """A connection to the AS terminal, reading its output up to the prompts
+
+    Args:
+        host (str): the address of the controller
+        port (int): the TCP port of the AS terminal
+        timeout (float): the seconds a response is waited for
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = TIMEOUT) -> None:
+        self.__socket = socket.create_connection((host, port), timeout=timeout)
+        # the lines are short, they are sent at once instead of waiting to be joined
+        self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__buffer = ''
+
+    def send(self, line: str) -> None:
+        """Sends a line to the terminal"""
+        self.__socket.sendall(f'{line}\r\n'.encode('utf8'))
+
+    def read(self, prompt: Pattern, count: int = 1) -> str:
+        """Reads the output until the prompt appeared count times
+
+        Returns:
+            str: the output up to the end of the last prompt, the rest is kept for the next read
+        """
+        end = 0
+        found = 0
+
+        while True:
+            for match in prompt.finditer(self.__buffer, end):
+                end = match.end()
+                found += 1
+
+                if found == count:
+                    output, self.__buffer = self.__buffer[:end], self.__buffer[end:]
+                    return output
+
+            data = self.__socket.recv(4096)
+
+            if not data:
+                raise ConnectionError('The controller closed the connection')
+
+            self.__buffer += data.decode('utf8', errors='replace').replace('\r\n', '\n')
+
+    def close(self) -> None:
+        self.__socket.close()
+
+
+class ControllerWriter:
+    """Enters the written programs on the controller, the file write_program writes to
+
+    The programs are entered line by line while they are written, the last line is entered when the
+    writer is closed. The programs can also be written to a copy, e.g. the local .pg file.
+
+    Args:
+        settings (ControllerSettings): the address of the controller and the settings of the upload
+        copy (TextIO | None): if given, the written text is also written to it
+    """
+
+    def __init__(self, settings: ControllerSettings, copy: TextIO | None = None) -> None:
+        self.programs: List[str] = []
+        self.__settings = settings
+        self.__copy = copy
+        self.__terminal: Terminal | None = None
+        self.__partial = ''
+        self.__program: str | None = None
+        self.__steps: List[str] = []
+        self.__unanswered = 0
+
+    def __enter__(self) -> 'ControllerWriter':
+        self.__with_retries(lambda: None)
+        return self
+
+    def __exit__(self, exc_type, *_) -> None:
+        try:
+            if exc_type is None:
+                self.close()
+
+        finally:
+            self.__disconnect()
+
+    def write(self, text: str) -> int:
+        if self.__copy is not None:
+            self.__copy.write(text)
+
+        *lines, self.__partial = (self.__partial + text).split('\n')
+
+        for line in lines:
+            self.__enter_line(line)
+
+        return len(text)
+
+    def writelines(self, lines) -> None:
+        for line in lines:
+            self.write(line)
+
+    def flush(self) -> None:
+        if self.__copy is not None:
+            self.__copy.flush()
+
+    def close(self) -> None:
+        """Enters the last line and closes the connection"""
+        if self.__partial:
+            self.__enter_line(self.__partial)
+            self.__partial = ''
+
+        if self.__program is not None:
+            raise ValueError(f'The program {self.__program} has no {PROGRAM_END}')
+
+        self.__disconnect()
+
+    def __enter_line(self, line: str) -> None:
+        line = line.strip()
+
+        if not line:
+            return
+
+        if line.startswith(PROGRAM_START):
+            name = line[len(PROGRAM_START):].strip().partition('(')[0]
+            self.__with_retries(lambda: self.__open_program(name))
+            self.__program = name
+            self.__steps = []
+
+        elif line == PROGRAM_END:
+            self.__with_retries(self.__close_program)
+            self.programs.append(self.__program)
+            self.__program = None
+
+        else:
+            self.__with_retries(lambda: self.__enter_step(line))
+            self.__steps.append(line)
+
+    def __open_program(self, name: str) -> None:
+        assert self.__terminal is not None
+        self.__terminal.send(f'EDIT {name},1')
+        self.__check(self.__terminal.read(STEP_PROMPT))
+
+    def __enter_step(self, step: str) -> None:
+        assert self.__terminal is not None
+
+        # the prompts of the steps sent ahead are read once the window is full
+        if self.__unanswered >= self.__settings.window:
+            self.__read_steps(self.__unanswered)
+
+        self.__terminal.send(step)
+        self.__unanswered += 1
+
+    def __close_program(self) -> None:
+        assert self.__terminal is not None
+        self.__read_steps(self.__unanswered)
+        self.__terminal.send('E')
+        self.__check(self.__terminal.read(COMMAND_PROMPT))
+
+    def __read_steps(self, count: int) -> None:
+        assert self.__terminal is not None
+
+        if count > 0:
+            output = self.__terminal.read(STEP_PROMPT, count)
+            self.__unanswered -= count
+            self.__check(output)
+
+    def __with_retries(self, action: Callable[[], T]) -> T:
+        """Runs the action, reconnecting and entering the current program again if the connection drops"""
+        attempt = 0
+
+        while True:
+            try:
+                if self.__terminal is None:
+                    self.__connect()
+
+                return action()
+
+            except OSError as error:
+                self.__disconnect()
+
+                if attempt >= self.__settings.retries:
+                    raise ConnectionError(
+                        f'The connection to {self.__settings.host}:{self.__settings.port} failed '
+                        f'after {attempt} retries: {error}'
+                    ) from error
+
+                sleep(self.__settings.retry_delay * 2 ** attempt)
+                attempt += 1
+
+    def __connect(self) -> None:
+        terminal = Terminal(self.__settings.host, self.__settings.port, self.__settings.timeout)
+        self.__terminal = terminal
+        self.__unanswered = 0
+
+        if LOGIN_PROMPT.search(terminal.read(ANY_PROMPT)):
+            terminal.send(self.__settings.user)
+            self.__check(terminal.read(COMMAND_PROMPT))
+
+        # the program dropped half way is entered again from its first step
+        if self.__program is not None:
+            terminal.send(f'DELETE/P {self.__program}')
+
+            if CONFIRM_PROMPT.search(terminal.read(ANY_PROMPT)):
+                terminal.send('1')
+                terminal.read(COMMAND_PROMPT)
+
+            self.__open_program(self.__program)
+
+            for step in self.__steps:
+                self.__enter_step(step)
+
+    def __disconnect(self) -> None:
+        if self.__terminal is not None:
+            self.__terminal.close()
+            self.__terminal = None
+
+    @staticmethod
+    def __check(output: str) -> None:
+        """Raises the error message of the controller in the output, if any"""
+        error = ERROR_MESSAGE.search(output)
+
+        if error is not None:
+            raise RuntimeError(f'The controller reported an error: {error.group()}')
+
+
+def upload_file(path: Path, settings: ControllerSettings) -> List[str]:
+    """Loads the programs of a .pg file on the controller
+
+    Returns:
+        List[str]: the names of the loaded programs
+    """
+    with open(path, 'r', encoding='utf8') as f_open, ControllerWriter(settings) as writer:
+        shutil.copyfileobj(f_open, writer)
+
+    return writer.programs
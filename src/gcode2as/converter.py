@@ -1,55 +1,654 @@
 """Module for converting Line objects to AS code"""
 
-from io import TextIOWrapper
-from typing import Callable, List
+from dataclasses import dataclass
 from math import sqrt
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Set, Tuple
 from click import echo
-from colorama import Back
-from gcodeparser import GcodeLine, GcodeParser
-from progress.bar import IncrementalBar
+from colorama import Back, Style
+
+from gcode2as.arcs import ArcPart, arc_parts
+from gcode2as.cli import CLICommandOptions
+from gcode2as.encoder import PositionEncoder
+from gcode2as.fitting import fit_arcs
+from gcode2as.mapped import MappedFile
+from gcode2as.profiling import byte_position
+from gcode2as.records import Command, GcodeRecord
+from gcode2as.simplify import SIMPLIFY_TOLERANCE, PathBuffer, PathSimplifier, simplify_path
+from gcode2as.tokenizer import Tokenizer
+from gcode2as.toolpath import ORIGIN, Position, is_coordinate, resolve_targets
+
+LineHandler = Callable[[GcodeRecord, Position | None], str | List[str] | None]
+
+# a kept move of a path: the index of its target and the parts of the arc replacing the moves up to
+# it, None for a linear move
+PathMove = Tuple[int, List[ArcPart] | None]
+
+COMMENT: Command = (';', None)
+G0: Command = ('G', 0)
+G1: Command = ('G', 1)
+G2: Command = ('G', 2)
+G3: Command = ('G', 3)
+
+
+def command_name(command: Command) -> str:
+    """Returns the name of the command as written in G-code, e.g. G1"""
+    letter, number = command
+
+    return letter if number is None else f'{letter}{number}'
+
+
+@dataclass
+class ConversionStats:
+    """The counters of a conversion, the stats of separately converted parts can be added up"""
+    file_length: int = 0
+    skipped_moves: int = 0
+    comment_count: int = 0
+
+    def __add__(self, other: 'ConversionStats') -> 'ConversionStats':
+        return ConversionStats(
+            self.file_length + other.file_length,
+            self.skipped_moves + other.skipped_moves,
+            self.comment_count + other.comment_count
+        )
 
 
 class Converter:
-    __gcode: GcodeParser | None
+    """The conversion kernel shared by all modes
+
+    The kernel parses the G-code, resolves the modal target of the moves and dispatches every line
+    to the handler registered for its (letter, number) command. It also keeps the position of the
+    robot and implements the toolpath simplification, so the modes only have to register the
+    handlers of their own instructions.
+    """
 
     TP_LINE_WIDTH = 76
 
-    def __init__(self, file: TextIOWrapper) -> None:
-        self.__gcode = GcodeParser(file.read(), include_comments=True)
+    def __init__(self, options: CLICommandOptions) -> None:
+        self.__options = options
+        self.__file = options.file
+        self.__file_length = 0
+        self.__profiler = options.profiler
+        self.__progress = options.progress
 
-    def convert(self, line_processor: Callable[[GcodeLine], str | List[str]]):
-        if self.__gcode is None:
-            echo(f'{Back.YELLOW}No GCODE is loaded.')
-            return None
+        self.__handlers: Dict[Command, LineHandler] = {}
+        self.__path_commands: Set[Command] = set()
+        self.__warned_commands: Set[Command] = set()
 
-        converted_lines: List[str] = []
+        self.position: Position = ORIGIN
+        self.__target: Position = ORIGIN
+        self.__previous_target: Position = ORIGIN
 
-        for gcode_line in self.__gcode.lines:
-            processed_line = line_processor(gcode_line)
+        self.__skipped_distance = 0
+        self.__skipped_moves = 0
+        self.__comment_count = 0
 
-            if not processed_line:
+        self.__encoder: PositionEncoder | None = None
+
+        if options.precision is not None:
+            self.__encoder = PositionEncoder(options.precision)
+
+        self.__path: PathBuffer[Tuple[GcodeRecord, Position]] | None = None
+
+        if options.arc_tolerance is not None:
+            # the arcs are fitted to the whole path, its linear runs are simplified once it is flushed
+            self.__path = PathBuffer()
+
+        elif options.simplification == SIMPLIFY_TOLERANCE:
+            self.__path = PathSimplifier(
+                options.tolerance,
+                rounding=self.__encoder.round if self.__encoder is not None else None
+            )
+
+        self.register(COMMENT, self.__process_comment)
+
+    def register(self, command: Command, handler: LineHandler, continues_path: bool = False) -> None:
+        """Registers the handler of a G-code command
+
+        Args:
+            command (Command): the (letter, number) pair of the command, e.g. ('G', 1)
+            handler (LineHandler): called with the parsed line and its resolved target
+            continues_path (bool): if False, the buffered path is emitted before the line is handled
+        """
+        if self.__profiler is not None:
+            handler = self.__profiler.timed_call(handler, command_name(command), command=True)
+
+        self.__handlers[command] = handler
+
+        if continues_path:
+            self.__path_commands.add(command)
+
+        else:
+            self.__path_commands.discard(command)
+
+    def parse(self) -> Iterator[GcodeRecord]:
+        """Parses the loaded file one line at a time
+
+        Only the line currently being parsed is held in memory, so the whole file never has to be
+        read into a single string before the conversion starts. The lines of a memory-mapped file
+        are parsed as bytes. The lines of the commands without a handler are counted, but not parsed
+        into records.
+
+        Yields:
+            GcodeRecord: the records of the parsed G-code lines in file order
+        """
+        file = self.__file
+        keep_text = self.__options.verbose
+
+        # the lines of the other commands are only counted, the moves are always resolved
+        commands = {*self.__handlers, G0, G1, G2, G3}
+
+        parse_line = Tokenizer(commands, keep_text, binary=isinstance(file, MappedFile)).parse_line
+
+        if self.__profiler is not None:
+            file = self.__profiler.timed(file, 'read')
+            parse_line = self.__profiler.timed_call(parse_line, 'parse')
+
+        progress = self.__progress
+        # the length of the lines read triggers the updates, the bar is moved to the bytes consumed
+        position = byte_position(self.__file) if progress is not None else None
+        consumed = 0
+        next_update = progress.step if progress is not None else -1
+
+        for raw_line in file:
+            if progress is not None:
+                consumed += len(raw_line)
+
+                if consumed >= next_update:
+                    progress.update(position() if position is not None else consumed)
+                    next_update = consumed + progress.step
+
+            records = parse_line(raw_line)
+
+            if records is None:
+                self.__file_length += 1
                 continue
 
-            # check if the returned value is a list
-            if isinstance(processed_line, list):
-                processed_line = [
-                    line if line.endswith('\n') else f'{line}\n' for line in processed_line
-                ]
+            for record in records:
+                self.__file_length += 1
+                yield record
+
+        if progress is not None:
+            progress.update(position() if position is not None else consumed)
+
+    def stream(self, final: bool = True) -> Iterator[str]:
+        """Converts the loaded file lazily, yielding the AS lines as soon as they are generated
+
+        The modal XYZ target of every G0-G3 move is resolved before the line
+        is dispatched, so the handlers never have to fill in the missing axes.
+
+        Args:
+            final (bool): if False, the loaded lines are only a part of the file and the buffered
+                path is kept for the next part instead of being emitted at the end
+
+        Yields:
+            str: the converted AS lines, each terminated with a newline
+        """
+        handlers = self.__handlers
+        path_commands = self.__path_commands
+        lines = resolve_targets(self.parse(), self.__target)
+
+        if self.__profiler is not None:
+            lines = self.__profiler.timed(lines, 'input')
 
-                if not all([line.endswith('\n') for line in processed_line]):
-                    raise Exception('Not all lines end with newline')
+        for gcode_line, target in lines:
+            command = gcode_line.command
+
+            if target is not None:
+                self.__previous_target = self.__target
+                self.__target = target
+
+            handler = handlers.get(command)
+
+            if handler is None:
+                self.__warn_unsupported(command)
+                continue
+
+            # the buffered path has to be emitted before the lines that break its continuity
+            if self.__path and command not in path_commands:
+                yield from self.flush_path()
+
+            processed_line = handler(gcode_line, target)
+
+            if not processed_line:
+                continue
 
             # the returned value is a string
-            elif not processed_line.endswith('\n'):
-                processed_line += '\n'
+            if isinstance(processed_line, str):
+                processed_line = [processed_line]
+
+            for line in processed_line:
+                yield line if line.endswith('\n') else f'{line}\n'
+
+        if final:
+            yield from self.flush_path()
+
+    def convert(self):
+        if self.__file is None:
+            echo(f'{Back.YELLOW}No GCODE is loaded.')
+            return None
+
+        return list(self.stream())
+
+    def format_move(self, instruction: str, position: Position) -> str:
+        """Formats a move instruction and stores its target as the position of the robot"""
+        self.position = position
+
+        if self.__encoder is not None:
+            return self.__encoder.format_move(instruction, position)
+
+        x_pos, y_pos, z_pos = position
+
+        return f'{instruction} SHIFT(a BY {x_pos}, {y_pos}, {z_pos})'
+
+    def linear_move(self, line: GcodeRecord, position: Position) -> str:
+        """Formats an LMOVE to the position, noting the command if the line had a comment"""
+        move_command = self.format_move('LMOVE', position)
+
+        if line.comment:
+            move_command += f' ;{line.command}'
+
+        return move_command + '\n'
+
+    def arc_parts(self, line: GcodeRecord, start: Position, position: Position) -> List[ArcPart]:
+        """Splits the arc of a G2/G3 line into the points of its circular moves
+
+        Args:
+            line (GcodeRecord): the G-code line of the arc
+            start (Position): the position the arc starts at, i.e. the target of the previous move
+            position (Position): the resolved target of the arc
+
+        Returns:
+            List[ArcPart]: the (intermediate point, end point) pairs, empty if the arc is invalid and
+                has to be replaced by a linear move
+        """
+        offset_x, offset_y, radius = line.arc
+
+        if is_coordinate(offset_x) or is_coordinate(offset_y):
+            offset = (
+                float(offset_x) if is_coordinate(offset_x) else 0.0,
+                float(offset_y) if is_coordinate(offset_y) else 0.0
+            )
+
+        else:
+            offset = None
+
+        try:
+            return arc_parts(
+                start,
+                position,
+                clockwise=line.command == G2,
+                offset=offset,
+                radius=float(radius) if is_coordinate(radius) else None
+            )
+
+        except ValueError as error:
+            echo(f'{Back.YELLOW}{error}, the arc is replaced by a linear move{Style.RESET_ALL}')
+            return []
+
+    def circular_move(self, line: GcodeRecord, position: Position, lines: List[str]) -> List[str]:
+        """Adds the C1MOVE/C2MOVE pairs of a G2/G3 arc to the lines generated for the G-code line
+
+        The arc starts at the target of the previous move. If the robot is not there, e.g. because the
+        moves before the arc were skipped by the simplification, it is moved there first.
+
+        Args:
+            line (GcodeRecord): the G-code line of the arc
+            position (Position): the resolved target of the arc
+            lines (List[str]): the instructions generated before the move, e.g. speed and signals
+
+        Returns:
+            List[str]: the lines to emit
+        """
+        start = self.__previous_target
+
+        if not self.__is_same(start, self.position):
+            lines.insert(0, self.format_move('LMOVE', start) + '\n')
+
+        parts = self.arc_parts(line, start, position)
+
+        if not parts:
+            lines.append(self.linear_move(line, position))
+            return lines
+
+        lines.extend(self.arc_moves(line, parts))
+
+        return lines
+
+    def arc_moves(self, line: GcodeRecord, parts: List[ArcPart]) -> List[str]:
+        """Formats the C1MOVE/C2MOVE pairs of the parts of an arc, noting the command on the last one"""
+        lines = []
+
+        for via, end in parts:
+            lines.append(self.format_move('C1MOVE', via) + '\n')
+            lines.append(self.format_move('C2MOVE', end) + '\n')
 
-            converted_lines.extend(processed_line)
+        if line.comment:
+            lines[-1] = f'{lines[-1][:-1]} ;{line.command}\n'
 
-        return converted_lines
+        return lines
+
+    def path_move(self, line: GcodeRecord, position: Position, lines: List[str]) -> List[str]:
+        """Adds a simplified linear move to the lines generated for the G-code line
+
+        Args:
+            line (GcodeRecord): the G-code line of the move
+            position (Position): the resolved target of the move
+            lines (List[str]): the instructions generated before the move, e.g. speed and signals
+
+        Returns:
+            List[str]: the lines to emit, the move is left out if it is simplified away
+        """
+        if self.__path is not None:
+            # the buffered path has to be emitted before the speed and signal changes of this move
+            if lines or self.__path.is_full:
+                lines[:0] = self.flush_path()
+
+            self.__path.add(self.position, position, (line, position))
+            self.position = position
+
+            return lines
+
+        if not self.skip_move(position):
+            lines.append(self.linear_move(line, position))
+
+        return lines
+
+    def flush_path(self) -> List[str]:
+        """Simplifies the buffered path and returns its kept moves"""
+        if not self.__path:
+            return []
+
+        if not isinstance(self.__path, PathSimplifier):
+            points, payloads = self.__path.take()
+            self.position = points[0]
+            lines = []
+
+            for index, parts in self.fit_moves(points[1:]):
+                line, position = payloads[index]
+
+                if parts is None:
+                    lines.append(self.linear_move(line, position))
+
+                else:
+                    lines.extend(self.arc_moves(line, parts))
+
+            return lines
+
+        buffered = len(self.__path)
+        kept = self.__path.flush()
+        self.__skipped_moves += buffered - len(kept)
+
+        return [self.linear_move(line, position) for line, position in kept]
+
+    def skip_move(self, position: Position, keep_z_changes: bool = True, previous: Position | None = None) -> bool:
+        """Checks if the move can be skipped with the minimum distance simplification
+
+        If the target is closer to the robot than the minimum distance the move is skipped and its
+        distance is accumulated. Once the accumulated distance reaches the minimum distance the move is
+        kept again and the counter is reset. With an output precision the moves that do not change the
+        rounded position are always skipped.
+
+        The welds of the Metal mode keep their own order: the distance is measured from the previous
+        move of the weld, even if it was skipped, and it is added to the skipped distance before the
+        check. Outside vase mode a move changing z counts as no distance.
+
+        Args:
+            position (Position): the target of the move
+            keep_z_changes (bool): if True, the moves changing the z coordinate are never skipped
+            previous (Position | None): the target of the previous move of a weld, checked in the order
+                of the welds
+
+        Returns:
+            bool: True if the move is skipped, otherwise the target becomes the robot position
+        """
+        if self.__encoder is not None and self.__encoder.is_same(position, self.position):
+            self.__skipped_moves += 1
+            return True
+
+        if previous is not None:
+            return self.__skip_weld_move(position, previous, keep_z_changes)
+
+        min_distance = self.__options.min_distance
+        x_pos, y_pos, z_pos = position
+        last_x, last_y, last_z = self.position
+
+        # simplification of path is only possible if the line has the same z coordinate
+        if z_pos == last_z or not keep_z_changes:
+            delta = sqrt((last_x - x_pos) ** 2 + (last_y - y_pos) ** 2 + (last_z - z_pos) ** 2)
+
+            # check if the delta is smaller than the specified minimum distance
+            if delta <= min_distance:
+                # check if the already skipped distance is smaller than the minimum distance
+                if self.__skipped_distance < min_distance:
+                    self.__skipped_distance += delta
+                    self.__skipped_moves += 1
+                    return True
+
+                # if not, append the move and reset the counter
+                self.__skipped_distance = 0
+
+        self.position = position
+
+        return False
+
+    def select_moves(
+            self,
+            positions: Sequence[Position],
+            keep_z_changes: bool = True,
+            weld_order: bool = False
+    ) -> Set[int]:
+        """Selects the moves of a buffered path to keep with the configured simplification
+
+        The path starts from the current position of the robot, and its last move is always kept.
+
+        Args:
+            positions (Sequence[Position]): the targets of the moves
+            keep_z_changes (bool): if True, the moves changing the z coordinate are never simplified
+            weld_order (bool): if True, the minimum distance is checked in the order of the welds, see
+                skip_move
+
+        Returns:
+            Set[int]: the indices of the moves to keep
+        """
+        last_index = len(positions) - 1
+
+        if self.__options.simplification == SIMPLIFY_TOLERANCE:
+            points = [self.position, *positions]
+            kept = {
+                i - 1 for i in simplify_path(points, self.__options.tolerance, keep_z_changes) if i > 0
+            }
+
+            if self.__encoder is not None:
+                kept = self.__drop_unmoved(positions, kept)
+
+            self.__skipped_moves += len(positions) - len(kept)
+
+        elif weld_order:
+            kept = set()
+            previous = self.position
+
+            # the last move of the weld is checked as well, its distance is added to the skipped distance
+            for index, position in enumerate(positions):
+                if not self.skip_move(position, keep_z_changes, previous):
+                    kept.add(index)
+
+                previous = position
+
+            kept.add(last_index)
+
+        else:
+            kept = {
+                index for index, position in enumerate(positions[:last_index])
+                if not self.skip_move(position, keep_z_changes)
+            }
+
+            kept.add(last_index)
+
+        self.position = positions[last_index]
+
+        return kept
+
+    def fit_moves(
+            self,
+            positions: Sequence[Position],
+            keep_z_changes: bool = True,
+            weld_order: bool = False
+    ) -> List[PathMove]:
+        """Selects the moves of a buffered path to keep, replacing the runs lying on a circle with arcs
+
+        Without arc fitting this is the same as select_moves. With arc fitting the linear runs between
+        the arcs are simplified separately, and their last moves are kept, as the arcs have to start
+        exactly where the fitted runs start.
+
+        Args:
+            positions (Sequence[Position]): the targets of the moves, the path starts from the current
+                position of the robot
+            keep_z_changes (bool): if True, the moves changing the z coordinate are never simplified
+            weld_order (bool): if True, the minimum distance is checked in the order of the welds, see
+                skip_move
+
+        Returns:
+            List[PathMove]: the kept moves in path order
+        """
+        if self.__options.arc_tolerance is None:
+            return [(index, None) for index in sorted(self.select_moves(positions, keep_z_changes, weld_order))]
+
+        points = [self.position, *positions]
+        moves: List[PathMove] = []
+        run_start = 0
+
+        # the point at index i of the path is the target of the move at index i - 1
+        for arc in fit_arcs(points, self.__options.arc_tolerance):
+            if arc.start > run_start:
+                moves.extend(self.__select_run(positions, run_start, arc.start, keep_z_changes, weld_order))
+
+            start = points[arc.start]
+            center_x, center_y = arc.center
+            parts = arc_parts(
+                start, points[arc.end], arc.clockwise, offset=(center_x - start[0], center_y - start[1])
+            )
+
+            moves.append((arc.end - 1, parts))
+            self.__skipped_moves += arc.end - arc.start - 1
+            self.position = points[arc.end]
+            run_start = arc.end
+
+        if run_start < len(positions):
+            moves.extend(self.__select_run(positions, run_start, len(positions), keep_z_changes, weld_order))
+
+        return moves
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the state carried from one G-code line to the next
+
+        The counters are not part of the state, the conversion continues the same way from equal
+        states no matter how they were reached.
+        """
+        return {
+            'position': self.position,
+            'target': self.__target,
+            'skipped_distance': self.__skipped_distance,
+            'path': self.__path.snapshot() if self.__path is not None else None,
+        }
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """Continues the conversion from a state returned by snapshot"""
+        self.position = state['position']
+        self.__target = state['target']
+        self.__skipped_distance = state['skipped_distance']
+
+        if self.__path is not None:
+            self.__path.restore(state['path'])
+
+    @property
+    def stats(self) -> ConversionStats:
+        """The counters of the conversion so far"""
+        return ConversionStats(self.__file_length, self.__skipped_moves, self.__comment_count)
 
     @property
     def file_length(self):
-        return len(self.__gcode.lines)
+        """The number of G-code lines parsed so far"""
+        return self.__file_length
+
+    @property
+    def skipped_moves(self) -> int:
+        """The number of moves left out by the simplification"""
+        return self.__skipped_moves
+
+    @property
+    def skipped_distance(self) -> float:
+        """The distance accumulated by the minimum distance simplification"""
+        return self.__skipped_distance
+
+    @property
+    def comment_count(self) -> int:
+        """The number of comment lines converted"""
+        return self.__comment_count
+
+    def __is_same(self, position: Position, other: Position) -> bool:
+        if self.__encoder is not None:
+            return self.__encoder.is_same(position, other)
+
+        return position == other
+
+    def __select_run(
+            self,
+            positions: Sequence[Position],
+            start: int,
+            end: int,
+            keep_z_changes: bool,
+            weld_order: bool
+    ) -> List[PathMove]:
+        kept = self.select_moves(positions[start:end], keep_z_changes, weld_order)
+
+        return [(start + index, None) for index in sorted(kept)]
+
+    def __skip_weld_move(self, position: Position, previous: Position, keep_z_changes: bool) -> bool:
+        min_distance = self.__options.min_distance
+        x_pos, y_pos, z_pos = position
+        last_x, last_y, last_z = previous
+        delta = 0.0
+
+        if z_pos == last_z or not keep_z_changes:
+            delta = sqrt((last_x - x_pos) ** 2 + (last_y - y_pos) ** 2 + (last_z - z_pos) ** 2)
+
+        if delta <= min_distance:
+            self.__skipped_distance += delta
+
+            if self.__skipped_distance < min_distance:
+                self.__skipped_moves += 1
+                return True
+
+            self.__skipped_distance = 0
+
+        self.position = position
+
+        return False
+
+    def __drop_unmoved(self, positions: Sequence[Position], kept: Set[int]) -> Set[int]:
+        # the last move of the path is kept, it can end an instruction sequence, e.g. a weld
+        last_index = len(positions) - 1
+        previous = self.__encoder.round(self.position)
+        moved = set()
+
+        for index in sorted(kept):
+            rounded = self.__encoder.round(positions[index])
+
+            if rounded != previous or index == last_index:
+                moved.add(index)
+                previous = rounded
+
+        return moved
+
+    def __process_comment(self, line: GcodeRecord, _: Position | None):
+        self.__comment_count += 1
+        return f'; {line.comment}'
+
+    def __warn_unsupported(self, command: Command):
+        # the arcs are warned about once, the other commands are irrelevant for the conversion
+        if command in (G2, G3) and command not in self.__warned_commands:
+            self.__warned_commands.add(command)
+            echo(f'{Back.YELLOW}{command[0]}{command[1]} command is not implemented{Style.RESET_ALL}')
 
     @staticmethod
     def format_to_as_line_comment(message: str, pad: bool = False):
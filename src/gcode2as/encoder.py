@@ -0,0 +1,60 @@
+"""Module for encoding the coordinates of the moves at a fixed output precision
+
+The coordinates are printed with a fixed number of decimals instead of the shortest repr of the
+floats, which can be as long as 12.300000000000001. The coordinates are rounded to the multiples of
+the precision, e.g. to 0.05 mm, and printed with the decimals of the precision. The moves whose
+rounded target is the same as the rounded position of the robot do not move the robot, so the
+converter drops them.
+"""
+
+from decimal import Decimal
+
+from gcode2as.toolpath import Position
+
+
+def precision_digits(precision: float) -> int:
+    """Returns the number of decimals of the precision, e.g. 2 for 0.01 mm or 0.05 mm"""
+    if precision <= 0:
+        raise ValueError(f'The precision must be positive, got {precision}')
+
+    # the shortest repr keeps 0.01 from having more digits because of its binary representation
+    return max(0, -Decimal(repr(precision)).normalize().as_tuple().exponent)
+
+
+class PositionEncoder:
+    """Rounds and formats the targets of the moves at a fixed precision"""
+
+    def __init__(self, precision: float) -> None:
+        self.__digits = precision_digits(precision)
+
+        # the powers of ten are rounded to their decimal place directly, the others to their multiples
+        self.__step = None if precision == 10 ** -self.__digits else precision
+
+        # the three coordinates are formatted by a single call of a format prepared up front
+        coordinate = f'{{:.{self.__digits}f}}'
+        self.__format = f'{{}} SHIFT(a BY {coordinate}, {coordinate}, {coordinate})'.format
+
+    @property
+    def digits(self) -> int:
+        return self.__digits
+
+    def round(self, position: Position) -> Position:
+        """Rounds the position to the precision, the signed zeros are turned into zeros"""
+        digits = self.__digits
+        step = self.__step
+        x_pos, y_pos, z_pos = position
+
+        if step is not None:
+            x_pos = round(x_pos / step) * step
+            y_pos = round(y_pos / step) * step
+            z_pos = round(z_pos / step) * step
+
+        return round(x_pos, digits) + 0.0, round(y_pos, digits) + 0.0, round(z_pos, digits) + 0.0
+
+    def is_same(self, position: Position, other: Position) -> bool:
+        """Returns True if the positions are the same at the precision"""
+        return self.round(position) == self.round(other)
+
+    def format_move(self, instruction: str, position: Position) -> str:
+        """Formats a move instruction to the rounded position"""
+        return self.__format(instruction, *self.round(position))
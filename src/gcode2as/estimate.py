@@ -0,0 +1,411 @@
+"""Module for estimating the path length and the cycle time of the generated programs
+
+The estimate is computed from the generated AS lines, so it covers the moves the robot actually
+runs, after the simplification (e.g. the minimum distance) and the optimizer. The moves are collected
+into columns while the program is written, and the lengths and times of every block of moves are
+computed at once, with NumPy if it is installed, and added up by layer, so the memory used does not
+grow with the program.
+
+The moves inside the sections of the mode (see formatter.SplitRules), e.g. between switching the
+extruder on and off or between the start and the end of a weld, are the process path, the others are
+the travel. A move takes its length over the current SPEED, a weld move over the welding speed of its
+condition (W1SET). The acceleration, the blending of the moves and the waiting for the signals are not
+modelled, so the estimated cycle time is a lower bound.
+"""
+
+import csv
+import re
+from array import array
+from dataclasses import asdict, dataclass, replace
+from importlib.util import find_spec
+from math import asin, dist, nan
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, Tuple
+
+from gcode2as.formatter import LAYER_PREFIXES, SplitRules
+from gcode2as.toolpath import Position
+
+MOVE_PATTERN = re.compile(
+    r'(LMOVE|JMOVE|C1MOVE|C2MOVE|LWS|LWC|LWE|C1WC|C2WC|C2WE) SHIFT\(a BY ([^,]+), ([^,]+), ([^)]+)\)(?:, (\d+))?'
+)
+SPEED_PATTERN = re.compile(r'SPEED ([-+.\deE]+)(?: (MM/MIN|MM/S))?')
+CONDITION_PATTERN = re.compile(r'W1SET (\d+) = ([-+.\deE]+)')
+
+# the intermediate points of the circular moves, the move ends with the next instruction
+VIA_INSTRUCTIONS = ('C1MOVE', 'C1WC')
+
+SIGNAL_INSTRUCTIONS = ('SIGNAL ', 'PULSE ')
+
+# the speed units of the SPEED instruction in mm/s, a speed without a unit is a percentage of the maximum
+SPEED_UNITS = {'MM/MIN': 1 / 60, 'MM/S': 1.0}
+
+# the welding speed of the conditions (W1SET) in mm/s
+WELDING_SPEED_UNIT = 1.0
+
+# three points closer to a line than this are not considered a circle
+EPSILON = 1e-9
+
+# the number of moves whose lengths and times are computed at once
+BLOCK_SIZE = 1 << 12
+
+# NumPy is slow to import, so it is only imported once the first block is computed
+np: Any = None
+
+
+def is_available() -> bool:
+    """Returns True if NumPy is installed and the blocks can be computed with it"""
+    return np is not None or find_spec('numpy') is not None
+
+
+def _import_numpy() -> None:
+    global np  # pylint: disable=global-statement
+
+    if np is not None:
+        return
+
+    try:
+        import numpy
+
+    except ImportError as error:  # pragma: no cover - depends on the environment
+        raise ImportError('The estimate with NumPy requires it, install it with "pip install gcode2as[numpy]"') from error
+
+    np = numpy
+
+
+def arc_length(start: Position, via: Position, end: Position) -> float:
+    """Returns the length of the circular arc from the start through the via point to the end"""
+    first = dist(start, via)
+    second = dist(via, end)
+    chord = dist(start, end)
+
+    a_x, a_y, a_z = (via[axis] - start[axis] for axis in range(3))
+    b_x, b_y, b_z = (end[axis] - start[axis] for axis in range(3))
+    # twice the area of the triangle of the three points
+    cross = dist((a_y * b_z - a_z * b_y, a_z * b_x - a_x * b_z, a_x * b_y - a_y * b_x), (0.0, 0.0, 0.0))
+
+    if cross < EPSILON:
+        return first + second
+
+    radius = first * second * chord / (2 * cross)
+
+    return radius * (2 * asin(min(first / (2 * radius), 1.0)) + 2 * asin(min(second / (2 * radius), 1.0)))
+
+
+def format_duration(seconds: float) -> str:
+    """Formats the seconds as H:MM:SS"""
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f'{hours}:{minutes:02d}:{seconds:02d}'
+
+
+@dataclass
+class LayerEstimate:
+    """The path lengths in mm and the times in seconds of a layer of the program
+
+    The layers are separated by the layer comments of the G-code, the moves before the first one are
+    part of the first layer.
+    """
+    layer: int
+    z: float
+    moves: int
+    travel_length: float
+    process_length: float
+    travel_time: float
+    process_time: float
+    toggles: int
+
+    @property
+    def time(self) -> float:
+        return self.travel_time + self.process_time
+
+
+@dataclass
+class CycleEstimate:
+    """The estimated path lengths and times of a program, by layer
+
+    Args:
+        layers (List[LayerEstimate]): the estimates of the layers
+        untimed_moves (int): the number of moves without a known speed, their time is not estimated
+    """
+    layers: List[LayerEstimate]
+    untimed_moves: int = 0
+
+    @property
+    def travel_length(self) -> float:
+        return sum(layer.travel_length for layer in self.layers)
+
+    @property
+    def process_length(self) -> float:
+        return sum(layer.process_length for layer in self.layers)
+
+    @property
+    def travel_time(self) -> float:
+        return sum(layer.travel_time for layer in self.layers)
+
+    @property
+    def process_time(self) -> float:
+        return sum(layer.process_time for layer in self.layers)
+
+    @property
+    def toggles(self) -> int:
+        return sum(layer.toggles for layer in self.layers)
+
+    @property
+    def cycle_time(self) -> float:
+        return self.travel_time + self.process_time
+
+    def summary(self) -> Dict[str, Any]:
+        """Returns the totals of the program as a JSON serializable dict"""
+        return {
+            'layers': len(self.layers),
+            'moves': sum(layer.moves for layer in self.layers),
+            'untimed_moves': self.untimed_moves,
+            'travel_length': self.travel_length,
+            'process_length': self.process_length,
+            'travel_time': self.travel_time,
+            'process_time': self.process_time,
+            'toggles': self.toggles,
+            'cycle_time': self.cycle_time,
+        }
+
+    def describe(self) -> str:
+        """Returns the summary as a sentence, e.g. for the stats of the conversion"""
+        text = (
+            f'{format_duration(self.cycle_time)} over {len(self.layers)} layers: '
+            f'process path {self.process_length:.1f} mm in {format_duration(self.process_time)}, '
+            f'travel {self.travel_length:.1f} mm in {format_duration(self.travel_time)}, '
+            f'{self.toggles} signal toggles'
+        )
+
+        if self.untimed_moves:
+            text += f', {self.untimed_moves} moves without a known speed'
+
+        return text
+
+    def write_table(self, file: TextIO) -> None:
+        """Writes the estimates of the layers as CSV, one row per layer"""
+        fields = [*LayerEstimate.__dataclass_fields__, 'time']
+        writer = csv.DictWriter(file, fields, lineterminator='\n')
+        writer.writeheader()
+
+        for layer in self.layers:
+            writer.writerow({**asdict(layer), 'time': layer.time})
+
+
+class CycleEstimator:
+    """Adds up the path lengths and the times of the moves of the generated lines by layer
+
+    The moves are collected in blocks of BLOCK_SIZE moves, whose lengths and times are added to
+    their layers once the block is full, so only a block of moves is held however long the program is.
+
+    Args:
+        rules (SplitRules): the sections of the mode, the moves inside them are the process path
+        use_numpy (bool | None): if True, the blocks are computed with NumPy, by default if it is installed
+    """
+
+    def __init__(self, rules: SplitRules = SplitRules(), use_numpy: bool | None = None) -> None:
+        self.__opening = rules.opening
+        self.__closing = rules.closing
+        self.__use_numpy = is_available() if use_numpy is None else use_numpy
+        self.__process = False
+        self.__speed = nan
+        self.__conditions: Dict[str, float] = {}
+        self.__via: Position | None = None
+
+        self.__layers = [LayerEstimate(0, nan, 0, 0.0, 0.0, 0.0, 0.0, 0)]
+        self.__layer_started = False
+        self.__untimed_moves = 0
+
+        # the target of the last move of the previous block, the start of the first move of the next one
+        self.__position: Position | None = None
+        self.__new_block()
+
+    def observe(self, lines: Iterable[str]) -> Iterator[str]:
+        """Passes the lines through, collecting their moves"""
+        for line in lines:
+            self.add(line)
+            yield line
+
+    def add(self, line: str) -> None:
+        """Collects the move, the speed or the signal of a generated line"""
+        if line.startswith(';'):
+            # the comments of the layers of the G-code start the next layer, unless the layer has no moves yet
+            if line.startswith(LAYER_PREFIXES) and self.__layer_started:
+                self.__layers.append(LayerEstimate(len(self.__layers), nan, 0, 0.0, 0.0, 0.0, 0.0, 0))
+                self.__layer_started = False
+
+            return
+
+        match = MOVE_PATTERN.match(line)
+
+        if match is not None:
+            self.__add_move(*match.groups())
+
+        elif line.startswith('SPEED '):
+            speed = SPEED_PATTERN.match(line)
+            self.__speed = nan
+
+            if speed is not None and speed.group(2) is not None:
+                self.__speed = float(speed.group(1)) * SPEED_UNITS[speed.group(2)]
+
+        elif line.startswith('W1SET '):
+            condition = CONDITION_PATTERN.match(line)
+
+            if condition is not None:
+                self.__conditions[condition.group(1)] = float(condition.group(2)) * WELDING_SPEED_UNIT
+
+        # the move of a line opening a section, e.g. the start of a weld, leads to the process path
+        if self.__opening and line.startswith(self.__opening):
+            self.__process = True
+            self.__layers[-1].toggles += 1
+
+        elif self.__closing and line.startswith(self.__closing):
+            self.__process = False
+            self.__layers[-1].toggles += 1
+
+        elif line.startswith(SIGNAL_INSTRUCTIONS):
+            self.__layers[-1].toggles += 1
+
+    def __add_move(self, instruction: str, x_pos: str, y_pos: str, z_pos: str, condition: str | None) -> None:
+        position = (float(x_pos), float(y_pos), float(z_pos))
+
+        if instruction in VIA_INSTRUCTIONS:
+            self.__via = position
+            return
+
+        if not self.__layer_started:
+            self.__layers[-1].z = position[2]
+            self.__layer_started = True
+
+        self.__points.extend(position)
+        self.__vias.extend(self.__via or (nan, nan, nan))
+        self.__speeds.append(self.__conditions.get(condition, self.__speed) if condition else self.__speed)
+        self.__kinds.append(self.__process)
+        self.__block_layers.append(len(self.__layers) - 1)
+        self.__via = None
+
+        if len(self.__speeds) >= BLOCK_SIZE:
+            self.__flush()
+
+    def estimate(self) -> CycleEstimate:
+        """Returns the path lengths and the times of the moves collected so far"""
+        self.__flush()
+
+        return CycleEstimate([replace(layer) for layer in self.__layers], self.__untimed_moves)
+
+    def __new_block(self) -> None:
+        # new arrays instead of cleared ones, as NumPy may still have a view of the previous block
+        self.__points = array('d')
+        self.__vias = array('d')
+        self.__speeds = array('d')
+        self.__kinds = array('b')
+        self.__block_layers = array('q')
+
+    def __flush(self) -> None:
+        """Adds the lengths and the times of the moves of the block to their layers"""
+        if not self.__speeds:
+            return
+
+        first = self.__block_layers[0]
+        columns = self.__numpy_sums(first) if self.__use_numpy else self.__python_sums(first)
+        travel_lengths, process_lengths, travel_times, process_times, moves, untimed_moves = columns
+
+        for offset, layer in enumerate(self.__layers[first:first + len(moves)]):
+            layer.travel_length += float(travel_lengths[offset])
+            layer.process_length += float(process_lengths[offset])
+            layer.travel_time += float(travel_times[offset])
+            layer.process_time += float(process_times[offset])
+            layer.moves += int(moves[offset])
+
+        self.__untimed_moves += untimed_moves
+        self.__position = tuple(self.__points[-3:])
+        self.__new_block()
+
+    def __numpy_sums(self, first: int) -> Tuple[Any, ...]:
+        _import_numpy()
+
+        points = np.frombuffer(self.__points, dtype=np.float64).reshape(-1, 3)
+        vias = np.frombuffer(self.__vias, dtype=np.float64).reshape(-1, 3)
+        speeds = np.frombuffer(self.__speeds, dtype=np.float64)
+        process = np.frombuffer(self.__kinds, dtype=np.int8).astype(bool)
+        layers = np.frombuffer(self.__block_layers, dtype=np.int64) - first
+
+        # the first move starts where the robot is, which the program does not tell
+        previous = points[:1] if self.__position is None else np.array([self.__position])
+        starts = np.concatenate((previous, points[:-1]))
+        lengths = np.linalg.norm(points - starts, axis=1)
+
+        arcs = ~np.isnan(vias[:, 0])
+
+        if arcs.any():
+            lengths[arcs] = _arc_lengths(np, starts[arcs], vias[arcs], points[arcs])
+
+        timed = speeds > 0
+        times = np.divide(lengths, speeds, out=np.zeros_like(lengths), where=timed)
+
+        count = int(layers[-1]) + 1
+
+        def per_layer(values, mask):
+            return np.bincount(layers, weights=np.where(mask, values, 0.0), minlength=count)
+
+        return (
+            per_layer(lengths, ~process),
+            per_layer(lengths, process),
+            per_layer(times, ~process),
+            per_layer(times, process),
+            np.bincount(layers, minlength=count),
+            int(np.count_nonzero(~timed & (lengths > 0)))
+        )
+
+    def __python_sums(self, first: int) -> Tuple[Any, ...]:
+        count = self.__block_layers[-1] - first + 1
+        columns = [[0.0] * count for _ in range(4)]
+        moves = [0] * count
+        untimed_moves = 0
+
+        points = [tuple(self.__points[index:index + 3]) for index in range(0, len(self.__points), 3)]
+        start = self.__position or points[0]
+
+        for index, (end, speed, process, layer) in enumerate(
+                zip(points, self.__speeds, self.__kinds, self.__block_layers)
+        ):
+            via = tuple(self.__vias[3 * index:3 * index + 3])
+            length = dist(start, end) if via[0] != via[0] else arc_length(start, via, end)
+            start = end
+            layer -= first
+
+            columns[1 if process else 0][layer] += length
+            moves[layer] += 1
+
+            if speed > 0:
+                columns[3 if process else 2][layer] += length / speed
+
+            elif length > 0:
+                untimed_moves += 1
+
+        return (*columns, moves, untimed_moves)
+
+
+def _arc_lengths(np: Any, starts: Any, vias: Any, ends: Any) -> Any:
+    """Returns the lengths of the circular arcs, the rows of the arrays are the points of the arcs"""
+    first = np.linalg.norm(vias - starts, axis=1)
+    second = np.linalg.norm(ends - vias, axis=1)
+    chord = np.linalg.norm(ends - starts, axis=1)
+    cross = np.linalg.norm(np.cross(vias - starts, ends - starts), axis=1)
+
+    circle = cross >= EPSILON
+    diameter = np.divide(first * second * chord, cross, out=np.ones_like(cross), where=circle)
+    angle = 2 * np.arcsin(np.minimum(first / diameter, 1.0)) + 2 * np.arcsin(np.minimum(second / diameter, 1.0))
+
+    return np.where(circle, diameter / 2 * angle, first + second)
+
+
+def estimate_program(lines: Iterable[str], rules: SplitRules = SplitRules()) -> CycleEstimate:
+    """Estimates the lines of a written program, e.g. a .pg file, whose steps are indented"""
+    estimator = CycleEstimator(rules)
+
+    for line in lines:
+        if line.startswith('\t'):
+            estimator.add(line[1:])
+
+    return estimator.estimate()
@@ -0,0 +1,243 @@
+"""Module for a fake AS terminal, for testing the uploads without a controller
+
+The fake controller listens on TCP like the AS terminal of a controller and answers the lines it
+receives with one of the responders:
+
+- Emulator: emulates the editor of the terminal and keeps the entered programs
+- Replayer: answers with a transcript recorded before, and reports the lines differing from it
+- Forwarder: forwards the lines to a real controller and answers with its output
+
+Every session is recorded as a transcript, a list of exchanges of the line received and the output
+sent, which can be saved as JSON. A transcript recorded with the Forwarder reproduces the dialog of
+a real controller, which the Replayer then plays back offline, e.g. in the tests.
+"""
+
+import json
+import socketserver
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List
+
+from gcode2as.controller import ANY_PROMPT, DEFAULT_USER, Terminal
+
+# a line of the session and the output answering it, the greeting of a session has no line
+Exchange = Dict[str, str | None]
+
+
+class Emulator:
+    """Emulates the AS terminal: the login, the editor and the deletion of the programs
+
+    Args:
+        programs (Dict[str, List[str]]): the entered programs by name, shared by the sessions
+        user (str): the user the terminal asks for, or None to skip the login
+    """
+
+    def __init__(self, programs: Dict[str, List[str]], user: str | None = DEFAULT_USER) -> None:
+        self.__programs = programs
+        self.__user = user
+        self.__logged_in = user is None
+        self.__editing: str | None = None
+        self.__steps: List[str] = []
+        self.__deleting: str | None = None
+
+    def greeting(self) -> str:
+        return '>' if self.__logged_in else 'login: '
+
+    def respond(self, line: str) -> str:
+        if not self.__logged_in:
+            self.__logged_in = line == self.__user
+            return f'{line}\r\n>' if self.__logged_in else f'{line}\r\nlogin: '
+
+        if self.__editing is not None:
+            return self.__edit(line)
+
+        if self.__deleting is not None:
+            name, self.__deleting = self.__deleting, None
+
+            if line == '1':
+                self.__programs.pop(name, None)
+
+            return f'{line}\r\n>'
+
+        command, _, argument = line.partition(' ')
+
+        if command == 'EDIT' and argument:
+            self.__editing = argument.partition(',')[0].strip()
+            self.__steps = []
+            return f'{line}\r\n.PROGRAM {self.__editing}\r\n   1 ?'
+
+        if command == 'DELETE/P' and argument:
+            if argument.strip() not in self.__programs:
+                return f'{line}\r\n(E0102) Program does not exist.\r\n>'
+
+            self.__deleting = argument.strip()
+            return f'{line}\r\nAre you sure ? (Yes:1, No:0)'
+
+        return f'{line}\r\n(P0001) Unknown command.\r\n>'
+
+    def __edit(self, line: str) -> str:
+        if line == 'E':
+            self.__programs[self.__editing] = self.__steps
+            self.__editing = None
+            return f'{line}\r\n>'
+
+        self.__steps.append(line)
+        return f'{line}\r\n{len(self.__steps) + 1:4d} ?'
+
+
+class Replayer:
+    """Answers with the outputs of a transcript, a line differing from it is answered with an error
+
+    Args:
+        transcript (List[Exchange]): the exchanges of a recorded session
+        mismatches (List[str]): the differences from the transcript are appended to it
+    """
+
+    def __init__(self, transcript: List[Exchange], mismatches: List[str]) -> None:
+        self.__exchanges = iter(transcript)
+        self.__mismatches = mismatches
+        self.__greeting = ''
+
+        first = next(self.__exchanges, None)
+
+        if first is not None and first['line'] is None:
+            self.__greeting = first['output'] or ''
+
+        elif first is not None:
+            self.__exchanges = iter([first, *self.__exchanges])
+
+    def greeting(self) -> str:
+        return self.__greeting
+
+    def respond(self, line: str) -> str:
+        exchange = next(self.__exchanges, None)
+
+        if exchange is None:
+            self.__mismatches.append(f'received {line!r} after the end of the session')
+            return f'{line}\r\n(E9999) Replay mismatch.\r\n>'
+
+        if exchange['line'] != line:
+            self.__mismatches.append(f'received {line!r} instead of {exchange["line"]!r}')
+
+            # the recorded output follows the error, so the client gets the prompt it is waiting for
+            return f'(E9999) Replay mismatch.\r\n{exchange["output"] or ""}'
+
+        return exchange['output'] or ''
+
+
+class Forwarder:
+    """Forwards the lines to a real controller, answering with its output up to its next prompt
+
+    Args:
+        host (str): the address of the controller
+        port (int): the TCP port of its AS terminal
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.__terminal = Terminal(host, port)
+
+    def greeting(self) -> str:
+        return self.__terminal.read(ANY_PROMPT)
+
+    def respond(self, line: str) -> str:
+        self.__terminal.send(line)
+        return self.__terminal.read(ANY_PROMPT)
+
+    def close(self) -> None:
+        self.__terminal.close()
+
+
+class TerminalHandler(socketserver.StreamRequestHandler):
+    """Answers the lines of a session with the responder of the server, recording the session"""
+
+    server: 'FakeController'
+    disable_nagle_algorithm = True
+
+    def handle(self) -> None:
+        responder = self.server.responder()
+        session: List[Exchange] = []
+        self.server.record(session)
+
+        try:
+            greeting = responder.greeting()
+            session.append({'line': None, 'output': greeting})
+            self.wfile.write(greeting.encode('utf8'))
+
+            while raw := self.rfile.readline():
+                line = raw.decode('utf8', errors='replace').rstrip('\r\n')
+
+                # a connection dropped by the network, for testing the reconnection
+                if self.server.should_drop():
+                    return
+
+                output = responder.respond(line)
+                session.append({'line': line, 'output': output})
+                self.wfile.write(output.encode('utf8'))
+
+        finally:
+            if isinstance(responder, Forwarder):
+                responder.close()
+
+
+class FakeController(socketserver.ThreadingTCPServer):
+    """A fake AS terminal answering every session with a new responder
+
+    Args:
+        address (tuple): the host and the port to listen on, port 0 picks a free port
+        transcript (List[Exchange] | None): if given, the sessions replay it, otherwise the terminal
+            is emulated
+        forward (tuple | None): if given, the host and the port of a real controller the sessions
+            are forwarded to
+        drop_after (int | None): if given, the connection is dropped once, on this many received lines
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+            self,
+            address: tuple,
+            transcript: List[Exchange] | None = None,
+            forward: tuple | None = None,
+            drop_after: int | None = None
+    ) -> None:
+        super().__init__(address, TerminalHandler)
+        self.programs: Dict[str, List[str]] = {}
+        self.sessions: List[List[Exchange]] = []
+        self.mismatches: List[str] = []
+        self.__transcript = transcript
+        self.__forward = forward
+        self.__drop_after = drop_after
+        self.__received = 0
+        self.__lock = Lock()
+
+    def responder(self) -> Emulator | Replayer | Forwarder:
+        """Creates the responder of a new session"""
+        if self.__forward is not None:
+            return Forwarder(*self.__forward)
+
+        if self.__transcript is not None:
+            return Replayer(self.__transcript, self.mismatches)
+
+        return Emulator(self.programs)
+
+    def record(self, session: List[Exchange]) -> None:
+        with self.__lock:
+            self.sessions.append(session)
+
+    def should_drop(self) -> bool:
+        """Counts a received line, returns True if the connection is dropped at it"""
+        with self.__lock:
+            self.__received += 1
+            return self.__received == self.__drop_after
+
+    def save_transcript(self, path: Path, session: int = -1) -> None:
+        """Saves a recorded session as a JSON transcript"""
+        with open(path, 'w', encoding='utf8') as f_open:
+            json.dump(self.sessions[session], f_open, indent=1)
+
+
+def load_transcript(path: Path) -> List[Exchange]:
+    """Loads a transcript saved by FakeController.save_transcript"""
+    with open(path, 'r', encoding='utf8') as f_open:
+        return json.load(f_open)
@@ -0,0 +1,187 @@
+"""Module for fitting arcs to the linearized curves of the toolpaths
+
+Slicers write the curves as dense polylines of G1 moves. The runs of consecutive points lying on a
+circle within a tolerance are replaced with arcs, which are converted to circular moves, so a curve
+takes a few instructions instead of one per segment and the robot moves along it smoothly instead
+of stopping at every short segment.
+
+An arc is accepted if every point of the run is closer than the tolerance to the circle and every
+segment of the run is closer than the tolerance to the arc between its points, so a coarse polygon
+whose corners happen to lie on a circle is never rounded. The arcs are fitted in the XY plane, the
+runs changing the z coordinate are left linear.
+"""
+
+from math import atan2, cos, hypot, pi
+from typing import List, NamedTuple, Sequence, Tuple
+
+from gcode2as.toolpath import Position
+
+# the shortest run of moves replaced by an arc
+MIN_ARC_MOVES = 4
+
+# points and angles closer than this are considered equal
+EPSILON = 1e-9
+
+
+class FittedArc(NamedTuple):
+    """An arc replacing the moves of a path between two of its points
+
+    The indices refer to the points of the fitted path, the arc starts at the start point and its
+    moves end at the end point.
+    """
+    start: int
+    end: int
+    center: Tuple[float, float]
+    clockwise: bool
+
+
+def circle_center(first: Position, second: Position, third: Position) -> Tuple[float, float] | None:
+    """Returns the center of the circle through the XY coordinates of the points
+
+    Returns:
+        Tuple[float, float] | None: the center, None if the points are on a line
+    """
+    ax, ay = first[0], first[1]
+    bx, by = second[0], second[1]
+    cx, cy = third[0], third[1]
+
+    determinant = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+
+    if abs(determinant) < EPSILON:
+        return None
+
+    a_squared = ax ** 2 + ay ** 2
+    b_squared = bx ** 2 + by ** 2
+    c_squared = cx ** 2 + cy ** 2
+
+    return (
+        (a_squared * (by - cy) + b_squared * (cy - ay) + c_squared * (ay - by)) / determinant,
+        (a_squared * (cx - bx) + b_squared * (ax - cx) + c_squared * (bx - ax)) / determinant
+    )
+
+
+def fit_arc(
+        points: Sequence[Position],
+        start: int,
+        end: int,
+        tolerance: float
+) -> Tuple[Tuple[float, float], bool, float] | None:
+    """Checks if the points from start to end lie on a single arc within the tolerance
+
+    The circle is fitted through the first, the middle and the last point of the run. An arc can not
+    be longer than a full circle, and it only ends at its start point if it is a full circle.
+
+    Returns:
+        Tuple[Tuple[float, float], bool, float] | None: the center, the direction (True if clockwise)
+            and the largest distance of the arc from its chord, None if the points are not on an arc
+    """
+    first = points[start]
+
+    if hypot(points[end][0] - first[0], points[end][1] - first[1]) > EPSILON:
+        center = circle_center(first, points[(start + end) // 2], points[end])
+
+    else:
+        # the end of a full circle is its start point, so the circle is fitted through its thirds
+        center = circle_center(first, points[(2 * start + end) // 3], points[(start + 2 * end) // 3])
+
+    if center is None:
+        return None
+
+    center_x, center_y = center
+    radius = hypot(first[0] - center_x, first[1] - center_y)
+    previous_angle = atan2(first[1] - center_y, first[0] - center_x)
+    direction = 0.0
+    sweep = 0.0
+
+    for index in range(start + 1, end + 1):
+        x_pos, y_pos, z_pos = points[index]
+
+        if z_pos != first[2] or abs(hypot(x_pos - center_x, y_pos - center_y) - radius) > tolerance:
+            return None
+
+        angle = atan2(y_pos - center_y, x_pos - center_x)
+        step = (angle - previous_angle + pi) % (2 * pi) - pi
+
+        # the first segment sets the direction, every other segment has to turn the same way
+        if not direction:
+            direction = -1.0 if step < 0 else 1.0
+
+        step *= direction
+
+        if step < EPSILON or radius * (1 - cos(step / 2)) > tolerance:
+            return None
+
+        sweep += step
+        previous_angle = angle
+
+        if sweep > 2 * pi - EPSILON:
+            # only the full circle ending exactly at its start point can be written as an arc
+            if index != end or hypot(x_pos - first[0], y_pos - first[1]) > EPSILON:
+                return None
+
+    return center, direction < 0, radius * (1 - cos(min(sweep, pi) / 2))
+
+
+def fit_arcs(points: Sequence[Position], tolerance: float, min_moves: int = MIN_ARC_MOVES) -> List[FittedArc]:
+    """Finds the runs of the path lying on arcs
+
+    The runs are found greedily from the start of the path: the run is doubled while it stays on an
+    arc, then the longest run on an arc is bisected between the last run that fit and the first one
+    that did not.
+
+    Args:
+        points (Sequence[Position]): the points of the path, starting with the position of the robot
+        tolerance (float): the maximum distance of the points and the segments from the arc in mm
+        min_moves (int): the shortest run of moves replaced by an arc
+
+    Returns:
+        List[FittedArc]: the arcs in path order, they do not overlap
+    """
+    arcs: List[FittedArc] = []
+    last = len(points) - 1
+    start = 0
+
+    while last - start >= min_moves:
+        fitted = fit_arc(points, start, start + min_moves, tolerance)
+
+        if fitted is None:
+            start += 1
+            continue
+
+        end = start + min_moves
+        failed = last + 1
+        length = min_moves
+
+        while end < last:
+            candidate = min(end + length, last)
+            candidate_fit = fit_arc(points, start, candidate, tolerance)
+
+            if candidate_fit is None:
+                failed = candidate
+                break
+
+            end, fitted = candidate, candidate_fit
+            length *= 2
+
+        while failed - end > 1:
+            candidate = (end + failed) // 2
+            candidate_fit = fit_arc(points, start, candidate, tolerance)
+
+            if candidate_fit is None:
+                failed = candidate
+
+            else:
+                end, fitted = candidate, candidate_fit
+
+        center, clockwise, bend = fitted
+
+        # the runs bending less than the tolerance are better simplified as straight lines, the next
+        # arc can only start close to the end of the straight run
+        if bend <= tolerance:
+            start = max(start + 1, end - min_moves)
+            continue
+
+        arcs.append(FittedArc(start, end, center, clockwise))
+        start = end
+
+    return arcs
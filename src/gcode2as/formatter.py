@@ -1,8 +1,67 @@
-from io import TextIOWrapper
-from math import ceil
-from typing import List
+"""Module for formatting the converted lines as AS programs
+
+A controller can only load programs up to a limited size, so long programs are split into
+subprograms called by a driver program. The subprograms are cut at a budget of steps (lines) and
+bytes, preferably at a layer change, and never inside a section the modes must not interrupt, e.g.
+a weld between its LWS and LWE instructions, unless the section is far over the budget.
+"""
+
+from dataclasses import dataclass
+from io import StringIO, TextIOWrapper
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, TextIO, Tuple
+from click import echo
+from colorama import Fore
 
 MAX_PROGRAM_LENGTH = 1000
+MAX_PROGRAM_BYTES = 64 * 1024
+
+# the comment lines written for the layer changes of the slicers, e.g. ;LAYER:12 or ;LAYER_CHANGE
+LAYER_PREFIXES = ('; LAYER', '; layer')
+
+# a layer change is only preferred for a split if it leaves the subprogram at least this full
+MIN_FILL = 0.5
+
+# a strict section is only buffered up to this many budgets, then it is cut
+MAX_SECTION_BUDGETS = 4
+
+PROGRAM_SUFFIX = '.pg'
+
+
+@dataclass(frozen=True)
+class ProgramBudget:
+    """The largest subprogram the controller can load
+
+    Args:
+        max_steps (int): the maximum number of lines of a subprogram
+        max_bytes (int): the maximum size of a subprogram in bytes, including its .PROGRAM and .END
+    """
+    max_steps: int = MAX_PROGRAM_LENGTH
+    max_bytes: int = MAX_PROGRAM_BYTES
+
+
+@dataclass(frozen=True)
+class SplitRules:
+    """The sections of the program a split should not fall into, set by the modes
+
+    A section starts with a line starting with one of the opening prefixes and ends with a line
+    starting with one of the closing prefixes, e.g. the extrusion between switching the extruder on
+    and off. The strict sections are not split, even if they are longer than the budget, the others
+    are only split if no other split fits the budget. A strict section longer than MAX_SECTION_BUDGETS
+    budgets is cut with the cut function of the mode, it is ended and restarted at the split.
+
+    Args:
+        opening (Tuple[str, ...]): the prefixes of the lines starting a section
+        closing (Tuple[str, ...]): the prefixes of the lines ending a section
+        strict (bool): if True, the sections are only split once they are far over the budget
+        cut (Callable[[str], Tuple[str, str] | None] | None): returns the line ending a strict section
+            in place of the given line and the line restarting the section after it, None if the
+            section can not be cut at the line
+    """
+    opening: Tuple[str, ...] = ()
+    closing: Tuple[str, ...] = ()
+    strict: bool = False
+    cut: Callable[[str], Tuple[str, str] | None] | None = None
 
 
 def create_line_generator(file: TextIOWrapper):
@@ -11,44 +70,278 @@ def create_line_generator(file: TextIOWrapper):
         yield line
 
 
-def format_program(lines: List[str], program_name: str) -> str:
-    """Formats the program, and generates a raw string to save to file
+def line_size(line: str) -> int:
+    """Returns the size of the line in the program, indented with a tab"""
+    return (len(line) if line.isascii() else len(line.encode('utf8'))) + 1
 
-    If the program is longer than MAX_PROGRAM_LENGTH then it is split into said length chunks and
-    save as subprograms formatted as <program_name>_<subprogram_index>
+
+def split_program(
+        lines: Iterable[str],
+        program_name: str,
+        budget: ProgramBudget = ProgramBudget(),
+        rules: SplitRules = SplitRules()
+) -> Iterator[List[str]]:
+    """Splits the lines into the bodies of subprograms fitting the budget
+
+    Only a single subprogram is buffered at a time. Once the next line would exceed the budget the
+    buffered lines are cut at the last layer change in the second half of the subprogram, or at the
+    last line outside of the sections, the lines after the cut start the next subprogram.
 
     Args:
-        lines (List[str]): the list os AS commands as strings
+        lines (Iterable[str]): the AS commands as strings, each ending with a newline
+        program_name (str): the name of the AS program, the subprograms are named <program_name>_<index>
+        budget (ProgramBudget): the size limits of the subprograms
+        rules (SplitRules): the sections the subprograms should not be split in
+
+    A strict section longer than the budget is kept whole, its subprogram is over the budget and a
+    warning names it. Once it is longer than MAX_SECTION_BUDGETS budgets it is cut into subprograms
+    fitting the budget instead, see SplitRules.
+
+    Raises:
+        ValueError: if a strict section over MAX_SECTION_BUDGETS budgets can not be cut
+
+    Yields:
+        List[str]: the lines of the subprograms in order
+    """
+    opening, closing = rules.opening, rules.closing
+    index = 0
+
+    buffer: List[str] = []
+    size = 0
+    is_open = False
+    oversized = False
+    # the open strict section is over MAX_SECTION_BUDGETS budgets, it is cut until it ends
+    cutting = False
+
+    # the last indices of the buffer a subprogram can end before, 0 if there is none
+    last_layer = 0
+    last_outside = 0
+
+    def mark(line: str) -> None:
+        """Stores the position before the line as a split point if it is outside of the sections"""
+        nonlocal last_layer, last_outside
+
+        if not is_open:
+            last_outside = len(buffer)
+
+            if line.startswith(LAYER_PREFIXES):
+                last_layer = len(buffer)
+
+    def add(line: str) -> None:
+        nonlocal size, is_open, cutting
+
+        mark(line)
+
+        if opening and line.startswith(opening):
+            is_open = True
+
+        elif closing and line.startswith(closing):
+            is_open = False
+            cutting = False
+
+        size += line_size(line)
+        buffer.append(line)
+
+    for line in lines:
+        available = budget.max_bytes - len(f'.PROGRAM {program_name}_{index}\n.END\n\n')
+
+        if buffer and (len(buffer) >= budget.max_steps or size + line_size(line) > available):
+            mark(line)
+
+            if last_layer >= len(buffer) * MIN_FILL:
+                split = last_layer
+
+            elif last_outside > 0:
+                split = last_outside
+
+            elif rules.strict and is_open:
+                # the buffer is a single strict section, it is only cut once it is far over the budget
+                if not cutting and (
+                        len(buffer) >= MAX_SECTION_BUDGETS * budget.max_steps
+                        or size + line_size(line) > MAX_SECTION_BUDGETS * available
+                ):
+                    cutting = True
+                    warn_cut(f'{program_name}_{index}')
+
+                split = cut_section(buffer, budget.max_steps, available, rules) if cutting else 0
+                oversized = oversized or split == 0
+
+            else:
+                split = len(buffer)
+
+            if split > 0:
+                if cutting:
+                    # the section is ended at the split and restarted by the next subprogram
+                    ending, restart = rules.cut(buffer[split - 1])
+                    buffer[split - 1] = ending
+                    buffer.insert(split, restart)
+                    oversized = False
+
+                if oversized:
+                    warn_oversized(buffer[:split], f'{program_name}_{index}', budget)
+                    oversized = False
+
+                yield buffer[:split]
+                index += 1
+
+                rest = buffer[split:]
+                buffer = []
+                size = 0
+                last_layer = last_outside = 0
+
+                # the rest starts at a split point, so it starts outside of the sections
+                if rest:
+                    is_open = False
+
+                    for rest_line in rest:
+                        add(rest_line)
+
+        add(line)
+
+    if buffer:
+        if oversized:
+            warn_oversized(buffer, f'{program_name}_{index}' if index > 0 else program_name, budget)
+
+        yield buffer
+
+
+def cut_section(buffer: List[str], max_steps: int, available: int, rules: SplitRules) -> int:
+    """Returns the length of the longest start of the buffered section that fits the budget once cut
+
+    Raises:
+        ValueError: if the section can not be cut within the budget
+    """
+    size = 0
+    split = 0
+
+    for index, line in enumerate(buffer[:max_steps]):
+        cut = rules.cut(line) if rules.cut is not None else None
+
+        if cut is not None and size + line_size(cut[0]) <= available:
+            split = index + 1
+
+        size += line_size(line)
+
+        if size > available:
+            break
+
+    if split == 0:
+        raise ValueError(
+            f'A section of the program is longer than {MAX_SECTION_BUDGETS} subprograms and can not be split'
+        )
+
+    return split
+
+
+def warn_cut(name: str) -> None:
+    """Warns that a section of the subprogram is cut, as it is far over the budget"""
+    echo(
+        f'[{Fore.YELLOW}Warning{Fore.RESET}]: A section starting in the subprogram {name} is longer than '
+        f'{MAX_SECTION_BUDGETS} subprograms, it is ended and restarted at the splits.'
+    )
+
+
+def warn_oversized(lines: List[str], name: str, budget: ProgramBudget) -> None:
+    """Warns that the subprogram is over the budget, as its section could not be split"""
+    size = sum(map(line_size, lines)) + len(f'.PROGRAM {name}\n.END\n\n')
+
+    echo(
+        f'[{Fore.YELLOW}Warning{Fore.RESET}]: The subprogram {name} has {len(lines)} steps and {size} bytes, '
+        f'over the budget of {budget.max_steps} steps and {budget.max_bytes} bytes, as a section of it can not '
+        'be split. The controller may not load it.'
+    )
+
+
+def write_program(
+        lines: Iterable[str],
+        program_name: str,
+        file: TextIO,
+        budget: ProgramBudget = ProgramBudget(),
+        rules: SplitRules = SplitRules(),
+        subprogram_dir: Path | None = None
+) -> int:
+    """Writes the program straight to the output file while the lines are generated
+
+    Only a single subprogram is buffered at a time: if the program fits the budget it is written as a
+    single program, otherwise every subprogram is named <program_name>_<subprogram_index> and a driver
+    program calling them is appended at the end.
+
+    Args:
+        lines (Iterable[str]): the AS commands as strings, each ending with a newline
         program_name (str): the name of the AS program
+        file (TextIO): the opened output file
+        budget (ProgramBudget): the size limits of the subprograms
+        rules (SplitRules): the sections the subprograms should not be split in
+        subprogram_dir (Path | None): if given, every subprogram is written to its own
+            <program_name>_<subprogram_index>.pg file in the directory, and only the driver program is
+            written to the output file
 
     Returns:
-        str: the formatted string output of the program
+        int: the number of subprograms written, 0 if the program was not split
     """
-    as_program = ""
+    subprograms = split_program(lines, program_name, budget, rules)
+    chunk = next(subprograms, [])
+    next_chunk = next(subprograms, None)
 
-    if len(lines) < MAX_PROGRAM_LENGTH:
-        as_program = f".PROGRAM {program_name}\n"
+    if next_chunk is None:
+        file.write(f".PROGRAM {program_name}\n")
+        file.writelines('\t' + line for line in chunk)
+        file.write(".END")
+        return 0
 
-        for line in lines:
-            as_program += '\t' + line
+    subprogram_number = 0
 
-        as_program += ".END"
-        return as_program
+    while chunk is not None:
+        name = f'{program_name}_{subprogram_number}'
 
-    subprogram_number = ceil(len(lines) / MAX_PROGRAM_LENGTH)
+        if subprogram_dir is None:
+            write_subprogram(chunk, name, file)
 
-    for i in range(subprogram_number):
-        as_program += f".PROGRAM {program_name}_{i}\n"
-        as_program += "\t".join(
-            lines[i * MAX_PROGRAM_LENGTH: (i + 1) * MAX_PROGRAM_LENGTH]
-        )
-        as_program += ".END\n\n"
+        else:
+            with open(subprogram_dir.joinpath(name + PROGRAM_SUFFIX), 'w', encoding='utf8') as f_open:
+                write_subprogram(chunk, name, f_open)
+
+        subprogram_number += 1
+        chunk, next_chunk = next_chunk, next(subprograms, None)
 
-    as_program += f".PROGRAM {program_name}\n"
+    file.write(f".PROGRAM {program_name}\n")
 
     for i in range(subprogram_number):
-        as_program += f"\tCALL {program_name}_{i}\n"
+        file.write(f"\tCALL {program_name}_{i}\n")
+
+    file.write(".END\n")
+
+    return subprogram_number
+
 
-    as_program += ".END\n"
+def write_subprogram(lines: List[str], name: str, file: TextIO) -> None:
+    """Writes the lines as a subprogram of the name"""
+    file.write(f".PROGRAM {name}\n")
+    file.writelines('\t' + line for line in lines)
+    file.write(".END\n\n")
+
+
+def format_program(
+        lines: Iterable[str],
+        program_name: str,
+        budget: ProgramBudget = ProgramBudget(),
+        rules: SplitRules = SplitRules()
+) -> str:
+    """Formats the program, and generates a raw string to save to file
+
+    If the program does not fit the budget then it is split into subprograms formatted as
+    <program_name>_<subprogram_index>, see write_program.
+
+    Args:
+        lines (Iterable[str]): the AS commands as strings
+        program_name (str): the name of the AS program
+        budget (ProgramBudget): the size limits of the subprograms
+        rules (SplitRules): the sections the subprograms should not be split in
+
+    Returns:
+        str: the formatted string output of the program
+    """
+    as_program = StringIO()
+    write_program(lines, program_name, as_program, budget, rules)
 
-    return as_program
+    return as_program.getvalue()
@@ -0,0 +1,378 @@
+"""Non-interactive commands of the script, e.g. for build servers"""
+
+import os
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Dict, Tuple
+
+import click
+from colorama import Fore
+
+from gcode2as import __version__
+from gcode2as.cli.modes import MODES
+from gcode2as.simplify import SIMPLIFICATIONS, SIMPLIFY_DISTANCE
+
+if TYPE_CHECKING:
+    from gcode2as.batch import JobResult
+
+
+def parse_settings(settings: Tuple[str, ...]) -> Dict[str, str]:
+    """Parses the KEY=VALUE pairs of the mode specific options"""
+    parsed = {}
+
+    for setting in settings:
+        key, separator, value = setting.partition('=')
+
+        if not separator or not key.strip():
+            raise click.BadParameter(f'"{setting}" is not in KEY=VALUE format', param_hint='--set')
+
+        parsed[key.strip()] = value.strip()
+
+    return parsed
+
+
+def merge_options(profile: Dict[str, Any], **options: Any) -> Dict[str, Any]:
+    """Returns the values of the profile with the given command line options merged in"""
+    return {**profile, **{key: value for key, value in options.items() if value is not None}}
+
+
+def echo_result(result: 'JobResult', verbose: bool) -> None:
+    """Prints the status of a converted file, and its log if verbose"""
+    if result.cached:
+        status = f'{Fore.CYAN}CACHED{Fore.RESET}'
+
+    elif result.succeeded:
+        status = f'{Fore.GREEN}OK{Fore.RESET}    '
+
+    else:
+        status = f'{Fore.RED}FAILED{Fore.RESET}'
+
+    click.echo(f'{status} {result.elapsed:8.2f}s  {result.input_path} -> {result.output_path}')
+
+    if result.error is not None:
+        click.echo(f'\t{result.error}', err=True)
+
+    if verbose and result.log:
+        click.echo(result.log)
+
+
+@click.group()
+@click.version_option(__version__)
+def cli():
+    """Converts G-code files to AS programs without user interaction"""
+
+
+@cli.command()
+@click.argument('files', nargs=-1, required=True)
+@click.option('-m', '--mode', type=click.Choice(list(MODES)), help="The conversion mode")
+@click.option('-p', '--profile', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help="JSON or TOML file with the options, the command line overrides its values")
+@click.option('--min-distance', type=float, help="Minimum distance for simplifying the toolpaths")
+@click.option('--simplification', type=click.Choice(SIMPLIFICATIONS), help="Toolpath simplification")
+@click.option('--tolerance', type=float, help="Maximum deviation of the simplified toolpaths")
+@click.option('--precision', type=click.FloatRange(min=0, min_open=True),
+              help="Round the coordinates to the multiples of this precision in mm, e.g. 0.01")
+@click.option('--arc-tolerance', type=click.FloatRange(min=0, min_open=True),
+              help="Replace the moves lying on a circle within this tolerance in mm with arcs, e.g. 0.02")
+@click.option('--max-steps', type=click.IntRange(min=1), help="Maximum number of steps of the subprograms")
+@click.option('--max-bytes', type=click.IntRange(min=1), help="Maximum size of the subprograms in bytes")
+@click.option('--split-files', is_flag=True, default=None,
+              help="Write every subprogram to its own file next to the driver program")
+@click.option('-O', '--optimize', is_flag=True, default=None,
+              help="Remove the redundant instructions from the generated programs")
+@click.option('--estimate', is_flag=True, default=None,
+              help="Add the estimated cycle time of every program to its log (shown with -v)")
+@click.option('-s', '--set', 'settings', multiple=True, metavar='KEY=VALUE',
+              help="Mode specific option, e.g. extrude=2001 (can be repeated)")
+@click.option('-o', '--output-dir', type=click.Path(file_okay=False, path_type=Path),
+              help="Directory for the generated files, defaults to the directory of each input")
+@click.option('-j', '--jobs', type=click.IntRange(min=1), help="Number of worker processes")
+@click.option('-v', 'verbose', is_flag=True, default=None, help="More verbosity in the generated code")
+@click.option('--mmap', is_flag=True, default=None,
+              help="Parse the files from a memory mapping instead of reading them as text")
+@click.option('--pipeline', is_flag=True, default=None,
+              help="Read and write the files in threads running alongside the conversion")
+@click.option('--no-cache', is_flag=True, default=False, help="Convert the files even if they are cached")
+@click.option('-i', '--incremental', is_flag=True, default=None,
+              help="Only convert the layers that changed since the last conversion of each file")
+@click.pass_context
+def batch(
+        ctx: click.Context,
+        files: Tuple[str, ...],
+        mode: str | None,
+        profile: Path | None,
+        min_distance: float | None,
+        simplification: str | None,
+        tolerance: float | None,
+        precision: float | None,
+        arc_tolerance: float | None,
+        max_steps: int | None,
+        max_bytes: int | None,
+        split_files: bool | None,
+        optimize: bool | None,
+        estimate: bool | None,
+        settings: Tuple[str, ...],
+        output_dir: Path | None,
+        jobs: int | None,
+        verbose: bool | None,
+        mmap: bool | None,
+        pipeline: bool | None,
+        no_cache: bool,
+        incremental: bool | None
+):
+    """Converts the FILES (paths or glob patterns) in parallel"""
+    # the conversion is only imported once the command runs, so the help and the errors are fast
+    from gcode2as.batch import expand_paths, load_profile, profile_job, run_jobs
+    from gcode2as.cache import default_cache_dir
+
+    values = merge_options(
+        load_profile(profile) if profile is not None else {},
+        mode=mode,
+        min_distance=min_distance,
+        simplification=simplification,
+        tolerance=tolerance,
+        precision=precision,
+        arc_tolerance=arc_tolerance,
+        max_steps=max_steps,
+        max_bytes=max_bytes,
+        split_files=split_files,
+        optimize=optimize,
+        estimate=estimate,
+        output_dir=output_dir,
+        jobs=jobs,
+        verbose=verbose,
+        incremental=incremental,
+        pipeline=pipeline,
+        mmap=mmap
+    )
+    values['settings'] = {**values.get('settings', {}), **parse_settings(settings)}
+
+    if values.get('mode') not in MODES:
+        raise click.BadParameter(f'the mode must be one of {", ".join(MODES)}', param_hint='--mode')
+
+    output_dir = values.get('output_dir')
+    workers = values.get('jobs', os.cpu_count() or 1)
+
+    paths = expand_paths(files)
+
+    if not paths:
+        raise click.BadParameter('no input file found', param_hint='FILES')
+
+    conversion_jobs = []
+
+    for path in paths:
+        out_dir = Path(output_dir) if output_dir is not None else path.absolute().parent
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        conversion_jobs.append(
+            profile_job(
+                values,
+                path,
+                out_dir.joinpath(f'{path.stem}.pg'),
+                cache_dir=None if no_cache else str(default_cache_dir())
+            )
+        )
+
+    # a single file is split at its layers, otherwise the files are converted in parallel
+    if len(conversion_jobs) > 1:
+        workers = min(workers, len(conversion_jobs))
+
+    start = perf_counter()
+    failed = 0
+
+    for result in run_jobs(conversion_jobs, workers):
+        echo_result(result, conversion_jobs[0].verbose)
+
+        if not result.succeeded:
+            failed += 1
+
+    click.echo(
+        f'Converted {len(conversion_jobs) - failed} of {len(conversion_jobs)} files '
+        f'in {perf_counter() - start:.2f}s with {workers} workers'
+    )
+
+    ctx.exit(1 if failed else 0)
+
+
+@cli.command()
+@click.option('-w', '--watch', 'folders', multiple=True, required=True, metavar='FOLDER PROFILE',
+              type=(click.Path(exists=True, file_okay=False, path_type=Path),
+                    click.Path(exists=True, dir_okay=False, path_type=Path)),
+              help="A folder to watch and the profile its files are converted with (can be repeated)")
+@click.option('-o', '--output-dir', type=click.Path(file_okay=False, path_type=Path),
+              help="Directory for the generated files of the profiles without output_dir, "
+                   "defaults to the watched folder")
+@click.option('-j', '--jobs', type=click.IntRange(min=1), help="Number of worker processes")
+@click.option('--interval', type=click.FloatRange(min=0, min_open=True), default=1.0, show_default=True,
+              help="Seconds between two scans of the folders")
+@click.option('--no-cache', is_flag=True, default=False, help="Convert the files even if they are cached")
+def watch(
+        folders: Tuple[Tuple[Path, Path], ...],
+        output_dir: Path | None,
+        jobs: int | None,
+        interval: float,
+        no_cache: bool
+):
+    """Converts the new and changed G-code files of the folders until interrupted"""
+    import signal
+    from threading import Event
+
+    from gcode2as.batch import load_profile
+    from gcode2as.cache import default_cache_dir
+    from gcode2as.watch import FolderWatcher, WatchedFolder
+
+    watched = []
+
+    for directory, profile in folders:
+        values = load_profile(profile)
+
+        if values.get('mode') not in MODES:
+            raise click.BadParameter(
+                f'the mode of {profile} must be one of {", ".join(MODES)}', param_hint='--watch'
+            )
+
+        folder_output = values.get('output_dir', output_dir)
+        watched.append(WatchedFolder(directory, values, Path(folder_output) if folder_output is not None else None))
+
+    workers = jobs or os.cpu_count() or 1
+    cache_dir = None if no_cache else str(default_cache_dir())
+
+    # a service manager stops the watcher with SIGTERM, a terminal with Ctrl+C
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    click.echo(f'Watching {len(watched)} folders with {workers} workers, press Ctrl+C to stop')
+
+    with FolderWatcher(watched, workers, cache_dir) as watcher:
+        try:
+            for result in watcher.watch(stop, interval):
+                echo_result(result, False)
+
+        except KeyboardInterrupt:
+            pass
+
+        click.echo(f'Stopped with {watcher.pending} files pending')
+
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help="Address to listen on")
+@click.option('--port', type=click.IntRange(min=0, max=65535), default=8080, show_default=True,
+              help="Port to listen on")
+@click.option('-p', '--profile', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help="JSON or TOML file with the default options, the options of the requests override its values")
+@click.option('-j', '--jobs', type=click.IntRange(min=1), help="Number of worker processes")
+@click.option('-q', '--quiet', is_flag=True, default=False, help="Do not log the requests")
+def serve(host: str, port: int, profile: Path | None, jobs: int | None, quiet: bool):
+    """Converts the G-code uploaded over HTTP until interrupted"""
+    import signal
+    from threading import Thread
+
+    from gcode2as.batch import load_profile
+    from gcode2as.server import ConversionServer
+
+    workers = jobs or os.cpu_count() or 1
+    server = ConversionServer(
+        (host, port), workers, load_profile(profile) if profile is not None else None, log_requests=not quiet
+    )
+
+    # shutdown waits for serve_forever, so it can not be called by the handler in the same thread
+    signal.signal(signal.SIGTERM, lambda *_: Thread(target=server.shutdown).start())
+
+    click.echo(
+        f'Serving on http://{server.server_address[0]}:{server.server_address[1]} with {workers} workers, '
+        'press Ctrl+C to stop'
+    )
+
+    with server:
+        try:
+            server.serve_forever()
+
+        except KeyboardInterrupt:
+            pass
+
+    click.echo('Stopped')
+
+
+@cli.command('fake-controller')
+@click.option('--host', default='127.0.0.1', show_default=True, help="Address to listen on")
+@click.option('--port', type=click.IntRange(min=0, max=65535), default=2323, show_default=True,
+              help="Port to listen on")
+@click.option('--replay', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help="Answer with a recorded transcript instead of emulating the terminal")
+@click.option('--forward', metavar='HOST[:PORT]',
+              help="Forward the sessions to a real controller instead of emulating the terminal")
+@click.option('--record', type=click.Path(dir_okay=False, writable=True, path_type=Path),
+              help="Save the transcript of the last session to this JSON file when stopped")
+def fake_controller(host: str, port: int, replay: Path | None, forward: str | None, record: Path | None):
+    """Listens like the AS terminal of a controller, for testing the uploads offline"""
+    import signal
+    from threading import Thread
+
+    from gcode2as.controller import ControllerSettings
+    from gcode2as.fake_controller import FakeController, load_transcript
+
+    if replay is not None and forward is not None:
+        raise click.BadParameter('a transcript can not be replayed while forwarding', param_hint='--replay')
+
+    target = None
+
+    if forward is not None:
+        settings = ControllerSettings.parse(forward)
+        target = (settings.host, settings.port)
+
+    server = FakeController((host, port), load_transcript(replay) if replay is not None else None, target)
+    signal.signal(signal.SIGTERM, lambda *_: Thread(target=server.shutdown).start())
+
+    click.echo(f'Listening on {server.server_address[0]}:{server.server_address[1]}, press Ctrl+C to stop')
+
+    with server:
+        try:
+            server.serve_forever()
+
+        except KeyboardInterrupt:
+            pass
+
+    for name, steps in server.programs.items():
+        click.echo(f'{name}: {len(steps)} steps')
+
+    for mismatch in server.mismatches:
+        click.echo(f'{Fore.RED}Mismatch{Fore.RESET}: {mismatch}', err=True)
+
+    if record is not None and server.sessions:
+        server.save_transcript(record)
+        click.echo(f'Saved the transcript as {Fore.GREEN}{record}{Fore.RESET}')
+
+
+@cli.command()
+@click.option('-m', '--mode', 'modes', type=click.Choice(list(MODES)), multiple=True,
+              help="The modes to measure (can be repeated), defaults to all of them")
+@click.option('-n', '--lines', 'sizes', type=click.IntRange(min=10), multiple=True,
+              help="The number of G-code lines to convert (can be repeated), defaults to 10k to 10M")
+@click.option('--simplification', type=click.Choice(SIMPLIFICATIONS), default=SIMPLIFY_DISTANCE,
+              help="Toolpath simplification")
+@click.option('-o', '--output', type=click.File('w'), default='-', help="File for the JSON results")
+def benchmark(modes: Tuple[str, ...], sizes: Tuple[int, ...], simplification: str, output):
+    """Measures the conversion of synthetic G-code of every mode"""
+    from gcode2as.benchmark import DEFAULT_SIZES, GENERATORS, BenchmarkCase, dump_results, run_benchmark
+
+    cases = [
+        BenchmarkCase(mode, size, simplification=simplification)
+        for mode in modes or GENERATORS
+        for size in sizes or DEFAULT_SIZES
+    ]
+
+    results = []
+
+    for result in run_benchmark(cases):
+        results.append(result)
+        click.echo(
+            f'{result.case.mode:<6} {result.case.lines:>10} lines {result.seconds:8.2f}s '
+            f'{result.lines_per_second:10.0f} lines/s {result.output_lines:>9} AS lines',
+            err=True
+        )
+
+    dump_results(results, output)
+
+
+if __name__ == "__main__":
+    cli()
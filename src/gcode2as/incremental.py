@@ -0,0 +1,295 @@
+"""Module for re-converting only the layers of a file that changed since its last conversion
+
+The file is split into layers after travel moves, where the modes have emitted their buffered weld
+or path, so the state carried into a layer is small. Every layer is fingerprinted by its content,
+and its converted output is stored with its fingerprint, a hash of the state the conversion entered
+the layer with and the state it left the layer with. When the file is converted again with the same
+settings, a layer whose content is unchanged and which is entered with a state of the same hash is
+not converted again: its stored output is reused and the conversion continues from its stored exit
+state. The output is the same as that of a full conversion.
+"""
+
+import hashlib
+import os
+import pickle
+from dataclasses import dataclass, replace
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+from uuid import uuid4
+
+from click import echo
+from colorama import Fore
+
+from gcode2as.cache import TEMPORARY_SUFFIX, ConversionCache
+from gcode2as.cli import CLICommand, CLICommandOptions
+from gcode2as.converter import ConversionStats
+from gcode2as.parallel import State, chunk_file, is_travel
+
+# the travels only end a layer once it is at least this large, so a layer is not stored for every
+# contour of a laser cut
+MIN_LAYER_SIZE = 1 << 12
+
+INDEX_SUFFIX = '.layers'
+OUTPUT_SUFFIX = '.as'
+
+
+@dataclass
+class Layer:
+    """A range of lines of the file, the offsets are in bytes"""
+    start: int
+    end: int
+    fingerprint: str
+
+
+@dataclass
+class LayerRecord:
+    """The stored conversion of a layer, its output is a range of bytes in the output file
+
+    The entry state is only stored as its hash, see state_hash.
+    """
+    fingerprint: str
+    final: bool
+    entry: str
+    exit: State
+    stats: ConversionStats
+    offset: int
+    length: int
+
+
+def state_hash(state: State) -> str:
+    """Returns a compact hash of a state returned by CLICommand.snapshot
+
+    The hash is that of the representation of the state, so it does not depend on which of its values
+    are the same objects.
+    """
+    return hashlib.blake2b(repr(state).encode('utf8'), digest_size=16).hexdigest()
+
+
+def fingerprint_layers(path: str) -> List[Layer]:
+    """Splits the file into layers and fingerprints each of them by its content
+
+    A layer ends after a travel move, once it is at least MIN_LAYER_SIZE large. The boundaries only
+    depend on the content before them, so an edit only changes the fingerprints of the layers around
+    it.
+    """
+    layers: List[Layer] = []
+    digest = hashlib.blake2b(digest_size=16)
+    start = 0
+    offset = 0
+
+    with open(path, 'rb') as file:
+        for line in file:
+            digest.update(line)
+            offset += len(line)
+
+            if offset - start >= MIN_LAYER_SIZE and is_travel(line):
+                layers.append(Layer(start, offset, digest.hexdigest()))
+                digest = hashlib.blake2b(digest_size=16)
+                start = offset
+
+    if offset > start or not layers:
+        layers.append(Layer(start, offset, digest.hexdigest()))
+
+    return layers
+
+
+class LayerStore:
+    """The converted layers of the last conversion of a program, stored in the conversion cache
+
+    The index of the layers names the output file its offsets point into, so an index is never read
+    with the output of another conversion.
+    """
+
+    def __init__(self, cache: ConversionCache, key: str) -> None:
+        self.__cache = cache
+        self.__key = key
+        self.__index_path = cache.directory.joinpath(f'{key}{INDEX_SUFFIX}')
+        self.__output_name: str | None = None
+
+    @property
+    def directory(self) -> Path:
+        return self.__cache.directory
+
+    def load(self) -> Dict[Tuple[str, bool], List[LayerRecord]]:
+        """Returns the stored layers by their fingerprint and whether they ended the file"""
+        records: Dict[Tuple[str, bool], List[LayerRecord]] = {}
+
+        try:
+            with open(self.__index_path, 'rb') as index:
+                self.__output_name, stored = pickle.load(index)
+
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return records
+
+        for record in stored:
+            records.setdefault((record.fingerprint, record.final), []).append(record)
+
+        return records
+
+    def open_output(self) -> BinaryIO | None:
+        """Opens the output of the loaded layers, None if there is none"""
+        if self.__output_name is None:
+            return None
+
+        try:
+            return open(self.directory.joinpath(self.__output_name), 'rb')
+
+        except OSError:
+            return None
+
+    def save(self, records: List[LayerRecord], output: Path) -> None:
+        """Replaces the stored layers with those of the new conversion and its output file"""
+        output_name = f'{self.__key}-{uuid4().hex}{OUTPUT_SUFFIX}'
+        os.replace(output, self.directory.joinpath(output_name))
+
+        with NamedTemporaryFile(dir=self.directory, suffix=TEMPORARY_SUFFIX, delete=False) as index:
+            pickle.dump((output_name, records), index, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(index.name, self.__index_path)
+
+        if self.__output_name is not None:
+            self.directory.joinpath(self.__output_name).unlink(missing_ok=True)
+
+        self.__output_name = output_name
+        self.__cache.evict()
+
+
+def split_lines(text: str) -> List[str]:
+    """Splits the stored output of a layer into its lines, keeping the line feeds
+
+    Unlike str.splitlines, only the line feeds end a line: the other line boundaries of Unicode, like
+    the form feed, can be part of the comments copied into the program.
+    """
+    lines = text.split('\n')
+    rest = lines.pop()
+
+    return [f'{line}\n' for line in lines] + ([rest] if rest else [])
+
+
+def convert_incremental(mode: CLICommand, options: CLICommandOptions, store: LayerStore) -> Iterator[str]:
+    """Converts the file of the options, reusing the stored layers of its last conversion
+
+    The output is the same as that of mode.convert(options), and the layers of this conversion are
+    stored for the next one once the whole file is converted. A conversion stopped by an error keeps
+    the lines converted before it, but its layers are not stored.
+
+    Args:
+        mode (CLICommand): the configured mode of the conversion
+        options (CLICommandOptions): the options of the conversion, the file must be opened from a path
+        store (LayerStore): the layers of the last conversion with the same settings
+
+    Yields:
+        str: the converted AS lines in file order
+    """
+    path = options.file.name
+    layers = fingerprint_layers(path)
+    stored = store.load()
+    last_index = len(layers) - 1
+
+    mode.error = None
+    error: str | None = None
+    as_length = 0
+
+    for line in mode.header():
+        as_length += 1
+        yield line
+
+    # the layers are converted by separate converters, the progress is updated once per layer
+    layer_options = replace(options, progress=None)
+
+    # the state before the first layer is that of a new converter
+    mode.prepare(replace(layer_options, file=iter(())))
+    state = mode.snapshot()
+
+    stats = ConversionStats()
+    records: List[LayerRecord] = []
+    reused = 0
+
+    store.directory.mkdir(parents=True, exist_ok=True)
+    stored_output = store.open_output()
+    output = NamedTemporaryFile(dir=store.directory, suffix=TEMPORARY_SUFFIX, delete=False)
+
+    try:
+        with output:
+            for index, layer in enumerate(layers):
+                final = index == last_index
+                entry = state_hash(state)
+
+                # the stored output is only valid if the layer was entered with the same state
+                record = next(
+                    (
+                        record for record in stored.get((layer.fingerprint, final), [])
+                        if stored_output is not None and record.entry == entry
+                    ),
+                    None
+                )
+
+                if record is not None:
+                    stored_output.seek(record.offset)
+                    text = stored_output.read(record.length).decode('utf8')
+                    exit_state = record.exit
+                    layer_stats = record.stats
+                    reused += 1
+
+                else:
+                    converter = mode.prepare(
+                        replace(layer_options, file=chunk_file(path, layer.start, layer.end, options.mapped))
+                    )
+                    mode.restore(state)
+
+                    lines: List[str] = []
+
+                    try:
+                        for line in converter.stream(final=final):
+                            lines.append(line)
+
+                        if final:
+                            lines.extend(mode.finish())
+
+                    except ValueError as stopped:
+                        # the conversion stops at the error as in Metal.convert, the lines before it are kept
+                        error = str(stopped)
+                        yield from lines
+                        break
+
+                    text = ''.join(lines)
+                    exit_state = mode.snapshot()
+                    layer_stats = converter.stats
+
+                data = text.encode('utf8')
+                records.append(
+                    LayerRecord(layer.fingerprint, final, entry, exit_state, layer_stats, output.tell(), len(data))
+                )
+                output.write(data)
+
+                state = exit_state
+                stats += layer_stats
+
+                if options.progress is not None:
+                    options.progress.update(layer.end)
+
+                lines = split_lines(text)
+                as_length += len(lines)
+                yield from lines
+
+    except BaseException:
+        Path(output.name).unlink(missing_ok=True)
+        raise
+
+    finally:
+        if stored_output is not None:
+            stored_output.close()
+
+    if error is not None:
+        Path(output.name).unlink(missing_ok=True)
+        mode.stop(options, error)
+        return
+
+    store.save(records, Path(output.name))
+
+    echo(
+        f'[{Fore.BLUE}Info{Fore.RESET}]: Reused {reused} of {len(layers)} layers of the last conversion'
+    )
+
+    mode.complete(options, stats, as_length)
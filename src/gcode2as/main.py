@@ -1,22 +1,29 @@
 """Main module of the script"""
 
 import io
+import json
+import shutil
+from contextlib import nullcontext
+from dataclasses import replace
 from pathlib import Path
-from typing import Dict, List
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Dict, List
 import click
 from colorama import Back, Fore
-import inquirer
 
-from pyfiglet import Figlet
 from gcode2as.cli import CLICommand, CLICommandOptions
-from gcode2as.cli.fdm import FDM
-from gcode2as.cli.laser_cut import LaserCut
-from gcode2as.cli.metal import Metal
-from gcode2as.formatter import format_program
+from gcode2as.cli.modes import MODES
+from gcode2as.formatter import MAX_PROGRAM_BYTES, MAX_PROGRAM_LENGTH
+from gcode2as.simplify import DEFAULT_MIN_DISTANCE, DEFAULT_TOLERANCE, SIMPLIFY_DISTANCE, SIMPLIFY_TOLERANCE
 
 
 from gcode2as import __version__
 
+if TYPE_CHECKING:
+    from gcode2as.cache import ConversionCache
+    from gcode2as.controller import ControllerSettings
+    from gcode2as.estimate import CycleEstimate
+
 FILE_PATH = "file_path"
 OUTPUT_PATH = "output_file_dir"
 MIN_DIST = "minimum_distance"
@@ -25,25 +32,97 @@ RETRACT_SIGNAL = "retract_signal"
 OVERRIDE_SPEED = "override_speed"
 DEBUG_MODE = "debug_mode"
 
-DEFAULT_MIN_DISTANCE = 2
-
 
 @click.command
 @click.argument('file', type=click.File())
 @click.option('-d', is_flag=True, default=False, help="Use the default values for the options")
 @click.option('-v', is_flag=True, default=False, help="More verbosity in the generated code")
-def cli(file: io.TextIOWrapper, d: bool, v: bool):
+@click.option('--precision', type=click.FloatRange(min=0, min_open=True),
+              help="Round the coordinates to the multiples of this precision in mm, e.g. 0.01")
+@click.option('--arc-tolerance', type=click.FloatRange(min=0, min_open=True),
+              help="Replace the moves lying on a circle within this tolerance in mm with arcs, e.g. 0.02")
+@click.option('--max-steps', type=click.IntRange(min=1), default=MAX_PROGRAM_LENGTH, show_default=True,
+              help="Maximum number of steps of the subprograms the program is split into")
+@click.option('--max-bytes', type=click.IntRange(min=1), default=MAX_PROGRAM_BYTES, show_default=True,
+              help="Maximum size of the subprograms in bytes")
+@click.option('--split-files', is_flag=True, default=False,
+              help="Write every subprogram to its own file next to the driver program")
+@click.option('-O', '--optimize', is_flag=True, default=False,
+              help="Remove the redundant instructions from the generated program")
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              help="Number of worker processes converting the layers of the file in parallel")
+@click.option('--mmap', is_flag=True, default=False,
+              help="Parse the file from a memory mapping instead of reading it as text")
+@click.option('--pipeline', is_flag=True, default=False,
+              help="Read and write the files in threads running alongside the conversion")
+@click.option('--no-cache', is_flag=True, default=False, help="Convert the file even if it is cached")
+@click.option('-i', '--incremental', is_flag=True, default=False,
+              help="Only convert the layers that changed since the last conversion of the file")
+@click.option('--controller', metavar='HOST[:PORT]',
+              help="Also load the program on the controller through its AS terminal while it is generated")
+@click.option('--estimate', type=click.Path(dir_okay=False, writable=True, path_type=Path),
+              help="Write the estimated path length and time of every layer to this CSV file")
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True, path_type=Path),
+              help="Write the timings of the conversion stages to this JSON file")
+@click.option('-q', '--no-banner', is_flag=True, default=False, help="Do not display the banner")
+def cli(
+        file: io.TextIOWrapper,
+        d: bool,
+        v: bool,
+        precision: float | None,
+        arc_tolerance: float | None,
+        max_steps: int,
+        max_bytes: int,
+        split_files: bool,
+        optimize: bool,
+        jobs: int,
+        mmap: bool,
+        pipeline: bool,
+        no_cache: bool,
+        incremental: bool,
+        controller: str | None,
+        estimate: Path | None,
+        profile: Path | None,
+        no_banner: bool
+):
+    # the user interface and the conversion are only imported once the arguments are valid, so the
+    # help and the argument errors are shown quickly
+    import inquirer
+
+    from gcode2as.cache import ConversionCache, cache_key
+    from gcode2as.profiling import Profiler
+
+    controller_settings = None
+
+    if controller is not None:
+        from gcode2as.controller import ControllerSettings
+
+        if split_files:
+            raise click.BadParameter(
+                'the subprogram files can not be loaded on the controller', param_hint='--controller'
+            )
+
+        try:
+            controller_settings = ControllerSettings.parse(controller)
+
+        except ValueError as error:
+            raise click.BadParameter(str(error), param_hint='--controller') from error
 
     # display fancy logo
-    click.echo(Figlet(justify='center').renderText("gcode2as by Lasram"))
+    if not no_banner:
+        from pyfiglet import Figlet
 
-    modes: List[CLICommand] = [FDM(), Metal(), LaserCut()]
+        click.echo(Figlet(justify='center').renderText("gcode2as by Lasram"))
+
+    modes: List[CLICommand] = [mode() for mode in MODES.values()]
 
     filepath = Path(file.name)
     filename = filepath.stem
 
     mode_key = 'mode'
+    simplification_key = 'simplification'
     min_distance_key = 'min_dist'
+    tolerance_key = 'tolerance'
     use_different_output_key = 'use_different_output'
     out_dir_key = 'output'
 
@@ -53,11 +132,27 @@ def cli(file: io.TextIOWrapper, d: bool, v: bool):
             mode_key,
             message='What mode would you like to use?',
             choices=[mode.message for mode in modes]),
+        inquirer.List(
+            simplification_key,
+            message='How should the toolpaths be simplified?',
+            choices=[
+                ('Skip the moves shorter than a minimum distance', SIMPLIFY_DISTANCE),
+                ('Keep the path within a maximum deviation', SIMPLIFY_TOLERANCE)
+            ],
+            default=SIMPLIFY_DISTANCE,
+            ignore=d
+        ),
         inquirer.Text(
             min_distance_key,
             message="Enter the minimum distance for simplifying the toolpaths: ",
             default=DEFAULT_MIN_DISTANCE,
-            ignore=d
+            ignore=lambda answers: d or answers[simplification_key] != SIMPLIFY_DISTANCE
+        ),
+        inquirer.Text(
+            tolerance_key,
+            message="Enter the maximum deviation from the toolpath: ",
+            default=DEFAULT_TOLERANCE,
+            ignore=lambda answers: d or answers[simplification_key] != SIMPLIFY_TOLERANCE
         ),
         inquirer.Confirm(
             use_different_output_key,
@@ -82,28 +177,193 @@ def cli(file: io.TextIOWrapper, d: bool, v: bool):
                 answers[mode_key]][0]  # the list should only have one element
 
     min_distance = answers[min_distance_key]
+    tolerance = answers[tolerance_key]
     out_dir = answers.get(out_dir_key)
 
-    lines_as = selected.execute(
-        options=CLICommandOptions(
-            file=file,
-            min_distance=float(min_distance),
-            verbose=v
-        )
-    )
+    settings = selected.ask()
 
-    if lines_as is None:
+    if settings is None:
         return
 
-    formatted = format_program(lines_as, filename)
+    options = CLICommandOptions(
+        file=file,
+        min_distance=float(min_distance),
+        verbose=v,
+        simplification=answers[simplification_key],
+        tolerance=float(tolerance),
+        precision=precision,
+        arc_tolerance=arc_tolerance,
+        max_steps=max_steps,
+        max_bytes=max_bytes,
+        optimize=optimize,
+        mapped=mmap,
+        profiler=Profiler() if profile is not None else None
+    )
 
     if out_dir is None:
         out_dir = filepath.absolute().parent
 
-    # save the file
     out_path = out_dir.joinpath(f'{filename}.pg')
+
+    start = perf_counter()
+
+    # the program is only estimated for the table of the layers or the profile
+    estimated = estimate is not None or options.profiler is not None
+    cycle = None
+
+    # the standard input can not be hashed before the conversion, and the cache only stores a single file
+    cache = ConversionCache() if not no_cache and filepath.is_file() and not split_files else None
+    key = cache_key(filepath, filename, selected, settings, options) if cache is not None else None
+    cached_path = cache.get(key) if cache is not None else None
+
+    if cached_path is not None:
+        shutil.copyfile(cached_path, out_path)
+        click.echo(
+            f'Saved the cached conversion as {Fore.GREEN}{out_path}{Fore.RESET}'
+        )
+
+        if controller_settings is not None:
+            from gcode2as.controller import upload_file
+
+            programs = upload_file(out_path, controller_settings)
+            click.echo(f'Loaded {len(programs)} programs on the controller')
+
+        if estimated:
+            from gcode2as.estimate import estimate_program
+
+            with open(out_path, 'r', encoding='utf8') as f_open:
+                cycle = estimate_program(f_open, selected.split_rules())
+
+    else:
+        cycle = convert(
+            selected, settings, options, out_path, jobs, incremental, cache, key, split_files, pipeline,
+            controller_settings, estimated
+        )
+
+    if cycle is not None:
+        click.echo(f'[{Fore.BLUE}Info{Fore.RESET}]: Estimated cycle time {cycle.describe()}')
+
+    if estimate is not None:
+        with open(estimate, 'w', encoding='utf8') as f_open:
+            cycle.write_table(f_open)
+
+        click.echo(f'Saved the estimate of the layers as {Fore.GREEN}{estimate}{Fore.RESET}')
+
+    if options.profiler is not None:
+        options.profiler.estimate = cycle.summary()
+        report = options.profiler.report(
+            perf_counter() - start,
+            file=str(filepath),
+            mode=type(selected).__name__,
+            cached=cached_path is not None,
+            jobs=jobs
+        )
+
+        with open(profile, 'w', encoding='utf8') as f_open:
+            json.dump(report, f_open, indent=2)
+
+        click.echo(f'Saved the profile as {Fore.GREEN}{profile}{Fore.RESET}')
+
+
+def convert(
+        selected: CLICommand,
+        settings: Dict[str, Any],
+        options: CLICommandOptions,
+        out_path: Path,
+        jobs: int,
+        incremental: bool,
+        cache: 'ConversionCache | None',
+        key: str | None,
+        split_files: bool = False,
+        pipeline: bool = False,
+        controller: 'ControllerSettings | None' = None,
+        estimated: bool = False
+) -> 'CycleEstimate | None':
+    """Converts the file of the options and saves the program, storing it in the cache if given
+
+    If the settings of a controller are given, the program is also loaded on the controller while it
+    is written.
+
+    Returns:
+        CycleEstimate | None: the estimated path lengths and times of the written program if estimated
+            is True, otherwise None
+    """
+    from gcode2as.cache import settings_key
+    from gcode2as.formatter import write_program
+    from gcode2as.incremental import LayerStore, convert_incremental
+    from gcode2as.mapped import MappedFile
+    from gcode2as.optimizer import Optimizer
+    from gcode2as.parallel import convert_layers
+    from gcode2as.pipeline import ReadAhead, WriteBehind
+    from gcode2as.profiling import Progress
+
+    filepath = Path(options.file.name)
+    filename = filepath.stem
+
+    # the progress is measured in the bytes of the file, the standard input has no known size
+    if filepath.is_file():
+        options = replace(options, progress=Progress(filepath.stat().st_size))
+
+    # the mapping replaces the reading ahead of the text
+    if options.mapped and filepath.is_file():
+        options = replace(options, file=MappedFile(str(filepath)))
+
+    elif pipeline:
+        options = replace(options, file=ReadAhead(options.file))
+
+    if incremental and cache is not None:
+        store = LayerStore(cache, settings_key(filename, selected, settings, options))
+        lines_as = convert_incremental(selected, options, store)
+
+    else:
+        lines_as = convert_layers(selected, settings, options, jobs)
+
+    optimizer = Optimizer(selected.split_rules()) if options.optimize else None
+
+    if optimizer is not None:
+        lines_as = optimizer.optimize(lines_as)
+
+    if options.profiler is not None:
+        lines_as = options.profiler.timed(lines_as, 'convert')
+
+    estimator = None
+
+    if estimated:
+        from gcode2as.estimate import CycleEstimator
+
+        estimator = CycleEstimator(selected.split_rules())
+        lines_as = estimator.observe(lines_as)
+
+    # save the file while the lines are being generated
     click.echo(
         f'Saving generated file as {Fore.GREEN}{out_path}{Fore.RESET}'
     )
-    with open(out_path, 'w', encoding='utf8') as f_open:
-        f_open.write(formatted)
+    if controller is not None:
+        from gcode2as.controller import ControllerWriter
+
+        click.echo(f'Loading the program on the controller at {controller.host}:{controller.port}')
+
+    # the pipeline also moves the waiting for the controller to the writer thread
+    with open(out_path, 'w', encoding='utf8') as f_open, \
+            (ControllerWriter(controller, f_open) if controller is not None else nullcontext(f_open)) as target, \
+            (WriteBehind(target) if pipeline else nullcontext(target)) as output:
+        write_program(
+            lines_as,
+            filename,
+            output,
+            options.budget,
+            selected.split_rules(),
+            subprogram_dir=out_path.parent if split_files else None
+        )
+
+    if optimizer is not None:
+        click.echo(f'[{Fore.BLUE}Info{Fore.RESET}]: The optimizer removed {optimizer.summary()}')
+
+        if options.profiler is not None:
+            options.profiler.optimized = optimizer.counts
+
+    # a partial program is kept for inspection, but only the finished conversions are stored
+    if cache is not None and selected.error is None:
+        cache.put(key, out_path)
+
+    return estimator.estimate() if estimator is not None else None
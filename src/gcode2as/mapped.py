@@ -0,0 +1,52 @@
+"""Module for reading the G-code from a memory-mapped file
+
+A file opened in text mode is decoded into strings line by line before it is parsed. With the
+memory-mapped input the file is mapped into memory and the lines are sliced from the pages of the
+file as bytes, which the tokenizer parses without decoding them: only the words used by the
+conversion are converted to numbers and only the comments are decoded. The records are the same as
+those of the text input, the \\r\\n newlines are handled like in text mode.
+
+A mapped file can be limited to a range of bytes, so the chunks of a parallel conversion and the
+layers of an incremental one are read from the same mapping of the page cache.
+"""
+
+import mmap
+import os
+from typing import Iterator
+
+
+class MappedFile:
+    """A G-code file, or a range of its bytes, read from a memory mapping
+
+    Iterating the file yields its lines as bytes, with their newlines.
+
+    Args:
+        path (str): the path of the G-code file
+        start (int): the offset of the first byte read, at the start of a line
+        end (int | None): the offset after the last byte read, at the start of a line or the end of
+            the file if None
+    """
+
+    def __init__(self, path: str, start: int = 0, end: int | None = None) -> None:
+        self.name = path
+        self.start = start
+        self.end = end
+
+    def __iter__(self) -> Iterator[bytes]:
+        with open(self.name, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            end = size if self.end is None else min(self.end, size)
+
+            # an empty file can not be mapped
+            if end <= self.start:
+                return
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                mapping.seek(self.start)
+                readline = mapping.readline
+                offset = self.start
+
+                while offset < end:
+                    line = readline()
+                    offset += len(line)
+                    yield line
@@ -0,0 +1,221 @@
+"""Module for the peephole optimization of the generated AS instructions
+
+The modes emit their instructions line by line as they handle the G-code, so the generated program
+can contain instructions without any effect, e.g. a SPEED repeating the current speed, a move to the
+position the robot is already at, or the laser switched off and on again without moving in between.
+The optimizer removes them in a single streaming pass after the conversion: every rule is a
+generator over the lines, looking at most a few instructions ahead, and the rules are chained in a
+pipeline. The rules count the instructions they removed.
+"""
+
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Iterator, List, Tuple, Type
+
+from gcode2as.formatter import SplitRules
+
+# the instructions moving the robot
+MOVE_INSTRUCTIONS = ('LMOVE', 'JMOVE', 'C1MOVE', 'C2MOVE', 'LWS', 'LWC', 'LWE', 'C1WC', 'C2WC', 'C2WE')
+
+# the moves to the position the robot is already at can be dropped, the weld instructions can not
+PLAIN_MOVES = ('LMOVE', 'JMOVE')
+
+# the first instruction of a circular move goes through its point, the robot stops at the second
+VIA_MOVES = ('C1MOVE', 'C1WC')
+
+MOVE_PATTERN = re.compile(r'(\w+) SHIFT\(a BY ([^)]*)\)')
+SPEED_PATTERN = re.compile(r'SPEED (\S+) (.*?)\s*(;.*)?$')
+
+
+def is_move(line: str) -> bool:
+    return line.startswith(MOVE_INSTRUCTIONS)
+
+
+def is_comment(line: str) -> bool:
+    return line.startswith(';')
+
+
+def speed_key(line: str) -> Tuple[float | str, str] | None:
+    """Returns the speed and the unit of a SPEED instruction, None for the other instructions"""
+    match = SPEED_PATTERN.match(line)
+
+    if match is None:
+        return None
+
+    value, unit, _ = match.groups()
+
+    try:
+        return float(value), unit
+
+    except ValueError:
+        return value, unit
+
+
+class PeepholeRule(ABC):
+    """A rule removing redundant instructions from the stream of the generated lines
+
+    Args:
+        sections (SplitRules): the sections of the mode, e.g. the lines switching the extruder on
+            and off
+    """
+
+    name = ''
+    description = ''
+
+    def __init__(self, sections: SplitRules) -> None:
+        self.sections = sections
+        self.removed = 0
+
+    @abstractmethod
+    def apply(self, lines: Iterable[str]) -> Iterator[str]:
+        """Yields the lines with the redundant instructions left out"""
+
+
+class RepeatedPosition(PeepholeRule):
+    """Drops the linear moves to the position the robot is already at"""
+
+    name = 'position'
+    description = 'moves to the current position'
+
+    def apply(self, lines: Iterable[str]) -> Iterator[str]:
+        position = None
+
+        for line in lines:
+            if is_move(line):
+                match = MOVE_PATTERN.match(line)
+
+                if match is not None:
+                    instruction, target = match.groups()
+
+                    if instruction in PLAIN_MOVES and target == position:
+                        self.removed += 1
+                        continue
+
+                    if instruction not in VIA_MOVES:
+                        position = target
+
+                else:
+                    # a move the position of which is not known
+                    position = None
+
+            yield line
+
+
+class RedundantSpeed(PeepholeRule):
+    """Drops the SPEED instructions setting the current speed, or overridden before the next move"""
+
+    name = 'speed'
+    description = 'redundant speed changes'
+
+    def apply(self, lines: Iterable[str]) -> Iterator[str]:
+        speed = None
+        pending: str | None = None
+
+        for line in lines:
+            key = speed_key(line)
+
+            if key is not None:
+                if pending is not None:
+                    self.removed += 1
+
+                pending = line
+                continue
+
+            if pending is not None:
+                pending_key = speed_key(pending)
+
+                if pending_key != speed:
+                    speed = pending_key
+                    yield pending
+
+                else:
+                    self.removed += 1
+
+                pending = None
+
+            yield line
+
+        if pending is not None:
+            if speed_key(pending) != speed:
+                yield pending
+
+            else:
+                self.removed += 1
+
+
+class SignalToggle(PeepholeRule):
+    """Drops a section ending and starting again without a move in between, e.g. the laser off and on
+
+    Only the SPEED instructions and comments may be between the two, they are kept.
+    """
+
+    name = 'signal'
+    description = 'signals switched off and on without a move'
+
+    def apply(self, lines: Iterable[str]) -> Iterator[str]:
+        opening, closing = self.sections.opening, self.sections.closing
+
+        if not opening or not closing:
+            yield from lines
+            return
+
+        pending: List[str] = []
+
+        for line in lines:
+            if pending:
+                if line.startswith(opening) and not is_move(line):
+                    self.removed += 2
+                    yield from pending[1:]
+                    pending = []
+                    continue
+
+                if is_comment(line) or speed_key(line) is not None:
+                    pending.append(line)
+                    continue
+
+                yield from pending
+                pending = []
+
+            if line.startswith(closing) and not is_move(line):
+                pending.append(line)
+                continue
+
+            yield line
+
+        yield from pending
+
+
+# the rules in the order they are applied, a rule can make the redundancies found by the next ones
+# adjacent, e.g. dropping a move to the current position between switching the laser off and on
+RULES: Dict[str, Type[PeepholeRule]] = {
+    rule.name: rule for rule in (RepeatedPosition, SignalToggle, RedundantSpeed)
+}
+
+
+class Optimizer:
+    """The pipeline of the peephole rules
+
+    Args:
+        sections (SplitRules): the sections of the mode
+        rules (Iterable[str]): the names of the rules to apply, all of them by default
+    """
+
+    def __init__(self, sections: SplitRules = SplitRules(), rules: Iterable[str] = tuple(RULES)) -> None:
+        selected = set(rules)
+        self.__rules = [rule(sections) for name, rule in RULES.items() if name in selected]
+
+    def optimize(self, lines: Iterable[str]) -> Iterator[str]:
+        """Chains the rules over the lines, the lines are optimized as they are consumed"""
+        for rule in self.__rules:
+            lines = rule.apply(lines)
+
+        return iter(lines)
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        """The number of instructions removed by each rule so far"""
+        return {rule.name: rule.removed for rule in self.__rules}
+
+    def summary(self) -> str:
+        """Describes the instructions removed by the rules"""
+        return ', '.join(f'{rule.removed} {rule.description}' for rule in self.__rules)
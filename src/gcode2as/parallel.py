@@ -0,0 +1,368 @@
+"""Module for converting a single file in parallel, split at its travel moves
+
+The file is cut into chunks after travel moves and the chunks are converted in a pool of worker
+processes. The state carried from one line to the next (the robot position, the extrusion or laser
+state, the buffered welds and paths...) is not known in advance for a chunk, so every worker first
+replays the lines just before its chunk to warm up the state, and converts its chunk from there. The
+buffered welds and paths are emitted at the travels, so the state after a travel is rebuilt by a
+warm-up starting at an earlier travel, even in vase mode, where a layer change is in the middle of
+a weld.
+
+The chunks are stitched together in file order: the entry state of each chunk is compared with the
+exit state of the previous one, and a chunk that started from a different state is converted again
+from the correct one. This keeps the output byte-identical to the serial conversion.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field, replace
+from io import StringIO
+from itertools import islice
+from typing import Any, BinaryIO, Dict, Iterator, List, Type
+
+from click import echo
+from colorama import Fore
+
+from gcode2as.cli import CLICommand, CLICommandOptions
+from gcode2as.converter import ConversionStats
+from gcode2as.mapped import MappedFile
+from gcode2as.profiling import Profiler
+
+# the number of chunks per worker, more chunks balance the load better
+CHUNKS_PER_WORKER = 4
+
+# files are not split into chunks smaller than this
+MIN_CHUNK_SIZE = 1 << 20
+
+# the minimum amount of G-code replayed before a chunk to recover the state at its start
+WARMUP_SIZE = 1 << 16
+
+State = Dict[str, Any]
+
+
+@dataclass
+class Chunk:
+    """A range of lines of the file, the offsets are in bytes and are always at the start of a line"""
+    start: int
+    end: int
+    warmup: int
+
+
+@dataclass
+class ChunkJob:
+    """Everything a worker process needs to convert a chunk"""
+    mode: Type[CLICommand]
+    settings: Dict[str, Any]
+    options: CLICommandOptions
+    path: str
+    chunk: Chunk
+    final: bool = False
+    state: State | None = None
+    profile: bool = False
+
+
+@dataclass
+class ChunkResult:
+    """The converted lines of a chunk and the states it started and ended with
+
+    The states are None if the conversion failed from the warmed up state. If the conversion failed
+    from the correct state, the lines are those converted before the error.
+    """
+    lines: List[str] = field(default_factory=list)
+    entry: State | None = None
+    exit: State | None = None
+    stats: ConversionStats = field(default_factory=ConversionStats)
+    log: str = ''
+    profiler: Profiler | None = None
+    error: str | None = None
+
+
+def is_travel(line: bytes) -> bool:
+    """Returns True if the line is a travel move (G0)
+
+    The modes emit their buffered weld or path at a travel and switch the laser off, so the state
+    carried to the line after it can be rebuilt by converting the lines before it.
+    """
+    return line.startswith((b'G0 ', b'G00 '))
+
+
+def line_start(file: BinaryIO, offset: int) -> int:
+    """Returns the offset of the first line starting at or after the offset"""
+    if offset <= 0:
+        return 0
+
+    file.seek(offset - 1)
+    file.readline()
+
+    return file.tell()
+
+
+def travel_end(file: BinaryIO, offset: int) -> int | None:
+    """Returns the offset of the line after the first travel at or after the offset, None if there is none"""
+    file.seek(line_start(file, offset))
+
+    while True:
+        line = file.readline()
+
+        if not line:
+            return None
+
+        if is_travel(line):
+            return file.tell()
+
+
+def warmup_start(file: BinaryIO, start: int) -> int:
+    """Returns where the warm-up of the chunk starting at the offset begins
+
+    The chunks start after a travel, and the warm-up starts at an earlier travel, so the weld or the
+    path emitted at the travel before the chunk is replayed from its start. The warm-up is at most
+    WARMUP_SIZE long if there is such a travel, otherwise it is doubled until there is one or it
+    starts at the start of the file.
+    """
+    size = WARMUP_SIZE
+
+    while start > size:
+        file.seek(line_start(file, start - size))
+        position = file.tell()
+
+        while position < start:
+            line = file.readline()
+
+            # the travel the chunk starts after can not start the warm-up
+            if is_travel(line) and position + len(line) < start:
+                return position
+
+            position += len(line)
+
+        size *= 2
+
+    return 0
+
+
+def split_layers(path: str, count: int) -> List[Chunk]:
+    """Splits the file into about count chunks of similar size, each starting after a travel
+
+    Args:
+        path (str): the path of the G-code file
+        count (int): the number of chunks wanted, fewer are returned for small files
+
+    Returns:
+        List[Chunk]: the chunks in file order, covering the whole file
+    """
+    size = os.path.getsize(path)
+    count = max(1, min(count, size // MIN_CHUNK_SIZE))
+
+    starts = [0]
+
+    with open(path, 'rb') as file:
+        for index in range(1, count):
+            start = travel_end(file, size * index // count)
+
+            if start is not None and starts[-1] < start < size:
+                starts.append(start)
+
+        warmups = [warmup_start(file, start) for start in starts]
+
+    return [
+        Chunk(start, end, warmup) for start, end, warmup in zip(starts, [*starts[1:], size], warmups)
+    ]
+
+
+def read_lines(path: str, start: int, end: int) -> Iterator[str]:
+    """Reads the lines of the file between the byte offsets, with the newlines of a text file"""
+    with open(path, 'rb') as file:
+        file.seek(start)
+        offset = start
+
+        for raw_line in file:
+            if offset >= end:
+                break
+
+            offset += len(raw_line)
+            line = raw_line.decode('utf8')
+
+            yield line[:-2] + '\n' if line.endswith('\r\n') else line
+
+
+def chunk_file(path: str, start: int, end: int, mapped: bool = False) -> Iterator[str] | MappedFile:
+    """Returns the file of the conversion of the lines between the byte offsets
+
+    Args:
+        path (str): the path of the G-code file
+        start (int): the offset of the first line
+        end (int): the offset after the last line
+        mapped (bool): if True, the lines are parsed from a memory mapping of the file
+    """
+    return MappedFile(path, start, end) if mapped else read_lines(path, start, end)
+
+
+def convert_chunk(job: ChunkJob) -> ChunkResult:
+    """Converts a chunk of the file, starting from the state of the job or from a warmed up state
+
+    This function runs in the worker processes, the messages of the mode are returned in the log of
+    the result instead of being printed.
+    """
+    with redirect_stdout(StringIO()):
+        mode = job.mode()
+        mode.configure(job.settings)
+
+    chunk = job.chunk
+    is_speculative = job.state is None and chunk.warmup < chunk.start
+    log = StringIO()
+
+    # the profiler of the chunk is returned with its result and merged into that of the conversion
+    profiler = Profiler() if job.profile else None
+    options = replace(job.options, profiler=profiler)
+    lines: List[str] = []
+
+    with redirect_stdout(log):
+        try:
+            if is_speculative:
+                warmup = mode.prepare(
+                    replace(options, file=chunk_file(job.path, chunk.warmup, chunk.start, options.mapped))
+                )
+
+                for _ in warmup.stream(final=False):
+                    pass
+
+                state = mode.snapshot()
+
+            converter = mode.prepare(
+                replace(options, file=chunk_file(job.path, chunk.start, chunk.end, options.mapped))
+            )
+
+            if is_speculative:
+                mode.restore(state)
+
+            elif job.state is not None:
+                mode.restore(job.state)
+
+            entry = mode.snapshot()
+
+            for line in converter.stream(final=job.final):
+                lines.append(line)
+
+            if job.final:
+                lines.extend(mode.finish())
+
+        except ValueError as error:
+            # a state warmed up from the middle of the file can be invalid, the chunk is converted
+            # again once the correct state is known
+            if is_speculative:
+                return ChunkResult()
+
+            # the conversion stops at the error as in Metal.convert, the lines before it are kept
+            return ChunkResult(lines, entry, None, converter.stats, log.getvalue(), profiler, str(error))
+
+    return ChunkResult(lines, entry, mode.snapshot(), converter.stats, log.getvalue(), profiler)
+
+
+def convert_layers(
+        mode: CLICommand,
+        settings: Dict[str, Any],
+        options: CLICommandOptions,
+        workers: int
+) -> Iterator[str]:
+    """Converts the file of the options in a pool of worker processes, split at its travel moves
+
+    The output is the same as that of mode.convert(options), files too small to be split are
+    converted serially.
+
+    Args:
+        mode (CLICommand): the mode configured with the settings, used for the header and the stats
+        settings (Dict[str, Any]): the mode specific options, the workers are configured with them
+        options (CLICommandOptions): the options of the conversion, the file must be opened from a path
+        workers (int): the number of worker processes
+
+    Yields:
+        str: the converted AS lines in file order
+    """
+    path = getattr(options.file, 'name', '')
+
+    # the workers open the file themselves, so it can only be split if it has a path
+    if workers <= 1 or not os.path.isfile(path):
+        chunks = []
+
+    else:
+        chunks = split_layers(path, workers * CHUNKS_PER_WORKER)
+
+    if len(chunks) <= 1:
+        yield from mode.convert(options)
+        return
+
+    mode.error = None
+
+    # the instrumentation stays in this process, the workers profile their chunks themselves
+    worker_options = replace(options, file=None, profiler=None, progress=None)
+    jobs = iter([
+        ChunkJob(
+            type(mode),
+            settings,
+            worker_options,
+            path,
+            chunk,
+            final=index == len(chunks) - 1,
+            profile=options.profiler is not None
+        )
+        for index, chunk in enumerate(chunks)
+    ])
+
+    as_length = 0
+
+    for line in mode.header():
+        as_length += 1
+        yield line
+
+    stats = ConversionStats()
+    messages = set()
+    previous: ChunkResult | None = None
+    reruns = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # only a few chunks are converted ahead, so the results waiting to be written stay bounded
+        pending = deque((job, executor.submit(convert_chunk, job)) for job in islice(jobs, 2 * workers))
+
+        while pending:
+            job, future = pending.popleft()
+
+            for next_job in islice(jobs, 1):
+                pending.append((next_job, executor.submit(convert_chunk, next_job)))
+
+            result = future.result()
+
+            if previous is not None and (result.entry is None or result.entry != previous.exit):
+                result = convert_chunk(replace(job, state=previous.exit))
+                reruns += 1
+
+            for message in result.log.splitlines():
+                if message not in messages:
+                    messages.add(message)
+                    echo(message)
+
+            if options.profiler is not None and result.profiler is not None:
+                options.profiler.merge(result.profiler)
+
+            if options.progress is not None:
+                options.progress.update(job.chunk.end)
+
+            stats += result.stats
+            as_length += len(result.lines)
+            yield from result.lines
+
+            if result.error is not None:
+                for _, pending_future in pending:
+                    pending_future.cancel()
+
+                mode.stop(options, result.error)
+                return
+
+            previous = result
+
+    echo(
+        f'[{Fore.BLUE}Info{Fore.RESET}]: Converted in {len(chunks)} chunks with {workers} workers, '
+        f'{reruns} chunks had to be converted again'
+    )
+
+    mode.complete(options, stats, as_length)
@@ -0,0 +1,200 @@
+"""Module for overlapping the reading and the writing of the files with the conversion
+
+Without the pipeline the G-code is read, converted and written by a single thread, so every slow
+read or write, e.g. of a file on a network share, stalls the conversion. In the pipelined mode the
+input is read and decoded by a reader thread and the output is written by a writer thread, both
+connected to the converting thread by bounded queues of line batches: the stages run concurrently,
+while at most a few batches are held in memory. The converter only sees an iterable of lines and a
+file to write to, so the output is the same as without the pipeline.
+
+The conversion itself is pure Python, so the threads mainly overlap the waiting for the disk and the
+network with the conversion, not the parsing with the converting.
+"""
+
+from queue import Full, Queue
+from threading import Event, Thread
+from types import TracebackType
+from typing import Iterable, Iterator, List, TextIO, Tuple, Type
+
+# the number of characters read or written at once by the threads
+BATCH_SIZE = 256 * 1024
+
+# the number of batches waiting in a queue, the stage in front of a full queue waits
+QUEUE_DEPTH = 8
+
+# the reader checks this often, in seconds, whether the consumer has stopped
+POLL_INTERVAL = 0.1
+
+
+class ReadAhead:
+    """Reads the lines of a file in a thread ahead of their consumer
+
+    The reading only starts once the lines are iterated, so a file which is converted from its path
+    instead, e.g. in a parallel or incremental conversion, is never read twice. The errors of the
+    reader are raised in the consumer.
+
+    Args:
+        file (TextIO): the opened input file, read with readlines
+        batch_size (int): the approximate number of characters in a batch of lines
+        depth (int): the maximum number of batches read ahead
+    """
+
+    def __init__(self, file: TextIO, batch_size: int = BATCH_SIZE, depth: int = QUEUE_DEPTH) -> None:
+        self.name = getattr(file, 'name', '')
+        self.__file = file
+        self.__batch_size = batch_size
+        self.__queue: Queue[Tuple[List[str], int] | BaseException | None] = Queue(maxsize=depth)
+        self.__stop = Event()
+        self.__started = False
+        self.__position = 0
+
+    def __iter__(self) -> Iterator[str]:
+        if self.__started:
+            raise RuntimeError('The file can only be read once')
+
+        self.__started = True
+        thread = Thread(target=self.__read, name='gcode2as-reader', daemon=True)
+        thread.start()
+
+        try:
+            while (batch := self.__queue.get()) is not None:
+                if isinstance(batch, BaseException):
+                    raise batch
+
+                lines, self.__position = batch
+                yield from lines
+
+        finally:
+            # the consumer can stop early, the reader must not wait for the queue forever
+            self.__stop.set()
+            thread.join()
+
+    def tell(self) -> int:
+        """Returns the number of bytes of the file read up to the end of the batch being consumed"""
+        return self.__position
+
+    def __put(self, item: Tuple[List[str], int] | BaseException | None) -> bool:
+        """Puts the item in the queue, returns False if the consumer stopped in the meantime"""
+        while not self.__stop.is_set():
+            try:
+                self.__queue.put(item, timeout=POLL_INTERVAL)
+                return True
+
+            except Full:
+                continue
+
+        return False
+
+    def __read(self) -> None:
+        # the decoded characters differ from the bytes of the file, e.g. for CRLF newlines
+        buffer = getattr(self.__file, 'buffer', None)
+        position = 0
+
+        try:
+            while lines := self.__file.readlines(self.__batch_size):
+                position = buffer.tell() if buffer is not None else position + sum(map(len, lines))
+
+                if not self.__put((lines, position)):
+                    return
+
+        except Exception as error:  # pylint: disable=broad-except
+            self.__put(error)
+            return
+
+        self.__put(None)
+
+
+class WriteBehind:
+    """Writes to a file in a thread behind the producer of the text
+
+    The written text is collected into batches, which are handed to the writer thread, so the
+    producer only waits if the writer falls behind by more than the queue. The errors of the writer
+    are raised by the next write or by close. The file is not closed, it stays owned by the caller.
+
+    Args:
+        file (TextIO): the opened output file
+        batch_size (int): the approximate number of characters in a batch
+        depth (int): the maximum number of batches waiting to be written
+    """
+
+    def __init__(self, file: TextIO, batch_size: int = BATCH_SIZE, depth: int = QUEUE_DEPTH) -> None:
+        self.name = getattr(file, 'name', '')
+        self.__file = file
+        self.__batch_size = batch_size
+        self.__buffer: List[str] = []
+        self.__size = 0
+        self.__queue: Queue[str | None] = Queue(maxsize=depth)
+        self.__error: BaseException | None = None
+        self.__closed = False
+        self.__thread = Thread(target=self.__write, name='gcode2as-writer', daemon=True)
+        self.__thread.start()
+
+    def __enter__(self) -> 'WriteBehind':
+        return self
+
+    def __exit__(
+            self,
+            exc_type: Type[BaseException] | None,
+            exc_value: BaseException | None,
+            traceback: TracebackType | None
+    ) -> None:
+        try:
+            self.close()
+
+        except Exception:  # pylint: disable=broad-except
+            # the error of the conversion is more relevant than that of the incomplete output
+            if exc_type is None:
+                raise
+
+    def write(self, text: str) -> int:
+        self.__buffer.append(text)
+        self.__size += len(text)
+
+        if self.__size >= self.__batch_size:
+            self.__hand_over()
+
+        return len(text)
+
+    def writelines(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.write(line)
+
+    def flush(self) -> None:
+        """Hands the buffered text to the writer, it is written in the background"""
+        self.__hand_over()
+
+    def close(self) -> None:
+        """Writes the rest of the text and waits for the writer, raising its error if any"""
+        if self.__closed:
+            return
+
+        self.__closed = True
+
+        try:
+            self.__hand_over()
+
+        finally:
+            self.__queue.put(None)
+            self.__thread.join()
+
+        if self.__error is not None:
+            raise self.__error
+
+    def __hand_over(self) -> None:
+        if self.__error is not None:
+            raise self.__error
+
+        if self.__buffer:
+            self.__queue.put(''.join(self.__buffer))
+            self.__buffer = []
+            self.__size = 0
+
+    def __write(self) -> None:
+        while (text := self.__queue.get()) is not None:
+            # after an error the queue is still drained, so the producer never waits for it
+            if self.__error is None:
+                try:
+                    self.__file.write(text)
+
+                except Exception as error:  # pylint: disable=broad-except
+                    self.__error = error
@@ -0,0 +1,221 @@
+"""Module for measuring where the time of a conversion goes and for displaying its progress
+
+The profiler is only attached to the conversion if it is requested, so the timers cost nothing
+otherwise. The stages are timed by wrapping the iterators and functions of the pipeline:
+
+- read: reading the raw lines from the file
+- parse: tokenizing the lines of the handled commands, see tokenizer.Tokenizer
+- resolve: resolving the modal targets of the moves
+- handlers: the handlers of the modes, timed per command
+- convert: the rest of the conversion, e.g. the simplification of the paths
+- write: formatting the program, writing it to the file and storing it in the cache
+"""
+
+import sys
+from dataclasses import dataclass, field
+from io import TextIOBase
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, TypeVar
+
+from progress.bar import IncrementalBar
+
+if TYPE_CHECKING:
+    from gcode2as.converter import ConversionStats
+
+try:
+    import resource
+
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+Item = TypeVar('Item')
+
+# the progress bar is redrawn at most this often, in seconds
+PROGRESS_INTERVAL = 0.1
+
+
+def peak_rss(children: bool = False) -> int | None:
+    """Returns the peak resident set size of the process (or of its finished children) in bytes"""
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+
+    # the size is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+@dataclass
+class Timer:
+    """The accumulated wall time and number of calls of a stage or a command"""
+    seconds: float = 0.0
+    calls: int = 0
+
+    def add(self, seconds: float, calls: int = 1) -> None:
+        self.seconds += seconds
+        self.calls += calls
+
+
+@dataclass
+class Profiler:
+    """Timers and counters of the stages of a conversion
+
+    The profilers of the worker processes are merged into the one of the main process, so the stage
+    times of a parallel conversion are summed over the workers.
+    """
+    stages: Dict[str, Timer] = field(default_factory=dict)
+    commands: Dict[str, Timer] = field(default_factory=dict)
+    skipped_moves: int = 0
+    comment_count: int = 0
+    input_lines: int = 0
+    output_lines: int = 0
+    # the number of instructions removed by each rule of the optimizer
+    optimized: Dict[str, int] = field(default_factory=dict)
+    # the totals of the estimated path lengths and times of the program
+    estimate: Dict[str, Any] = field(default_factory=dict)
+
+    def timer(self, stage: str) -> Timer:
+        """Returns the timer of the stage, creating it on the first use"""
+        return self.stages.setdefault(stage, Timer())
+
+    def timed(self, iterable: Iterable[Item], stage: str) -> Iterator[Item]:
+        """Wraps the iterable, adding the time spent producing every item to the stage"""
+        timer = self.timer(stage)
+        iterator = iter(iterable)
+
+        while True:
+            start = perf_counter()
+
+            try:
+                item = next(iterator)
+
+            except StopIteration:
+                timer.add(perf_counter() - start, 0)
+                return
+
+            timer.add(perf_counter() - start)
+            yield item
+
+    def timed_call(self, function: Callable[..., Item], name: str, command: bool = False) -> Callable[..., Item]:
+        """Wraps the function, adding the time of every call to the stage or command of the name"""
+        timer = self.commands.setdefault(name, Timer()) if command else self.timer(name)
+
+        def timed_function(*args, **kwargs):
+            start = perf_counter()
+
+            try:
+                return function(*args, **kwargs)
+
+            finally:
+                timer.add(perf_counter() - start)
+
+        return timed_function
+
+    def record(self, stats: 'ConversionStats', output_lines: int) -> None:
+        """Stores the counters of the finished conversion"""
+        self.input_lines = stats.file_length
+        self.skipped_moves = stats.skipped_moves
+        self.comment_count = stats.comment_count
+        self.output_lines = output_lines
+
+    def merge(self, other: 'Profiler') -> None:
+        """Adds the timers of another profiler, e.g. that of a worker process"""
+        for stage, timer in other.stages.items():
+            self.timer(stage).add(timer.seconds, timer.calls)
+
+        for command, timer in other.commands.items():
+            self.commands.setdefault(command, Timer()).add(timer.seconds, timer.calls)
+
+    def report(self, wall_time: float, **details: Any) -> Dict[str, Any]:
+        """Returns the report of the conversion as a JSON serializable dict
+
+        The measured timers are nested (e.g. the input includes the reading and the parsing), the
+        stages of the report are the exclusive times derived from them.
+
+        Args:
+            wall_time (float): the wall time of the whole conversion in seconds
+            **details: additional values of the report, e.g. the path of the file
+        """
+        def seconds(stage: str) -> float:
+            return self.stages[stage].seconds if stage in self.stages else 0.0
+
+        handlers = sum(timer.seconds for timer in self.commands.values())
+
+        stages = {
+            'read': seconds('read'),
+            'parse': seconds('parse'),
+            'resolve': max(seconds('input') - seconds('read') - seconds('parse'), 0.0),
+            'handlers': handlers,
+            'convert': max(seconds('convert') - seconds('input') - handlers, 0.0),
+            'write': max(wall_time - seconds('convert'), 0.0),
+        }
+
+        return {
+            **details,
+            'wall_time': wall_time,
+            'input_lines': self.input_lines,
+            'output_lines': self.output_lines,
+            'lines_per_second': self.input_lines / wall_time if wall_time > 0 else 0.0,
+            'skipped_moves': self.skipped_moves,
+            'comment_count': self.comment_count,
+            'peak_rss_bytes': peak_rss(),
+            'peak_rss_workers_bytes': peak_rss(children=True),
+            'optimized': self.optimized,
+            'estimate': self.estimate,
+            'stages': stages,
+            'commands': {
+                command: {
+                    'seconds': timer.seconds,
+                    'calls': timer.calls,
+                    'lines_per_second': timer.calls / timer.seconds if timer.seconds > 0 else 0.0,
+                }
+                for command, timer in sorted(self.commands.items())
+            },
+        }
+
+
+def byte_position(file: Any) -> Callable[[], int] | None:
+    """Returns a function returning the bytes of the file consumed so far, None if the file has none
+
+    The decoded characters of a text file differ from its bytes for CRLF newlines or non-ASCII text,
+    so the position of its binary buffer is used instead. The buffer reads ahead of the lines by a
+    block at most.
+    """
+    buffer = getattr(file, 'buffer', None)
+
+    if buffer is not None and buffer.seekable():
+        return buffer.tell
+
+    return getattr(file, 'tell', None) if not isinstance(file, TextIOBase) else None
+
+
+class Progress:
+    """Progress bar with an ETA, driven by the number of bytes of the file consumed
+
+    The bar is only drawn if the standard error is a terminal, and it is redrawn at most every
+    PROGRESS_INTERVAL seconds however often it is updated.
+    """
+
+    def __init__(self, size: int, message: str = 'Converting') -> None:
+        self.__bar = IncrementalBar(
+            message, max=max(size, 1), suffix='%(percent).1f%% ETA %(eta_td)s', hide_cursor=False
+        )
+        self.__last_update = 0.0
+
+        # the converter reports the consumed bytes at about this granularity
+        self.step = max(size // 1000, 1 << 16)
+
+    def update(self, consumed: int) -> None:
+        """Moves the bar to the number of consumed bytes"""
+        now = perf_counter()
+
+        if now - self.__last_update < PROGRESS_INTERVAL:
+            return
+
+        self.__last_update = now
+        self.__bar.next(min(consumed, self.__bar.max) - self.__bar.index)
+
+    def finish(self) -> None:
+        """Fills the bar and ends its line"""
+        self.__bar.next(self.__bar.max - self.__bar.index)
+        self.__bar.finish()
@@ -0,0 +1,117 @@
+"""Module for the compact records of the parsed G-code lines
+
+The conversion only reads the command, a few words and the comment of a line, so the parsed lines
+are kept in slotted records instead of the GcodeLine objects of gcodeparser, which carry a dict of
+all the words and one of their own attributes. The records are buffered by the toolpath
+simplification and the welds, so their size sets the memory usage of the conversion.
+"""
+
+from typing import Any, Dict, Tuple
+
+from gcodeparser.gcode_parser import GcodeLine
+
+Command = Tuple[str, int | None]
+
+# the words kept from the lines, the other words are not used by the conversion
+WORDS = ('X', 'Y', 'Z', 'E', 'F')
+
+# the words of the center of the arcs, only kept for the arc moves
+ARC_WORDS = ('I', 'J', 'R')
+ARC_COMMANDS = (('G', 2), ('G', 3))
+
+# the words the parsers convert, the others are skipped unless the text of the line is kept
+USED_WORDS = frozenset(WORDS + ARC_WORDS)
+
+# the command tuples are shared by all the records of the same command
+_commands: Dict[Command, Command] = {}
+
+
+class GcodeRecord:
+    """The command, the used words and the comment of a parsed G-code line
+
+    The words keep the value parsed by gcodeparser (an int, a float, or True for a word without a
+    number), None marks a missing word. The I, J and R words of the arcs are kept together in a
+    tuple, which is None for the other lines. The text of the line is only kept if it is printed in
+    the verbose output.
+    """
+
+    __slots__ = ('command', 'x', 'y', 'z', 'e', 'f', 'arc', 'comment', 'text')
+
+    def __init__(
+            self,
+            command: Command,
+            x: float | None = None,
+            y: float | None = None,
+            z: float | None = None,
+            e: float | None = None,
+            f: float | None = None,
+            arc: Tuple[float | None, float | None, float | None] | None = None,
+            comment: str = '',
+            text: str | None = None
+    ) -> None:
+        # pylint: disable=invalid-name,too-many-arguments
+        self.command = command
+        self.x = x
+        self.y = y
+        self.z = z
+        self.e = e
+        self.f = f
+        self.arc = arc
+        self.comment = comment
+        self.text = text
+
+    @classmethod
+    def from_line(cls, line: GcodeLine, keep_text: bool = False) -> 'GcodeRecord':
+        """Creates the record of a line parsed by gcodeparser
+
+        Args:
+            line (GcodeLine): the parsed line
+            keep_text (bool): if True, the G-code text of the line is kept for the verbose output
+        """
+        return cls.from_words(line.command, line.params, line.comment, line.gcode_str if keep_text else None)
+
+    @classmethod
+    def from_words(
+            cls,
+            command: Command,
+            params: Dict[str, Any],
+            comment: str,
+            text: str | None = None
+    ) -> 'GcodeRecord':
+        """Creates the record of a line from its command, words and comment
+
+        Args:
+            command (Command): the (letter, number) pair of the command
+            params (Dict[str, Any]): the parsed words by their letter, only the used ones are read
+            comment (str): the comment of the line
+            text (str | None): the G-code text of the line for the verbose output
+        """
+        command = _commands.setdefault(command, command)
+
+        return cls(
+            command,
+            *(params.get(word) for word in WORDS),
+            arc=tuple(params.get(word) for word in ARC_WORDS) if command in ARC_COMMANDS else None,
+            comment=comment,
+            text=text
+        )
+
+    @property
+    def has_coordinates(self) -> bool:
+        """True if the line has any of the X, Y and Z words"""
+        return self.x is not None or self.y is not None or self.z is not None
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, GcodeRecord):
+            return NotImplemented
+
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        words = ', '.join(
+            f'{slot}={value!r}' for slot in self.__slots__[1:] if (value := getattr(self, slot)) not in (None, '')
+        )
+
+        return f'{type(self).__name__}({self.command!r}, {words})'
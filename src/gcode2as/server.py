@@ -0,0 +1,376 @@
+"""Module for converting G-code over HTTP
+
+The server lets the cells of a shop floor and the MES request conversions without installing the
+script on every station. A conversion is requested with a POST to /convert: the body is the G-code,
+the X-Options header holds the options as a JSON object with the keys of a profile (see
+batch.profile_job), and the name query parameter is the name of the AS program.
+
+The upload is spooled to a temporary file, which a pool of worker processes converts. The worker
+sends the program to the request thread in blocks while it is generated, and the thread passes them
+on to the client with chunked transfer encoding, so the first lines arrive long before the
+conversion finishes and neither process holds the whole program. An error before the first block is
+answered with a status code, an error after it breaks off the response, which the client notices as
+an incomplete chunked body.
+
+GET /health returns the state and the counters of the server as JSON.
+"""
+
+import json
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass, replace
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+from pathlib import Path
+from threading import BoundedSemaphore, Lock
+from time import monotonic, perf_counter
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from gcode2as import __version__
+from gcode2as.batch import ConversionJob, job_options, profile_job, warm_up, write_job
+from gcode2as.cli.modes import MODES
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+
+# the number of characters sent to the client at once
+BLOCK_SIZE = 64 * 1024
+
+# the number of requests waiting for a worker per worker, the server is busy above it
+REQUESTS_PER_WORKER = 4
+
+# the request thread checks this often, in seconds, whether the worker is still alive
+POLL_INTERVAL = 0.5
+
+OPTIONS_HEADER = 'X-Options'
+DEFAULT_PROGRAM_NAME = 'program'
+
+# the options of a profile which do not apply to a program streamed back, e.g. the files of the
+# subprograms or the layers of the previous uploads
+IGNORED_OPTIONS = ('split_files', 'incremental', 'output_dir', 'jobs')
+
+
+class ConnectionWriter:
+    """Sends the written text to a connection in blocks, the file the workers write the program to
+
+    Args:
+        connection (Connection): the sending end of the pipe to the request thread
+        block_size (int): the approximate number of characters sent at once
+    """
+
+    def __init__(self, connection: Connection, block_size: int = BLOCK_SIZE) -> None:
+        self.__connection = connection
+        self.__block_size = block_size
+        self.__buffer: List[str] = []
+        self.__size = 0
+
+    def __enter__(self) -> 'ConnectionWriter':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.flush()
+
+    def write(self, text: str) -> int:
+        self.__buffer.append(text)
+        self.__size += len(text)
+
+        if self.__size >= self.__block_size:
+            self.flush()
+
+        return len(text)
+
+    def writelines(self, lines) -> None:
+        for line in lines:
+            self.write(line)
+
+    def flush(self) -> None:
+        if self.__buffer:
+            self.__connection.send(('data', ''.join(self.__buffer)))
+            self.__buffer = []
+            self.__size = 0
+
+
+def stream_job(job: ConversionJob, program_name: str, connection: Connection) -> None:
+    """Converts the file of the job, sending the program to the connection while it is generated
+
+    The messages are tuples: ('data', text) for the blocks of the program, then ('done', log) or
+    ('error', message, log). This function runs in the worker processes, so it never raises.
+    """
+    log = StringIO()
+
+    try:
+        with redirect_stdout(log):
+            mode = MODES[job.mode]()
+            mode.configure(job.settings)
+
+            with open(job.input_path, 'r', encoding='utf8') as file, ConnectionWriter(connection) as output:
+                write_job(job, mode, job_options(job, file), output, program_name)
+
+    except Exception as error:  # pylint: disable=broad-except
+        connection.send(('error', f'{type(error).__name__}: {error}', log.getvalue()))
+
+    else:
+        connection.send(('done', log.getvalue()))
+
+    finally:
+        connection.close()
+
+
+@dataclass
+class ServerMetrics:
+    """The counters of the server since it started"""
+    requests: int = 0
+    active: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    rejected: int = 0
+    bytes_received: int = 0
+    bytes_sent: int = 0
+    conversion_seconds: float = 0.0
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """Serves the conversions, every request is handled by a thread and converted by a worker process
+
+    A request beyond the workers and their waiting requests is answered with 503 Service Unavailable,
+    so a burst of uploads does not fill the disk with spooled files nobody is going to wait for.
+
+    Args:
+        address (Tuple[str, int]): the host and the port to listen on, port 0 picks a free port
+        workers (int): the number of worker processes
+        defaults (Dict[str, Any] | None): the profile values of the requests not given in their options
+        log_requests (bool): if True, every request is logged to stderr
+    """
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            address: Tuple[str, int],
+            workers: int,
+            defaults: Dict[str, Any] | None = None,
+            log_requests: bool = True
+    ) -> None:
+        super().__init__(address, ConversionHandler)
+        self.workers = workers
+        self.defaults = defaults or {}
+        self.log_requests = log_requests
+        self.started = monotonic()
+        self.metrics = ServerMetrics()
+        self.executor = ProcessPoolExecutor(workers, initializer=warm_up, initargs=(list(MODES),))
+        self.slots = BoundedSemaphore(workers * (REQUESTS_PER_WORKER + 1))
+        self.__lock = Lock()
+
+        # the workers are started on submission, so they are started and warmed up right away
+        for _ in range(workers):
+            self.executor.submit(len, ())
+
+    def count(self, **changes: float) -> None:
+        """Adds the changes to the counters of the metrics"""
+        with self.__lock:
+            for key, change in changes.items():
+                setattr(self.metrics, key, getattr(self.metrics, key) + change)
+
+    def health(self) -> Dict[str, Any]:
+        """Returns the state and the counters of the server"""
+        with self.__lock:
+            metrics = asdict(self.metrics)
+
+        return {
+            'status': 'ok',
+            'version': __version__,
+            'workers': self.workers,
+            'uptime': round(monotonic() - self.started, 3),
+            **metrics
+        }
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """Handles the requests of the conversion server"""
+
+    server: ConversionServer
+    protocol_version = 'HTTP/1.1'
+    server_version = f'gcode2as/{__version__}'
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        if urlsplit(self.path).path != '/health':
+            self.send_error_json(HTTPStatus.NOT_FOUND, 'unknown path')
+            return
+
+        self.send_json(HTTPStatus.OK, self.server.health())
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        url = urlsplit(self.path)
+
+        if url.path != '/convert':
+            self.send_error_json(HTTPStatus.NOT_FOUND, 'unknown path')
+            return
+
+        self.server.count(requests=1)
+
+        try:
+            job = self.request_job()
+            length = int(self.headers['Content-Length'])
+
+        except (TypeError, ValueError) as error:
+            self.server.count(failed=1)
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(error))
+            return
+
+        if not self.server.slots.acquire(blocking=False):
+            self.server.count(rejected=1)
+            self.send_error_json(HTTPStatus.SERVICE_UNAVAILABLE, 'all workers are busy', {'Retry-After': '5'})
+            return
+
+        self.server.count(active=1)
+        program_name = parse_qs(url.query).get('name', [DEFAULT_PROGRAM_NAME])[0]
+
+        try:
+            with tempfile.TemporaryDirectory(prefix='gcode2as-') as directory:
+                path = Path(directory, 'upload.gcode')
+                self.spool(path, length)
+
+                start = perf_counter()
+                job = replace(job, input_path=str(path), output_path=str(path.with_suffix('.pg')))
+                succeeded = self.stream(job, program_name)
+                self.server.count(conversion_seconds=perf_counter() - start)
+
+        except ConnectionError:
+            # the client went away, the worker stops at its next block
+            self.close_connection = True
+            succeeded = False
+
+        finally:
+            self.server.count(active=-1)
+            self.server.slots.release()
+
+        self.server.count(succeeded=int(succeeded), failed=int(not succeeded))
+
+    def request_job(self) -> ConversionJob:
+        """Returns the job of the request options, raises ValueError if they are invalid
+
+        The options are validated before the upload is spooled, the paths of the job are set after it.
+        """
+        options = json.loads(self.headers.get(OPTIONS_HEADER) or '{}')
+
+        if not isinstance(options, dict) or not isinstance(options.get('settings', {}), dict):
+            raise ValueError(f'the {OPTIONS_HEADER} header must be a JSON object with a settings object')
+
+        values = {**self.server.defaults, **options}
+        values['settings'] = {**self.server.defaults.get('settings', {}), **options.get('settings', {})}
+
+        for key in IGNORED_OPTIONS:
+            values.pop(key, None)
+
+        return profile_job(values, '', '')
+
+    def spool(self, path: Path, length: int) -> None:
+        """Writes the uploaded body to the file in blocks"""
+        with open(path, 'wb') as file:
+            while length > 0:
+                block = self.rfile.read(min(length, BLOCK_SIZE))
+
+                if not block:
+                    raise ConnectionError('the upload ended early')
+
+                file.write(block)
+                length -= len(block)
+                self.server.count(bytes_received=len(block))
+
+    def stream(self, job: ConversionJob, program_name: str) -> bool:
+        """Converts the job in a worker, sending the blocks of the program as they arrive
+
+        Returns:
+            bool: True if the program was sent completely
+        """
+        reader, writer = Pipe(duplex=False)
+
+        # the sending end is only pickled for the worker once the pool takes the job, so it is kept open
+        with reader, writer:
+            future = self.server.executor.submit(stream_job, job, program_name, writer)
+            started = False
+
+            while True:
+                message = self.receive(reader, future)
+
+                if message[0] == 'data':
+                    if not started:
+                        self.start_stream(program_name)
+                        started = True
+
+                    self.send_chunk(message[1])
+                    continue
+
+                if message[0] == 'done':
+                    if not started:
+                        self.start_stream(program_name)
+
+                    self.send_chunk('')
+                    return True
+
+                if started:
+                    # the status is already sent, the client sees the missing end of the chunked body
+                    self.close_connection = True
+
+                else:
+                    self.send_error_json(HTTPStatus.UNPROCESSABLE_ENTITY, message[1], log=message[2])
+
+                return False
+
+    def receive(self, reader: Connection, future: Future) -> Tuple[Any, ...]:
+        """Waits for the next message of the worker, an error message if the worker died"""
+        while not reader.poll(POLL_INTERVAL):
+            if future.done() and not reader.poll():
+                error = future.exception()
+                return 'error', f'the worker stopped: {error}', ''
+
+        return reader.recv()
+
+    def start_stream(self, program_name: str) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Disposition', f'attachment; filename="{program_name}.pg"')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def send_chunk(self, text: str) -> None:
+        """Sends a chunk of the response, an empty text ends the response"""
+        data = text.encode('utf8')
+        self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+        self.server.count(bytes_sent=len(data))
+
+    def send_json(self, status: HTTPStatus, body: Dict[str, Any], headers: Dict[str, str] | None = None) -> None:
+        data = json.dumps(body).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(
+            self,
+            status: HTTPStatus,
+            message: str,
+            headers: Dict[str, str] | None = None,
+            log: str = ''
+    ) -> None:
+        # the body of a rejected upload is not read, so the connection can not be reused
+        self.close_connection = True
+        self.send_json(status, {'error': message, 'log': log}, {'Connection': 'close', **(headers or {})})
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        if self.server.log_requests:
+            super().log_message(format, *args)
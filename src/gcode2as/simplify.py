@@ -0,0 +1,204 @@
+"""Module for simplifying toolpaths within a maximum chord deviation"""
+
+from math import sqrt
+from typing import Any, Callable, Generic, List, Sequence, Tuple, TypeVar
+
+from gcode2as.toolpath import Position
+
+SIMPLIFY_DISTANCE = 'distance'
+SIMPLIFY_TOLERANCE = 'tolerance'
+SIMPLIFICATIONS = (SIMPLIFY_DISTANCE, SIMPLIFY_TOLERANCE)
+
+DEFAULT_MIN_DISTANCE = 2
+DEFAULT_TOLERANCE = 0.1
+
+# the buffered path is simplified and emitted when it grows longer than this
+MAX_PATH_LENGTH = 10_000
+
+Payload = TypeVar('Payload')
+
+
+def segment_deviation(point: Position, start: Position, end: Position) -> float:
+    """Returns the distance of the point from the segment between start and end"""
+    seg_x = end[0] - start[0]
+    seg_y = end[1] - start[1]
+    seg_z = end[2] - start[2]
+
+    rel_x = point[0] - start[0]
+    rel_y = point[1] - start[1]
+    rel_z = point[2] - start[2]
+
+    seg_length = seg_x ** 2 + seg_y ** 2 + seg_z ** 2
+
+    if seg_length > 0:
+        ratio = (rel_x * seg_x + rel_y * seg_y + rel_z * seg_z) / seg_length
+        ratio = min(max(ratio, 0), 1)
+
+        rel_x -= ratio * seg_x
+        rel_y -= ratio * seg_y
+        rel_z -= ratio * seg_z
+
+    return sqrt(rel_x ** 2 + rel_y ** 2 + rel_z ** 2)
+
+
+def simplify_path(points: Sequence[Position], tolerance: float, keep_z_changes: bool = True) -> List[int]:
+    """Selects the points of a polyline needed to keep the path within the tolerance
+
+    The Douglas-Peucker algorithm is used: a point is only dropped if it lies closer than the
+    tolerance to the chord between the points kept around it. The first and the last point are always
+    kept.
+
+    Args:
+        points (Sequence[Position]): the points of the path
+        tolerance (float): the maximum chord deviation in mm
+        keep_z_changes (bool): if True, the segments changing the z coordinate are never simplified
+
+    Returns:
+        List[int]: the sorted indices of the points to keep
+    """
+    last = len(points) - 1
+
+    if last < 2:
+        return list(range(len(points)))
+
+    anchors = {0, last}
+
+    if keep_z_changes:
+        for i in range(1, len(points)):
+            if points[i][2] != points[i - 1][2]:
+                anchors.add(i - 1)
+                anchors.add(i)
+
+    kept = set(anchors)
+    ordered = sorted(anchors)
+
+    stack: List[Tuple[int, int]] = [
+        (start, end) for start, end in zip(ordered, ordered[1:]) if end - start > 1
+    ]
+
+    while stack:
+        start, end = stack.pop()
+
+        max_deviation = -1.0
+        max_index = start
+
+        for i in range(start + 1, end):
+            deviation = segment_deviation(points[i], points[start], points[end])
+
+            if deviation > max_deviation:
+                max_deviation = deviation
+                max_index = i
+
+        if max_deviation <= tolerance:
+            continue
+
+        kept.add(max_index)
+
+        if max_index - start > 1:
+            stack.append((start, max_index))
+
+        if end - max_index > 1:
+            stack.append((max_index, end))
+
+    return sorted(kept)
+
+
+class PathBuffer(Generic[Payload]):
+    """Buffers the points of a continuous path until it is emitted
+
+    The path starts at an anchor, the position the robot is at when the first point is buffered.
+    """
+
+    def __init__(self) -> None:
+        self.__points: List[Position] = []
+        self.__payloads: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self.__payloads)
+
+    @property
+    def is_full(self) -> bool:
+        return len(self.__payloads) >= MAX_PATH_LENGTH
+
+    def add(self, anchor: Position, point: Position, payload: Payload) -> None:
+        """Buffers a point of the path
+
+        Args:
+            anchor (Position): the start of the path, only used if the buffer is empty
+            point (Position): the target of the move
+            payload (Payload): the data needed to emit the move later
+        """
+        if not self.__points:
+            self.__points.append(anchor)
+
+        self.__points.append(point)
+        self.__payloads.append(payload)
+
+    def snapshot(self) -> Tuple[List[Position], List[Payload]]:
+        """Returns a copy of the buffered points and payloads"""
+        return list(self.__points), list(self.__payloads)
+
+    def restore(self, state: Tuple[List[Position], List[Payload]]) -> None:
+        """Replaces the buffer with a state returned by snapshot"""
+        points, payloads = state
+
+        self.__points = list(points)
+        self.__payloads = list(payloads)
+
+    def take(self) -> Tuple[List[Position], List[Payload]]:
+        """Returns the buffered points, starting with the anchor, and payloads and clears the buffer"""
+        points, payloads = self.__points, self.__payloads
+
+        self.__points = []
+        self.__payloads = []
+
+        return points, payloads
+
+
+class PathSimplifier(PathBuffer[Payload]):
+    """Buffers the points of a continuous path and keeps only those needed within the tolerance
+
+    The anchor of the path is never emitted again, the last buffered point is always kept unless the
+    move does not change the position.
+
+    Args:
+        tolerance (float): the maximum chord deviation in mm
+        keep_z_changes (bool): if True, the segments changing the z coordinate are never simplified
+        rounding (Callable[[Position], Position] | None): rounds the points to the output precision,
+            the moves that do not change the rounded position are dropped as well
+    """
+
+    def __init__(
+            self,
+            tolerance: float,
+            keep_z_changes: bool = True,
+            rounding: Callable[[Position], Position] | None = None
+    ) -> None:
+        super().__init__()
+
+        self.__tolerance = tolerance
+        self.__keep_z_changes = keep_z_changes
+        self.__rounding = rounding
+
+    def flush(self) -> List[Payload]:
+        """Simplifies the buffered path and clears the buffer
+
+        Returns:
+            List[Payload]: the payloads of the kept points in path order
+        """
+        all_points, all_payloads = self.take()
+
+        if not all_payloads:
+            return []
+
+        kept = simplify_path(all_points, self.__tolerance, self.__keep_z_changes)
+        points = [all_points[index] for index in kept]
+
+        if self.__rounding is not None:
+            points = [self.__rounding(point) for point in points]
+
+        # moves that do not change the position are dropped
+        return [
+            all_payloads[kept[index] - 1] for index in range(1, len(kept))
+            if points[index] != points[index - 1]
+        ]
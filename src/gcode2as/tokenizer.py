@@ -0,0 +1,155 @@
+"""Module for the selective tokenizer of the G-code lines
+
+gcodeparser splits every line into a dict of all of its words, typing every value with a few regular
+expressions, although the conversion only handles the moves and the comments and only reads a few
+of their words. The slicers write thousands of other commands (temperatures, fans, tool changes...),
+which the conversion drops after parsing them in full.
+
+The tokenizer classifies a line by its leading word first: a comment is taken as it is, a command
+without a handler is rejected without reading its words, and only the used words of the other
+commands are converted to numbers. The tokens are checked against the grammar of gcodeparser, and
+the lines of any other form (several commands in a line, quoted strings, line numbers...) are parsed
+by gcodeparser itself, so the records are always the same as those of gcodeparser.
+
+The lines can be strings or bytes, e.g. those of a memory-mapped file, the bytes are only decoded
+for the comments and the lines left to gcodeparser.
+"""
+
+import re
+from typing import Any, Callable, Collection, Dict, List, NamedTuple, Pattern, Tuple
+
+from gcodeparser.gcode_parser import GcodeLine, get_lines
+
+from gcode2as.records import USED_WORDS, Command, GcodeRecord
+
+# the leading word of a command
+COMMAND_PATTERN = r'([GMTgmt])(\d+)'
+
+# the words of a single command as matched by gcodeparser: a letter other than G and M, which would
+# start the next command, and a number without a quoted string
+WORDS_PATTERN = r'(?:[ \t]*[A-FH-LN-Za-fh-ln-z_][-+\d.]*)*[ \t]*'
+
+# a word split into its letter, the value gcodeparser converts and the rest of the token, a float
+# has a digit after its point
+WORD_PATTERN = r'([A-Za-z_])([-+]?\d*(?:(\.\d)\d*|\.)?)([-+\d.]*)'
+
+# the letters of the words and the commands by their upper case
+LETTERS = {letter: letter.upper() for letter in '_abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'}
+
+COMMENT: Command = (';', None)
+
+
+class Grammar(NamedTuple):
+    """The patterns and the literals of the tokenizer for the strings or the bytes"""
+    newlines: Tuple[Any, ...]
+    semicolon: Any
+    command: Pattern
+    words: Pattern
+    word: Pattern
+    letters: Dict[Any, str]
+    decode: Callable[[Any], str]
+
+
+TEXT_GRAMMAR = Grammar(
+    ('\n',), ';',
+    re.compile(COMMAND_PATTERN), re.compile(WORDS_PATTERN), re.compile(WORD_PATTERN),
+    LETTERS, str
+)
+
+# the lines of a binary file keep their newlines, the text input translates \r\n to \n
+BYTES_GRAMMAR = Grammar(
+    (b'\r\n', b'\n'), b';',
+    re.compile(COMMAND_PATTERN.encode()), re.compile(WORDS_PATTERN.encode()), re.compile(WORD_PATTERN.encode()),
+    {letter.encode(): word for letter, word in LETTERS.items()}, lambda value: value.decode('utf8', errors='replace')
+)
+
+
+class Tokenizer:
+    """Parses the G-code lines into records, skipping the commands the conversion does not handle
+
+    Args:
+        commands (Collection[Command]): the commands the records are needed of, the lines of the
+            other commands are rejected
+        keep_text (bool): if True, all the words and the text of the lines are kept for the verbose
+            output
+        binary (bool): if True, the lines are bytes
+    """
+
+    def __init__(self, commands: Collection[Command], keep_text: bool = False, binary: bool = False) -> None:
+        self.__commands = frozenset(commands)
+        self.__keep_text = keep_text
+        self.__grammar = BYTES_GRAMMAR if binary else TEXT_GRAMMAR
+
+    def parse_line(self, line: str | bytes) -> List[GcodeRecord] | None:
+        """Parses a line of G-code
+
+        Args:
+            line (str | bytes): the line, with or without its newline
+
+        Returns:
+            List[GcodeRecord] | None: the records of the commands in the line, None if the line is a
+                single command which is not needed
+        """
+        grammar = self.__grammar
+
+        for newline in grammar.newlines:
+            if line.endswith(newline):
+                line = line[:-len(newline)]
+                break
+
+        if not line:
+            return []
+
+        if line[:1] == grammar.semicolon:
+            # gcodeparser drops the comments without a single character after the semicolon
+            if len(line) == 1:
+                return []
+
+            return [self.__record(COMMENT, {}, grammar.decode(line[1:]).strip())]
+
+        match = grammar.command.match(line)
+
+        if match is not None:
+            words, _, comment = line[match.end():].partition(grammar.semicolon)
+
+            if grammar.words.fullmatch(words) is not None:
+                letter, number = match.groups()
+                command = (grammar.letters[letter], int(number))
+
+                if command not in self.__commands:
+                    return None
+
+                params = self.__parse_words(words)
+
+                if params is not None:
+                    return [self.__record(command, params, grammar.decode(comment).strip())]
+
+        return [
+            GcodeRecord.from_line(gcode_line, self.__keep_text)
+            for gcode_line in get_lines(grammar.decode(line), include_comments=True)
+        ]
+
+    def __parse_words(self, words: str | bytes) -> Dict[str, Any] | None:
+        """Converts the values of the words like gcodeparser, None if a value has another form"""
+        letters = self.__grammar.letters
+        keep_all = self.__keep_text
+        params = {}
+
+        for key, value, fraction, rest in self.__grammar.word.findall(words):
+            word = letters[key]
+
+            if not keep_all and word not in USED_WORDS:
+                continue
+
+            # gcodeparser splits a value with an inner sign and types one with several points as text
+            if rest:
+                return None
+
+            params[word] = float(value) if fraction else int(value) if value else True
+
+        return params
+
+    def __record(self, command: Command, params: Dict[str, Any], comment: str) -> GcodeRecord:
+        text = GcodeLine(command, params, comment).gcode_str if self.__keep_text else None
+
+        return GcodeRecord.from_words(command, params, comment, text)
@@ -0,0 +1,50 @@
+"""Module for the positions of the toolpaths, resolving the modal state of G0-G3 moves"""
+
+from typing import TYPE_CHECKING, Iterable, Iterator, Tuple
+
+if TYPE_CHECKING:
+    from gcode2as.records import GcodeRecord
+
+Position = Tuple[float, float, float]
+
+ORIGIN: Position = (0.0, 0.0, 0.0)
+
+MOVE_COMMANDS = frozenset((('G', 0), ('G', 1), ('G', 2), ('G', 3)))
+
+
+def is_move(line: 'GcodeRecord') -> bool:
+    """Returns True if the line is a linear (G0, G1) or an arc (G2, G3) move"""
+    return line.command in MOVE_COMMANDS
+
+
+def is_coordinate(value: float | str | bool | None) -> bool:
+    """Returns True if the parsed word value is a number"""
+    # flag parameters (a letter without a number) carry no coordinate
+    return value is not None and value is not True and not isinstance(value, str)
+
+
+def resolve_targets(
+        lines: Iterable['GcodeRecord'],
+        origin: Position = ORIGIN
+) -> Iterator[Tuple['GcodeRecord', Position | None]]:
+    """Resolves the modal XYZ target of the moves one line at a time
+
+    Yields:
+        Tuple[GcodeRecord, Position | None]: the line and its target, None if it is not a move
+    """
+    x_pos, y_pos, z_pos = origin
+
+    for line in lines:
+        if not is_move(line):
+            yield line, None
+            continue
+
+        x_val = line.x
+        y_val = line.y
+        z_val = line.z
+
+        x_pos = float(x_val) if is_coordinate(x_val) else x_pos
+        y_pos = float(y_val) if is_coordinate(y_val) else y_pos
+        z_pos = float(z_val) if is_coordinate(z_val) else z_pos
+
+        yield line, (x_pos, y_pos, z_pos)
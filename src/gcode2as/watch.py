@@ -0,0 +1,189 @@
+"""Module for watching folders and converting the G-code files dropped into them
+
+Every watched folder has a profile, and the new or changed .gcode files of the folder are converted
+with it. A file is only converted once it stopped changing between two scans, so a file still being
+copied to the folder is not converted half way. The files are converted in a pool of worker
+processes started with the watcher, which import the conversion and the modes of the profiles up
+front, so the import is only paid once and not for every file.
+
+A burst of files does not flood the pool: only a few conversions per worker are submitted at a time,
+the other stable files wait in the watcher until a worker is free.
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Event
+from typing import Any, Deque, Dict, Iterator, List, Tuple
+
+from gcode2as.batch import ConversionJob, JobResult, profile_job, run_job, warm_up
+
+GCODE_SUFFIX = '.gcode'
+PROGRAM_SUFFIX = '.pg'
+
+# the seconds between two scans of the folders
+POLL_INTERVAL = 1.0
+
+# the number of conversions submitted to the pool per worker, the other files wait in the watcher
+JOBS_PER_WORKER = 2
+
+# the modification time and the size of a file, a file is stable if it did not change between scans
+Signature = Tuple[int, int]
+
+
+@dataclass
+class WatchedFolder:
+    """A folder whose G-code files are converted with a profile
+
+    Args:
+        directory (Path): the watched folder, its subfolders are not watched
+        values (Dict[str, Any]): the values of the profile, see batch.profile_job
+        output_dir (Path | None): the folder of the generated programs, the watched folder if None
+    """
+    directory: Path
+    values: Dict[str, Any] = field(default_factory=dict)
+    output_dir: Path | None = None
+
+    def output_path(self, path: Path) -> Path:
+        """Returns the path of the program generated from the file"""
+        return (self.output_dir or self.directory).joinpath(path.stem + PROGRAM_SUFFIX)
+
+
+def file_signature(path: Path) -> Signature | None:
+    """Returns the signature of the file, None if it was removed"""
+    try:
+        stat = path.stat()
+
+    except OSError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FolderWatcher:
+    """Converts the new and changed G-code files of the folders in a pool of worker processes
+
+    The files whose program is newer than them are considered converted, so restarting the watcher
+    does not convert the whole folders again.
+
+    Args:
+        folders (List[WatchedFolder]): the watched folders
+        workers (int): the number of worker processes
+        cache_dir (str | None): the directory of the conversion cache, None to always convert the files
+    """
+
+    def __init__(self, folders: List[WatchedFolder], workers: int, cache_dir: str | None = None) -> None:
+        self.__folders = folders
+        self.__workers = workers
+        self.__cache_dir = cache_dir
+
+        self.__converted: Dict[Path, Signature] = {}
+        self.__candidates: Dict[Path, Signature] = {}
+        self.__queued: Dict[Path, Signature] = {}
+        self.__ready: Deque[Tuple[ConversionJob, Signature]] = deque()
+        self.__running: Dict[Future, Tuple[Path, Signature]] = {}
+        self.__executor: ProcessPoolExecutor | None = None
+
+    def __enter__(self) -> 'FolderWatcher':
+        modes = sorted({folder.values['mode'] for folder in self.__folders})
+        self.__executor = ProcessPoolExecutor(self.__workers, initializer=warm_up, initargs=(modes,))
+
+        # the workers are started on submission, so they are started and warmed up right away
+        for _ in range(self.__workers):
+            self.__executor.submit(len, ())
+
+        return self
+
+    def __exit__(self, *_) -> None:
+        if self.__executor is not None:
+            self.__executor.shutdown(cancel_futures=True)
+            self.__executor = None
+
+    @property
+    def pending(self) -> int:
+        """The number of files waiting to be converted or being converted"""
+        return len(self.__candidates) + len(self.__queued)
+
+    def poll(self) -> List[JobResult]:
+        """Scans the folders once, submits the conversions of the stable files
+
+        Returns:
+            List[JobResult]: the conversions finished since the last poll
+        """
+        results = self.__collect()
+
+        for folder in self.__folders:
+            self.__scan(folder)
+
+        self.__submit()
+
+        return results
+
+    def watch(self, stop: Event, interval: float = POLL_INTERVAL) -> Iterator[JobResult]:
+        """Polls the folders until stopped, yielding the conversions as they finish
+
+        Args:
+            stop (Event): set to stop watching, the running conversions are cancelled
+            interval (float): the seconds between two scans of the folders
+        """
+        while not stop.is_set():
+            yield from self.poll()
+
+            if self.__running:
+                wait(self.__running, timeout=interval, return_when=FIRST_COMPLETED)
+
+            else:
+                stop.wait(interval)
+
+    def __scan(self, folder: WatchedFolder) -> None:
+        try:
+            paths = sorted(path for path in folder.directory.iterdir() if path.suffix.lower() == GCODE_SUFFIX)
+
+        except OSError:
+            return
+
+        for path in paths:
+            signature = file_signature(path)
+
+            # a file being converted is checked again once its conversion finished
+            if signature is None or self.__converted.get(path) == signature or path in self.__queued:
+                continue
+
+            # the files converted before the watcher started
+            output_signature = file_signature(folder.output_path(path))
+
+            if path not in self.__converted and output_signature is not None and output_signature[0] >= signature[0]:
+                self.__converted[path] = signature
+                continue
+
+            if self.__candidates.get(path) != signature:
+                self.__candidates[path] = signature
+                continue
+
+            del self.__candidates[path]
+
+            job = profile_job(folder.values, path, folder.output_path(path), self.__cache_dir)
+            self.__queued[path] = signature
+            self.__ready.append((job, signature))
+
+    def __submit(self) -> None:
+        assert self.__executor is not None, 'the watcher is not started'
+
+        while self.__ready and len(self.__running) < self.__workers * JOBS_PER_WORKER:
+            job, signature = self.__ready.popleft()
+            Path(job.output_path).parent.mkdir(parents=True, exist_ok=True)
+            self.__running[self.__executor.submit(run_job, job)] = (Path(job.input_path), signature)
+
+    def __collect(self) -> List[JobResult]:
+        results = []
+
+        for future in [future for future in self.__running if future.done()]:
+            path, signature = self.__running.pop(future)
+            del self.__queued[path]
+
+            # a failed file is not converted again until it changes
+            self.__converted[path] = signature
+            results.append(future.result())
+
+        return results
@@ -0,0 +1,158 @@
+"""Testing module for the cache of the generated programs"""
+
+from contextlib import redirect_stdout
+from dataclasses import replace
+from io import StringIO
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import unittest
+from unittest import mock
+
+from click.testing import CliRunner
+
+from gcode2as import main
+from gcode2as.batch import profile_job, run_job
+from gcode2as.benchmark import GENERATORS, SETTINGS
+from gcode2as.cache import CACHE_DIR_ENV, CACHE_SIZE_ENV, ConversionCache, cache_key
+from gcode2as.cli import CLICommandOptions
+from gcode2as.cli.modes import MODES
+from gcode2as.converter import Converter
+from gcode2as.headless import cli
+from gcode2as.profiling import Profiler, Progress
+
+
+class TestCache(unittest.TestCase):
+    """Test case for the keys, the hits and the eviction of the conversion cache"""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.root = Path(self.directory.name)
+        self.path = self.root.joinpath('part.gcode')
+        self.path.write_text(''.join(GENERATORS['fdm'](2000)))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def key(self, path: Path | None = None, settings=None, **options) -> str:
+        """Returns the cache key of converting the file with the fdm mode"""
+        with redirect_stdout(StringIO()):
+            mode = MODES['fdm']()
+
+        options = CLICommandOptions(**{'file': None, 'min_distance': 2, 'verbose': False, **options})
+
+        return cache_key(path or self.path, 'part', mode, settings or SETTINGS['fdm'], options)
+
+    def test_hit(self):
+        """Tests that a cached program is copied without parsing the file again"""
+        values = {'mode': 'fdm', 'min_distance': 2, 'settings': SETTINGS['fdm']}
+        job = profile_job(values, self.path, self.root.joinpath('part.pg'), str(self.root.joinpath('cache')))
+
+        first = run_job(job)
+        program = Path(job.output_path).read_text()
+
+        self.assertTrue(first.succeeded, first.error)
+        self.assertFalse(first.cached)
+
+        os.remove(job.output_path)
+
+        with mock.patch.object(Converter, 'parse', side_effect=AssertionError('the file was parsed')):
+            second = run_job(job)
+
+        self.assertTrue(second.succeeded, second.error)
+        self.assertTrue(second.cached)
+        self.assertEqual(Path(job.output_path).read_text(), program)
+
+        # a job without a cache directory converts the file again
+        third = run_job(replace(job, cache_dir=None))
+
+        self.assertFalse(third.cached)
+        self.assertEqual(Path(job.output_path).read_text(), program)
+
+    def test_key(self):
+        """Tests that the key follows the input, the answers and the options, but not the instrumentation"""
+        key = self.key()
+
+        self.assertEqual(self.key(), key)
+        self.assertEqual(self.key(profiler=Profiler(), progress=Progress(100), mapped=True), key)
+
+        other = self.root.joinpath('other.gcode')
+        other.write_text(self.path.read_text() + 'G1 X1\n')
+
+        self.assertNotEqual(self.key(other), key)
+        self.assertNotEqual(self.key(settings={**SETTINGS['fdm'], 'retract': 0}), key)
+        self.assertNotEqual(self.key(min_distance=1), key)
+        self.assertNotEqual(self.key(precision=0.01), key)
+        self.assertNotEqual(self.key(optimize=True), key)
+
+    def test_eviction(self):
+        """Tests that the least recently used programs are evicted past the size of the cache"""
+        program = self.root.joinpath('program.pg')
+        program.write_text('x' * 100)
+
+        with mock.patch.dict(os.environ, {CACHE_SIZE_ENV: '250'}):
+            cache = ConversionCache(self.root.joinpath('cache'))
+
+        for index, key in enumerate(('a', 'b')):
+            cache.put(key, program)
+            os.utime(cache.get(key), (index, index))
+
+        # reading the older program makes the other one the least recently used
+        self.assertIsNotNone(cache.get('a'))
+        cache.put('c', program)
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_no_cache(self):
+        """Tests that the batch conversion stores the programs unless --no-cache is given"""
+        cache = self.root.joinpath('cache')
+        runner = CliRunner()
+        arguments = ['batch', '-m', 'fdm', '-j', '1', str(self.path)]
+
+        with mock.patch.dict(os.environ, {CACHE_DIR_ENV: str(cache)}):
+            result = runner.invoke(cli, [*arguments, '--no-cache'])
+
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertFalse(cache.exists() and any(cache.iterdir()))
+
+            runner.invoke(cli, arguments)
+            result = runner.invoke(cli, arguments)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('CACHED', result.output)
+        self.assertEqual(len(list(cache.glob('*.pg'))), 1)
+
+    def test_partial(self):
+        """Tests that a file only converted partially fails the batch and its program is never cached"""
+        cache = self.root.joinpath('cache')
+        path = self.root.joinpath('weld.gcode')
+        path.write_text('G1 X1 Y1 Z1\nG1 X2 Y2\nG0 X5 Y5\nG1 X6 Y6\nG1 X9 Y9\n')
+
+        with mock.patch.dict(os.environ, {CACHE_DIR_ENV: str(cache)}):
+            result = CliRunner().invoke(cli, ['batch', '-m', 'metal', '-j', '1', str(path)])
+
+        self.assertEqual(result.exit_code, 1, result.output)
+        self.assertIn('FAILED', result.output)
+        self.assertIn('Invalid State', result.output)
+        self.assertFalse(path.with_suffix('.pg').exists())
+        self.assertFalse(cache.exists() and any(cache.glob('*.pg')))
+
+        # the interactive conversion keeps the partial program, but does not store it
+        with open(path, 'r', encoding='utf8') as file, redirect_stdout(StringIO()):
+            mode = MODES['metal']()
+            mode.configure(SETTINGS['metal'])
+            options = CLICommandOptions(file=file, min_distance=2, verbose=False)
+            key = cache_key(path, 'weld', mode, SETTINGS['metal'], options)
+
+            main.convert(
+                mode, SETTINGS['metal'], options, path.with_suffix('.pg'), 1, False, ConversionCache(cache), key
+            )
+
+        self.assertTrue(path.with_suffix('.pg').exists())
+        self.assertFalse(cache.exists() and any(cache.glob('*.pg')))
+
+
+if __name__ == "__main__":
+    unittest.main()
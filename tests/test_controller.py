@@ -0,0 +1,94 @@
+"""Testing module for loading the programs on a fake controller"""
+
+from io import StringIO
+from threading import Thread
+from typing import Dict, List
+import unittest
+
+from gcode2as.controller import ControllerSettings, ControllerWriter
+from gcode2as.fake_controller import FakeController
+from gcode2as.formatter import ProgramBudget, write_program
+
+LINES = [f'LMOVE TRANS({i},{i % 7},0,0,180,0)\n' for i in range(2500)]
+
+
+def parse_programs(text: str) -> Dict[str, List[str]]:
+    """Returns the steps of the programs in the text of a .pg file"""
+    programs: Dict[str, List[str]] = {}
+    steps: List[str] = []
+
+    for line in text.splitlines():
+        if line.startswith('.PROGRAM'):
+            steps = programs.setdefault(line.split()[1], [])
+
+        elif line.strip() and line != '.END':
+            steps.append(line.strip())
+
+    return programs
+
+
+class TestController(unittest.TestCase):
+    """Test case for the uploads to the AS terminal"""
+
+    def start(self, **options) -> FakeController:
+        """Starts a fake controller, stopped at the end of the test"""
+        server = FakeController(('127.0.0.1', 0), **options)
+        thread = Thread(target=server.serve_forever)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+        self.addCleanup(stop)
+
+        return server
+
+    def upload(self, server: FakeController, lines: List[str]) -> str:
+        """Writes the program of the lines to the controller, returns the text of the program"""
+        copy = StringIO()
+        settings = ControllerSettings(*server.server_address, retry_delay=0.01, timeout=5)
+
+        with ControllerWriter(settings, copy) as writer:
+            write_program(lines, 'part', writer, ProgramBudget(max_steps=1000))
+
+        self.assertEqual(writer.programs, ['part_0', 'part_1', 'part_2', 'part'])
+
+        return copy.getvalue()
+
+    def test_upload(self):
+        """Tests that the programs on the controller are the same as in the file"""
+        server = self.start()
+        text = self.upload(server, LINES)
+
+        self.assertEqual(server.programs, parse_programs(text))
+        self.assertEqual(len(server.sessions), 1)
+
+    def test_reconnect(self):
+        """Tests that a program dropped half way is entered again"""
+        server = self.start(drop_after=1500)
+        text = self.upload(server, LINES)
+
+        self.assertEqual(server.programs, parse_programs(text))
+        self.assertEqual(len(server.sessions), 2)
+
+    def test_replay(self):
+        """Tests that a recorded session is replayed, and the differences from it are errors"""
+        recorder = self.start()
+        self.upload(recorder, LINES)
+
+        server = self.start(transcript=recorder.sessions[0])
+        self.upload(server, LINES)
+
+        self.assertEqual(server.mismatches, [])
+
+        with self.assertRaisesRegex(RuntimeError, 'E9999'):
+            self.upload(server, LINES[:1200] + ['LMOVE TRANS(0,0,0,0,0,0)\n'] + LINES[1200:])
+
+        # the steps sent ahead of the error differ too
+        self.assertIn('LMOVE TRANS(0,0,0,0,0,0)', server.mismatches[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
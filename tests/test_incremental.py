@@ -0,0 +1,147 @@
+"""Testing module for re-converting only the changed layers of a file"""
+
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+import re
+from tempfile import TemporaryDirectory
+from typing import List, Tuple
+import unittest
+
+from gcode2as.benchmark import GENERATORS, SETTINGS
+from gcode2as.cache import ConversionCache
+from gcode2as.cli import CLICommandOptions
+from gcode2as.cli.modes import MODES
+from gcode2as.incremental import LayerStore, convert_incremental, fingerprint_layers
+from gcode2as.simplify import SIMPLIFICATIONS, SIMPLIFY_DISTANCE, SIMPLIFY_TOLERANCE
+
+REUSED_PATTERN = re.compile(r'Reused (\d+) of (\d+) layers')
+
+
+class TestIncremental(unittest.TestCase):
+    """Test case for the reuse of the stored layers"""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.root = Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def convert(
+            self,
+            mode: str,
+            path: Path,
+            incremental: bool = True,
+            simplification: str = SIMPLIFY_DISTANCE,
+            **options
+    ) -> Tuple[List[str], Tuple[int, int] | None]:
+        """Converts the file, returns the program lines and the reused and all layers of an incremental conversion"""
+        log = StringIO()
+
+        with redirect_stdout(log):
+            command = MODES[mode]()
+            command.configure(SETTINGS[mode])
+
+            with open(path, 'r', encoding='utf8') as file:
+                options = CLICommandOptions(
+                    **{'file': file, 'min_distance': 2, 'verbose': False, 'simplification': simplification, **options}
+                )
+
+                if incremental:
+                    store = LayerStore(ConversionCache(self.root.joinpath('cache')), f'{mode}-{simplification}')
+                    lines: List[str] = list(convert_incremental(command, options, store))
+
+                else:
+                    lines = list(command.convert(options))
+
+        reused = REUSED_PATTERN.search(log.getvalue())
+
+        return lines, (int(reused.group(1)), int(reused.group(2))) if reused else None
+
+    def test_reuse(self):
+        """Tests that the unchanged layers are reused and the program is that of a full conversion"""
+        for mode in MODES:
+            for simplification in SIMPLIFICATIONS:
+                path = self.root.joinpath(f'{mode}.gcode')
+                lines = list(GENERATORS[mode](30_000))
+                path.write_text(''.join(lines))
+
+                program, (reused, layers) = self.convert(mode, path, simplification=simplification)
+
+                self.assertGreater(layers, 2)
+                self.assertEqual(reused, 0)
+                self.assertEqual(program, self.convert(mode, path, False, simplification)[0])
+                self.assertEqual(self.convert(mode, path, simplification=simplification), (program, (layers, layers)))
+
+                # a move in the middle of the file is moved, the layers before it are reused
+                index = next(index for index in range(len(lines) // 2, len(lines)) if lines[index].startswith('G1 X'))
+                lines[index] = lines[index].replace('G1 X', 'G1 X1', 1)
+                path.write_text(''.join(lines))
+
+                edited = len(''.join(lines[:index]).encode('utf8'))
+                before = sum(layer.end <= edited for layer in fingerprint_layers(str(path)))
+
+                program, (reused, layers) = self.convert(mode, path, simplification=simplification)
+
+                self.assertGreaterEqual(reused, before)
+                self.assertLess(reused, layers)
+                self.assertEqual(program, self.convert(mode, path, False, simplification)[0])
+
+                # the layers after it are reused as well, unless the skipped distance of the minimum
+                # distance simplification changed
+                if simplification == SIMPLIFY_TOLERANCE:
+                    self.assertEqual(reused, layers - 1)
+
+    def test_error(self):
+        """Tests that an error stops the conversion like the serial one and keeps the stored layers"""
+        path = self.root.joinpath('metal.gcode')
+        lines = list(GENERATORS['metal'](30_000))
+        path.write_text(''.join(lines))
+
+        _, (_, layers) = self.convert('metal', path)
+
+        # a weld without a travel before it stops the conversion
+        path.write_text('G1 X1 Y1 Z1\nG1 X2 Y2\n' + ''.join(lines))
+
+        program, reused = self.convert('metal', path)
+
+        self.assertIsNone(reused)
+        self.assertEqual(program, self.convert('metal', path, False)[0])
+
+        store = LayerStore(ConversionCache(self.root.joinpath('cache')), f'metal-{SIMPLIFY_DISTANCE}')
+        self.assertEqual(sum(len(records) for records in store.load().values()), layers)
+
+    def test_line_boundaries(self):
+        """Tests that the stored layers are only split at the line feeds, not in the comments of the program"""
+        path = self.root.joinpath('metal.gcode')
+        lines = GENERATORS['metal'](30_000)
+        # the verbose welds copy the G-code lines with their comments into the program
+        path.write_text(''.join(
+            line.replace('\n', ' ; a\x0cb\u2028c\n') if line.startswith('G0') else line for line in lines
+        ))
+
+        program, _ = self.convert('metal', path, verbose=True)
+
+        self.assertTrue(all(line.endswith('\n') for line in program))
+        self.assertTrue(any('\u2028' in line for line in program))
+        self.assertEqual(self.convert('metal', path, verbose=True)[0], program)
+
+    def test_layers(self):
+        """Tests that the layers end after a travel and cover the whole file"""
+        path = self.root.joinpath('laser.gcode')
+        path.write_text(''.join(GENERATORS['laser'](30_000)))
+        data = path.read_bytes()
+
+        layers = fingerprint_layers(str(path))
+
+        self.assertGreater(len(layers), 2)
+        self.assertEqual((layers[0].start, layers[-1].end), (0, len(data)))
+
+        for layer, following in zip(layers, layers[1:]):
+            self.assertEqual(layer.end, following.start)
+            self.assertTrue(data[data.rfind(b'\n', 0, layer.end - 1) + 1:].startswith(b'G0 '))
+
+
+if __name__ == "__main__":
+    unittest.main()
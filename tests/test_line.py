@@ -1,56 +1,493 @@
-"""Testing module for the Line objects"""
+"""Testing module for converting the G-code lines with the modes"""
 
-from typing import List
+from contextlib import redirect_stdout
+from io import StringIO
+import json
+import math
+import os
+from pathlib import Path
+import re
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Dict, List
+from gcodeparser.gcode_parser import get_lines
 import unittest
+from unittest import mock
 
-from gcode2as.model.line import Line
-from gcode2as.converter import convert_to_as
-from gcode2as.main import format_program
+from gcode2as import estimate as estimate_module, main
+from gcode2as.batch import profile_job, run_job
+from gcode2as.benchmark import GENERATORS, SETTINGS
+from gcode2as.cli import CLICommandOptions
+from gcode2as.cli.modes import MODES
+from gcode2as.encoder import PositionEncoder
+from gcode2as.estimate import CycleEstimator, estimate_program
+from gcode2as.formatter import MAX_PROGRAM_LENGTH, ProgramBudget, format_program, split_program
+from gcode2as.mapped import MappedFile
+from gcode2as.optimizer import Optimizer
+from gcode2as.pipeline import ReadAhead, WriteBehind
+from gcode2as.profiling import Profiler
+from gcode2as.records import GcodeRecord
+from gcode2as.tokenizer import Tokenizer
 
-TEST_FILE = "resources/kup.gcode"
+
+class RecordedProgress:
+    """Records the updates of the progress instead of drawing a bar"""
+
+    step = 1 << 12
+
+    def __init__(self) -> None:
+        self.consumed: List[int] = []
+        self.finished = False
+
+    def update(self, consumed: int) -> None:
+        self.consumed.append(consumed)
+
+    def finish(self) -> None:
+        self.finished = True
 
 
 class TestLine(unittest.TestCase):
-    """Test case for the Line object"""
-
-    test_lines_num = 100_000
-    lines = List[Line]
-    lines_converted = List[str]
-
-    def setUp(self) -> None:
-        self.lines = []
-        self.lines_converted = []
-
-    def line_generator(self):
-        """Creates a line generator"""
-        with open(TEST_FILE, "r", encoding="utf-8") as f_open:
-            for line in f_open:
-                yield line
-
-    def test_parsing(self):
-        """Tests the parse method of the Line object"""
-        prev_line = None
-        for i, line_str in enumerate(self.line_generator()):
-            if i >= TestLine.test_lines_num:
-                return
-
-            line = Line.parse(line_str, prev_line)
-            prev_line = line
-            self.lines.append(line)
-
-    def test_converting(self):
-        """Tests the convert_to_as method of the Line object"""
-        self.test_parsing()
-        self.lines_converted = convert_to_as(
-            self.lines, 0, 1, min_dist=2, verbose=True)
+    """Test case for the conversion of synthetic G-code"""
+
+    test_lines_num = 10_000
+
+    def convert(self, mode: str, lines_num: int = test_lines_num, **options) -> List[str]:
+        """Converts synthetic G-code of the mode non-interactively"""
+        return self.convert_text(mode, ''.join(GENERATORS[mode](lines_num)), **options)
+
+    def convert_text(self, mode: str, text: str, settings: Dict[str, Any] | None = None, **options) -> List[str]:
+        """Converts the G-code text with the mode non-interactively"""
+        file = StringIO(text)
+
+        with redirect_stdout(StringIO()):
+            command = MODES[mode]()
+            command.configure(SETTINGS[mode] if settings is None else settings)
+
+            options = CLICommandOptions(**{'file': file, 'min_distance': 2, 'verbose': False, **options})
+
+            return list(command.convert(options))
+
+    def test_fdm(self):
+        """Tests that the extrusion is switched on once per layer and retracted at its end"""
+        lines = self.convert('fdm')
+
+        self.assertTrue(all(line.endswith('\n') for line in lines))
+        # the generated file can end in the middle of a layer
+        self.assertIn(lines.count('SIGNAL 2001\n') - lines.count('SIGNAL -2001\n'), (0, 1))
+        self.assertEqual(lines.count('SIGNAL -2001\n'), lines.count('PULSE 2002, 0.1\n'))
+        self.assertGreater(sum(line.startswith('LMOVE') for line in lines), 0)
+
+    def test_metal(self):
+        """Tests that every weld is started and ended"""
+        lines = self.convert('metal')
+
+        self.assertTrue(lines[1].startswith('W1SET 1 = 15.0'))
+        self.assertEqual(
+            sum(line.startswith('LWS') for line in lines),
+            sum(line.startswith('LWE') for line in lines)
+        )
+        self.assertGreater(sum(line.startswith('LWC') for line in lines), 0)
+
+    def test_metal_min_distance(self):
+        """Tests that the minimum distance skips the same weld moves as before the shared simplification"""
+        text = (
+            'G0 X0.5 Y0.5 Z1.0\nG1 X1.2 Y0.5 Z1.0 E1\nG1 X1.9 Y0.5 Z1.0 E2\nG1 X2.6 Y0.5 Z1.0 E3\n'
+            'G1 X2.6 Y0.5 Z3.5 E4\nG1 X3.1 Y0.5 Z3.5 E5\nG1 X5.5 Y0.5 E6\nG1 X6.2 Y1.5 E7\nG1 X6.9 Y1.5 E8\n'
+            'G0 X10.5 Y10.5 Z4.0\nG1 X11.5 Y10.5 E9\nG1 X12.5 Y10.5 E10\nG1 X12.9 Y10.5 E11\nG0 X20.5 Y20.5\n'
+        )
+        first = ['LWS SHIFT(a BY 0.5, 0.5, 1.0)\n', 'LWC SHIFT(a BY 2.6, 0.5, 1.0), 1\n']
+        last = [
+            'LWC SHIFT(a BY 5.5, 0.5, 3.5), 1\n', 'LWE SHIFT(a BY 6.9, 1.5, 3.5), 1, 1\n',
+            'LWS SHIFT(a BY 10.5, 10.5, 4.0)\n', 'LWC SHIFT(a BY 12.5, 10.5, 4.0), 1\n',
+            'LWE SHIFT(a BY 12.9, 10.5, 4.0), 1, 1\n'
+        ]
+
+        # outside vase mode the change of z counts as no distance, so it is skipped
+        for vase_mode, welds in ((False, first + last), (True, first + ['LWC SHIFT(a BY 2.6, 0.5, 3.5), 1\n'] + last)):
+            lines = self.convert_text('metal', text, {**SETTINGS['metal'], 'vase_mode': vase_mode})
+
+            self.assertEqual([line for line in lines if line.startswith('LW')], welds)
+
+    def test_laser(self):
+        """Tests that the laser is switched on for every contour and off after it"""
+        lines = self.convert('laser')
+
+        self.assertEqual(lines.count('PULSE 10\n'), lines.count('PULSE -11\n') + 1)
+
+    def test_arcs(self):
+        """Tests that the arcs are translated to pairs of circular moves of at most half a circle"""
+        text = (
+            'G0 X0 Y0 Z1\nG1 X10 Y0 Z1 E1\nG3 X0 Y10 I-10 J0 E2\nG2 X10 Y0 R10 E3\n'
+            'G3 X10 Y0 I-10 J0 E4\nG1 X20 E5\nG0 X0\n'
+        )
+        lines = self.convert_text('fdm', text, min_distance=0)
+        circular = [line.split(' SHIFT')[0] for line in lines if line.startswith(('C1MOVE', 'C2MOVE'))]
+
+        # a quarter circle, a quarter circle given by its radius and a full circle in two halves
+        self.assertEqual(circular, ['C1MOVE', 'C2MOVE'] * 4)
+        self.assertIn('C2MOVE SHIFT(a BY 0.0, 10.0, 1.0)\n', lines)
+
+        welds = [line.split(' SHIFT')[0] for line in self.convert_text('metal', text, min_distance=0)]
+
+        self.assertEqual(welds.count('C1WC'), 4)
+        self.assertEqual(welds.count('C2WC'), 4)
+        self.assertNotIn('C2WE', welds)
+        self.assertIn('LWE', welds)
+
+    def test_arc_fitting(self):
+        """Tests that the runs of moves on the circles of the walls are replaced with arcs"""
+        linear = self.convert('fdm', min_distance=0)
+        fitted = self.convert('fdm', min_distance=0, arc_tolerance=0.02)
+
+        self.assertEqual(
+            sum(line.startswith('C1MOVE') for line in fitted),
+            sum(line.startswith('C2MOVE') for line in fitted)
+        )
+        self.assertGreater(sum(line.startswith('C1MOVE') for line in fitted), 0)
+        self.assertLess(len(fitted) * 3, len(linear))
+        self.assertEqual(fitted.count('SIGNAL 2001\n'), linear.count('SIGNAL 2001\n'))
+
+    def test_optimizer(self):
+        """Tests that the repeated speeds and positions and the extruder switched off and on are removed"""
+        text = (
+            'G0 X0 Y0 Z1 F1000\nG0 X0 Y0 Z1\nG1 X10 E1 F600\nG1 X20 E2 F600\nG1 X20 E2\n'
+            'G1 X20 E3 F600\nG1 X30 E4 F600\n'
+        )
+        settings = {**SETTINGS['fdm'], 'retract': 0}
+        lines = self.convert_text('fdm', text, settings, min_distance=0)
+
+        with redirect_stdout(StringIO()):
+            mode = MODES['fdm']()
+            mode.configure(settings)
+
+        optimizer = Optimizer(mode.split_rules())
+        optimized = list(optimizer.optimize(lines))
+
+        self.assertEqual(optimized, [
+            'SPEED 1000 MM/MIN ALWAYS\n',
+            'LMOVE SHIFT(a BY 0.0, 0.0, 1.0)\n',
+            'SPEED 600 MM/MIN ALWAYS\n',
+            'SIGNAL 2001\n',
+            'LMOVE SHIFT(a BY 10.0, 0.0, 1.0)\n',
+            'LMOVE SHIFT(a BY 20.0, 0.0, 1.0)\n',
+            'LMOVE SHIFT(a BY 30.0, 0.0, 1.0)\n',
+        ])
+        self.assertEqual(optimizer.counts, {'position': 3, 'signal': 2, 'speed': 3})
+
+    def test_estimate(self):
+        """Tests the path lengths and times of the moves, the arcs and the welds, with and without NumPy"""
+        text = 'G0 X0 Y0 Z1 F6000\nG1 X10 E1 F600\nG3 X0 Y10 I-10 J0 E2\nG1 X0 Y0 E3\n'
+        settings = {**SETTINGS['fdm'], 'retract': 0}
+        lines = self.convert_text('fdm', text, settings, min_distance=0)
+        lines += ['; LAYER:1\n', 'SIGNAL -2001\n', 'SPEED 3000 MM/MIN ALWAYS\n', 'LMOVE SHIFT(a BY 0.0, 0.0, 31.0)\n']
+
+        with redirect_stdout(StringIO()):
+            mode = MODES['fdm']()
+            mode.configure(settings)
+
+        estimator = CycleEstimator(mode.split_rules())
+        self.assertEqual(list(estimator.observe(lines)), lines)
+
+        estimate = estimator.estimate()
+        first, second = estimate.layers
+
+        # a line, a quarter circle and a line at 10 mm/s, then a travel of 30 mm at 50 mm/s
+        self.assertAlmostEqual(first.process_length, 20 + 5 * math.pi, places=5)
+        self.assertAlmostEqual(first.process_time, 2 + math.pi / 2, places=5)
+        self.assertEqual((first.z, first.moves, first.toggles), (1.0, 4, 1))
+        self.assertAlmostEqual(second.travel_length, 30)
+        self.assertAlmostEqual(second.time, 0.6)
+        self.assertEqual(estimate.toggles, 2)
+
+        # the same sums without NumPy, and over blocks splitting the layers
+        for use_numpy, block_size in ((False, estimate_module.BLOCK_SIZE), (True, 2), (False, 2)):
+            with mock.patch.object(estimate_module, 'BLOCK_SIZE', block_size):
+                other = CycleEstimator(mode.split_rules(), use_numpy=use_numpy)
+                for line in lines:
+                    other.add(line)
+
+            for layer, expected in zip(other.estimate().layers, estimate.layers):
+                for field in ('travel_length', 'process_length', 'travel_time', 'process_time'):
+                    self.assertAlmostEqual(getattr(layer, field), getattr(expected, field), places=9)
+
+                self.assertEqual((layer.z, layer.moves, layer.toggles), (expected.z, expected.moves, expected.toggles))
+
+        # the welds take the welding speed of their condition, the travel has no speed
+        welds = estimate_program([f'\t{line}' for line in self.convert('metal')], MODES['metal']().split_rules())
+
+        self.assertAlmostEqual(welds.process_time, welds.process_length / SETTINGS['metal']['speed'])
+        self.assertEqual(welds.untimed_moves, 1)
+
+    def test_estimate_requested(self):
+        """Tests that the programs are only estimated if the estimate is requested"""
+        with TemporaryDirectory() as directory:
+            path = Path(directory).joinpath('part.gcode')
+            path.write_text(''.join(GENERATORS['fdm'](1000)))
+
+            for estimated in (False, True):
+                with open(path, 'r', encoding='utf8') as f_open, redirect_stdout(StringIO()):
+                    mode = MODES['fdm']()
+                    mode.configure(SETTINGS['fdm'])
+                    options = CLICommandOptions(file=f_open, min_distance=2, verbose=False)
+
+                    with mock.patch.object(estimate_module, 'CycleEstimator', wraps=CycleEstimator) as estimator:
+                        cycle = main.convert(
+                            mode, SETTINGS['fdm'], options, Path(directory, 'part.pg'), 1, False, None, None,
+                            estimated=estimated
+                        )
+
+                self.assertEqual(estimator.called, estimated)
+                self.assertEqual(cycle is not None, estimated)
+
+                values = {'mode': 'fdm', 'min_distance': 2, 'settings': SETTINGS['fdm'], 'estimate': estimated}
+                result = run_job(profile_job(values, path, Path(directory, 'batch.pg')))
+
+                self.assertTrue(result.succeeded, result.error)
+                self.assertEqual('Estimated cycle time' in result.log, estimated)
+
+    def test_pipeline(self):
+        """Tests that reading and writing in threads gives the same program, in small batches"""
+        text = ''.join(GENERATORS['laser'](self.test_lines_num))
+        lines = self.convert_text('laser', text)
+
+        self.assertEqual(self.convert_text('laser', text, file=ReadAhead(StringIO(text), 1000, 2)), lines)
+
+        output = StringIO()
+
+        with WriteBehind(output, 1000, 2) as file:
+            file.writelines(lines)
+
+        self.assertEqual(output.getvalue(), ''.join(lines))
+
+    def test_mapped(self):
+        """Tests that parsing the memory-mapped file gives the same program as reading it as text"""
+        with TemporaryDirectory() as directory:
+            for mode in MODES:
+                text = ''.join(GENERATORS[mode](self.test_lines_num))
+                path = os.path.join(directory, f'{mode}.gcode')
+
+                # the lines end with both newlines in the mapping, the text input translates them
+                with open(path, 'w', encoding='utf8', newline='\r\n') as f_open:
+                    f_open.write(text + ';LAYER:1 \u00e9\nM104 S200 ; heat\n')
+
+                with open(path, 'r', encoding='utf8') as f_open:
+                    for verbose in (False, True):
+                        self.assertEqual(
+                            self.convert_text(mode, '', file=MappedFile(path), mapped=True, verbose=verbose),
+                            self.convert_text(mode, '', file=f_open, verbose=verbose)
+                        )
+                        f_open.seek(0)
+
+    def test_modal_axes(self):
+        """Tests that the axes missing from a move, or given without a number, keep their last value"""
+        lines = self.convert_text('fdm', 'G0 X1 Y2 Z3\nG1 X Y5.5 E1\nG0 Z7\n', min_distance=0)
+
+        self.assertEqual(
+            [line for line in lines if line.startswith('LMOVE')],
+            ['LMOVE SHIFT(a BY 1.0, 2.0, 3.0)\n', 'LMOVE SHIFT(a BY 1.0, 5.5, 3.0)\n', 'LMOVE SHIFT(a BY 1.0, 5.5, 7.0)\n']
+        )
+
+    def test_profile(self):
+        """Tests the stages and the counters of the --profile report, and the bytes of the progress"""
+        with TemporaryDirectory() as directory:
+            path = Path(directory, 'test.gcode')
+
+            # the decoded characters of the file are fewer than its bytes
+            with open(path, 'w', encoding='utf8', newline='\r\n') as f_open:
+                f_open.write(''.join(GENERATORS['fdm'](self.test_lines_num)) + '; café\n')
+
+            for wrap in (lambda file: file, ReadAhead):
+                progress = RecordedProgress()
+
+                with open(path, 'r', encoding='utf8') as f_open:
+                    lines = self.convert_text('fdm', '', file=wrap(f_open), progress=progress)
+
+                self.assertEqual(progress.consumed[-1], path.stat().st_size)
+                self.assertTrue(progress.finished)
+
+            with open(path, 'r', encoding='utf8') as f_open, redirect_stdout(StringIO()):
+                mode = MODES['fdm']()
+                mode.configure(SETTINGS['fdm'])
+                options = CLICommandOptions(file=f_open, min_distance=2, verbose=False, profiler=Profiler())
+
+                start = perf_counter()
+                main.convert(mode, SETTINGS['fdm'], options, Path(directory, 'test.pg'), 1, False, None, None)
+                report = json.loads(json.dumps(options.profiler.report(perf_counter() - start, file=str(path))))
+
+        self.assertEqual(report['file'], str(path))
+        self.assertEqual(report['input_lines'], self.test_lines_num + 1)
+        self.assertEqual(report['output_lines'], len(lines))
+        self.assertEqual(set(report['stages']), {'read', 'parse', 'resolve', 'handlers', 'convert', 'write'})
+        self.assertTrue(all(seconds >= 0 for seconds in report['stages'].values()))
+        self.assertLessEqual(sum(report['stages'].values()), report['wall_time'] * 1.01)
+        self.assertGreater(report['commands']['G1']['calls'], 0)
+
+    def test_tokenizer(self):
+        """Tests that the tokenizer gives the records of gcodeparser and only rejects the unneeded commands"""
+        lines = [
+            'G1 X10.5 Y-2 E.25 F1200 ; infill\n', 'g0x1y2z0.3\n', ';LAYER:1\n', ';\n', '; \n', '\n',
+            'G1 X1.2.3\n', 'G1 X1-2\n', 'G1 X1 5\n', 'N12 G1 X5*34\n', 'G2 X1 Y1 I-1 J0\n',
+            'M104 S200 G1 X5\n', 'M117 Printing, done ;G1\n', 'G1 X1 ; caf\u00e9\n', 'T0 M6\n'
+        ]
+        commands = {('G', 0), ('G', 1), ('G', 2), (';', None)}
+
+        for keep_text in (False, True):
+            for binary in (False, True):
+                tokenizer = Tokenizer(commands, keep_text, binary)
+
+                for line in lines:
+                    records = tokenizer.parse_line(line.replace('\n', '\r\n').encode() if binary else line)
+                    expected = [GcodeRecord.from_line(gcode_line, keep_text) for gcode_line in get_lines(line, True)]
+
+                    if records is None:
+                        self.assertEqual(len(expected), 1, line)
+                        self.assertNotIn(expected[0].command, commands, line)
+
+                    else:
+                        self.assertEqual(records, expected, line)
+
+        self.assertIsNone(Tokenizer(commands).parse_line('M104 S200 T0\n'))
+
+    def test_precision(self):
+        """Tests that the coordinates are rounded and the moves left in place are dropped"""
+        lines = self.convert('laser', min_distance=0, precision=0.01)
+        positions = [
+            match.group(1) for match in map(re.compile(r'LMOVE SHIFT\(a BY (.*)\)').match, lines) if match
+        ]
+
+        self.assertTrue(all(re.fullmatch(r'(-?\d+\.\d\d(, )?){3}', position) for position in positions))
+        self.assertTrue(all(current != previous for previous, current in zip(positions, positions[1:])))
+        self.assertLess(
+            len(self.convert('laser', min_distance=0, precision=1)), len(self.convert('laser', min_distance=0))
+        )
+
+        # a precision other than a power of ten rounds to its multiples
+        position = (1.2345, -0.026, 12.3749)
+
+        for precision in (0.05, 0.5, 2):
+            for value, original in zip(PositionEncoder(precision).round(position), position):
+                self.assertAlmostEqual(value / precision, round(value / precision))
+                self.assertLessEqual(abs(value - original), precision / 2)
+
+        self.assertEqual(
+            PositionEncoder(0.05).format_move('LMOVE', position), 'LMOVE SHIFT(a BY 1.25, -0.05, 12.35)'
+        )
 
     def test_formatting(self):
-        """Test the test_formatting method from the main module"""
-        self.test_converting()
-        as_file = format_program(self.lines_converted, "test")
+        """Tests that long programs are split into subprograms called by the main program"""
+        lines = self.convert('fdm')
+        program = format_program(lines, 'test')
+
+        self.assertGreater(len(lines), MAX_PROGRAM_LENGTH)
+        self.assertTrue(program.startswith('.PROGRAM test_0\n'))
+        self.assertTrue(program.endswith('.END\n'))
+        self.assertIn('\tCALL test_1\n', program)
+
+    def test_formatting_budget(self):
+        """Tests that the subprograms fit the budget and are split at the layers outside of the extrusions"""
+        lines = self.convert('fdm')
+        budget = ProgramBudget(max_steps=300, max_bytes=8000)
+
+        with redirect_stdout(StringIO()):
+            mode = MODES['fdm']()
+            mode.configure(SETTINGS['fdm'])
+
+        subprograms = list(split_program(lines, 'test', budget, mode.split_rules()))
+
+        self.assertEqual(sum(subprograms, []), lines)
+
+        for subprogram in subprograms[:-1]:
+            self.assertLessEqual(len(subprogram), budget.max_steps)
+            self.assertLessEqual(len(format_program(subprogram, 'test_00')), budget.max_bytes)
+            self.assertEqual(subprogram.count('SIGNAL 2001\n'), subprogram.count('SIGNAL -2001\n'))
+
+        self.assertTrue(all(subprogram[0].startswith('; LAYER') for subprogram in subprograms[1:]))
+
+    def test_formatting_welds(self):
+        """Tests that a weld is never split, even if it is longer than the budget"""
+        lines = self.convert('metal')
+
+        with redirect_stdout(StringIO()):
+            subprograms = list(
+                split_program(lines, 'test', ProgramBudget(max_steps=100), MODES['metal']().split_rules())
+            )
+
+        self.assertGreater(len(subprograms), 1)
+
+        for subprogram in subprograms:
+            self.assertEqual(
+                sum(line.startswith('LWS') for line in subprogram),
+                sum(line.startswith('LWE') for line in subprogram)
+            )
+
+    def test_formatting_oversized(self):
+        """Tests that a weld longer than the budget is kept whole with a warning naming its subprogram"""
+        weld = ['LWS SHIFT(a BY 0, 0, 0)\n', *['LWC SHIFT(a BY 1, 0, 0), 1\n'] * 50, 'LWE SHIFT(a BY 2, 0, 0), 1, 1\n']
+        lines = ['LMOVE SHIFT(a BY 0, 0, 0)\n'] * 10 + weld + ['LMOVE SHIFT(a BY 0, 0, 0)\n'] * 10
+        budget = ProgramBudget(max_steps=20)
+        output = StringIO()
+
+        with redirect_stdout(output):
+            subprograms = list(split_program(lines, 'test', budget, MODES['metal']().split_rules()))
+
+        self.assertEqual([len(subprogram) for subprogram in subprograms], [10, 52, 10])
+        self.assertIn('The subprogram test_1 has 52 steps', output.getvalue())
+        self.assertEqual(output.getvalue().count('Warning'), 1)
+
+        with redirect_stdout(output):
+            list(split_program(weld, 'test', budget, MODES['metal']().split_rules()))
+
+        self.assertIn('The subprogram test has 52 steps', output.getvalue())
+
+    def test_formatting_long_weld(self):
+        """Tests that a weld far over the budget is ended and restarted at the splits"""
+        weld = [
+            'LWS SHIFT(a BY 0, 0, 0)\n', *[f'LWC SHIFT(a BY {x}, 0, 0), 1\n' for x in range(1, 200)],
+            'C1WC SHIFT(a BY 199, 1, 0), 1\n', 'C2WC SHIFT(a BY 200, 2, 0), 1 ;G2\n',
+            'LWE SHIFT(a BY 201, 0, 0), 1, 1\n'
+        ]
+        lines = ['LMOVE SHIFT(a BY 0, 0, 0)\n'] * 10 + weld + ['LMOVE SHIFT(a BY 0, 0, 0)\n'] * 10
+        rules = MODES['metal']().split_rules()
+        output = StringIO()
+
+        with redirect_stdout(output):
+            subprograms = list(split_program(lines, 'test', ProgramBudget(max_steps=20), rules))
+
+        self.assertIn('A section starting in the subprogram test_1 is longer than 4 subprograms', output.getvalue())
+        self.assertNotIn('over the budget', output.getvalue())
+        self.assertTrue(all(len(subprogram) <= 20 for subprogram in subprograms))
+
+        for subprogram, following in zip(subprograms[1:], subprograms[2:]):
+            self.assertEqual(
+                sum(line.startswith('LWS') for line in subprogram),
+                sum(line.startswith(('LWE', 'C2WE')) for line in subprogram)
+            )
+
+            # the next subprogram starts the weld again where it was ended
+            if following[0].startswith('LWS'):
+                self.assertEqual(subprogram[-1].replace('LWE', 'LWS').replace(', 1, 1', ''), following[0])
+
+        # apart from the ends and restarts, the welded points are the same
+        def continued(program: List[str]) -> List[str]:
+            return [line.replace('LWE', 'LWC').replace(', 1, 1', ', 1') for line in program]
+
+        welded = sum(subprograms[:2], []) + [
+            line for subprogram in subprograms[2:] for line in subprogram[subprogram[0].startswith('LWS'):]
+        ]
+        self.assertEqual(continued(welded), continued(lines))
+
+        self.assertEqual(
+            rules.cut('C2WC SHIFT(a BY 1, 2, 3), 1 ;G2\n'),
+            ('C2WE SHIFT(a BY 1, 2, 3), 1, 1 ;G2\n', 'LWS SHIFT(a BY 1, 2, 3)\n')
+        )
+        self.assertIsNone(rules.cut('C1WC SHIFT(a BY 1, 2, 3), 1\n'))
+
+    def test_formatting_short(self):
+        """Tests that a short program is not split"""
+        program = format_program(self.convert('fdm', 100), 'test')
 
-        with open("generated/result.pg", "w", encoding="utf-8") as f_open:
-            f_open.write(as_file)
+        self.assertTrue(program.startswith('.PROGRAM test\n'))
+        self.assertTrue(program.endswith('.END'))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+"""Testing module for converting a single file in parallel chunks"""
+
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List, Tuple
+import unittest
+from unittest import mock
+
+from gcode2as import parallel
+from gcode2as.benchmark import GENERATORS, SETTINGS
+from gcode2as.cli import CLICommandOptions
+from gcode2as.cli.modes import MODES
+from gcode2as.parallel import convert_layers, split_layers
+from gcode2as.simplify import SIMPLIFICATIONS, SIMPLIFY_TOLERANCE
+
+WORKERS = 2
+
+
+class TestParallel(unittest.TestCase):
+    """Test case for the chunks of the parallel conversion"""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+
+        # small chunks and warm-ups, so the test files are split into many chunks
+        for name, value in (('MIN_CHUNK_SIZE', 1 << 15), ('WARMUP_SIZE', 1 << 13)):
+            patcher = mock.patch.object(parallel, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str, text: str) -> Path:
+        """Writes the G-code into the directory of the test"""
+        path = Path(self.directory.name).joinpath(name)
+        path.write_text(text)
+
+        return path
+
+    def convert(self, mode: str, path: Path, workers: int, settings=None, **options) -> Tuple[List[str], str]:
+        """Converts the file with the given number of workers, returns the lines and the messages"""
+        log = StringIO()
+
+        with redirect_stdout(log):
+            command = MODES[mode]()
+            command.configure(settings or SETTINGS[mode])
+
+            with open(path, 'r', encoding='utf8') as file:
+                options = CLICommandOptions(**{'file': file, 'min_distance': 2, 'verbose': False, **options})
+                lines = list(convert_layers(command, settings or SETTINGS[mode], options, workers))
+
+        return lines, log.getvalue()
+
+    def test_serial(self):
+        """Tests that the chunks give the same program as the serial conversion with both simplifications"""
+        for mode in MODES:
+            path = self.write(f'{mode}.gcode', ''.join(GENERATORS[mode](20_000)))
+
+            self.assertGreater(len(split_layers(str(path), 8)), 2)
+
+            for simplification in SIMPLIFICATIONS:
+                serial, _ = self.convert(mode, path, 1, simplification=simplification)
+                lines, log = self.convert(mode, path, WORKERS, simplification=simplification)
+
+                self.assertEqual(''.join(lines), ''.join(serial))
+
+                # the skipped distance of the minimum distance simplification is carried from chunk to chunk,
+                # the chunks starting with a different one are converted again, the buffered paths are not
+                if simplification == SIMPLIFY_TOLERANCE:
+                    self.assertIn(', 0 chunks had to be converted again', log)
+
+    def test_chunk_starts(self):
+        """Tests that the chunks start after a travel, and their warm-up at an earlier one or the start"""
+        path = self.write('metal.gcode', ''.join(GENERATORS['metal'](20_000)))
+        data = path.read_bytes()
+
+        for chunk in split_layers(str(path), 8)[1:]:
+            travel = data.rfind(b'\n', 0, chunk.start - 1) + 1
+
+            self.assertTrue(data[travel:chunk.start].startswith(b'G0 '))
+            self.assertTrue(chunk.warmup == 0 or data[chunk.warmup:].startswith(b'G0 '))
+            self.assertLess(chunk.warmup, travel)
+
+    def test_invalid_weld(self):
+        """Tests that a weld without a travel before it stops the conversion like the serial one"""
+        weld = ''.join(f'G1 X{i % 100} Y{i // 100} E{i}\n' for i in range(5000))
+        path = self.write('weld.gcode', weld + ''.join(GENERATORS['metal'](20_000)))
+
+        serial, serial_log = self.convert('metal', path, 1)
+        lines, log = self.convert('metal', path, WORKERS)
+
+        self.assertEqual(''.join(lines), ''.join(serial))
+        self.assertIn('The file will only be generated partially.', serial_log)
+        self.assertIn('The file will only be generated partially.', log)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Testing module for converting G-code over HTTP"""
+
+from http.client import HTTPConnection
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+import unittest
+
+from gcode2as.batch import profile_job, run_job
+from gcode2as.benchmark import GENERATORS, SETTINGS
+from gcode2as.server import OPTIONS_HEADER, ConversionServer
+
+
+class TestServer(unittest.TestCase):
+    """Test case for the conversion server with a local client"""
+
+    def setUp(self):
+        self.server = ConversionServer(('127.0.0.1', 0), workers=1, log_requests=False)
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def request(self, method: str, path: str, body: str | None = None, options: dict | None = None):
+        """Sends a request to the server, returns the status, the headers and the body"""
+        connection = HTTPConnection(*self.server.server_address, timeout=60)
+        headers = {OPTIONS_HEADER: json.dumps(options)} if options is not None else {}
+
+        try:
+            connection.request(method, path, body=body.encode() if body is not None else None, headers=headers)
+            response = connection.getresponse()
+
+            return response.status, dict(response.getheaders()), response.read().decode()
+
+        finally:
+            connection.close()
+
+    def test_convert(self):
+        """Tests that the streamed program is the same as the program of a batch conversion"""
+        values = {'mode': 'fdm', 'min_distance': 2, 'settings': SETTINGS['fdm']}
+        gcode = ''.join(GENERATORS['fdm'](3000))
+
+        status, headers, program = self.request('POST', '/convert?name=part', gcode, values)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Transfer-Encoding'], 'chunked')
+
+        with TemporaryDirectory() as directory:
+            path = Path(directory, 'part.gcode')
+            path.write_text(gcode)
+            run_job(profile_job(values, path, path.with_suffix('.pg')))
+
+            self.assertEqual(program, path.with_suffix('.pg').read_text())
+
+        status, _, body = self.request('POST', '/convert', gcode, {'mode': 'laser'})
+
+        self.assertEqual(status, 422)
+        self.assertIn('laser_control_first_signal', json.loads(body)['error'])
+
+        status, _, _ = self.request('POST', '/convert', gcode, {'mode': 'unknown'})
+
+        self.assertEqual(status, 400)
+
+        status, _, body = self.request('GET', '/health')
+        health = json.loads(body)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(health['status'], 'ok')
+        self.assertEqual((health['requests'], health['succeeded'], health['failed']), (3, 1, 2))
+        self.assertEqual(health['bytes_sent'], len(program.encode()))
+
+    def test_invalid_options(self):
+        """Tests that invalid options are answered with 400 before the upload is converted"""
+        gcode = ''.join(GENERATORS['fdm'](100))
+
+        for options in (
+                {'mode': 'fdm', 'min_distance': 'abc'},
+                {'mode': 'fdm', 'max_steps': [1]},
+                {'mode': 'fdm', 'simplification': 'fortran'},
+                {'mode': 'fdm', 'settings': 'abc'},
+                ['fdm']
+        ):
+            status, headers, body = self.request('POST', '/convert', gcode, options)
+
+            self.assertEqual(status, 400, options)
+            self.assertEqual(headers['Connection'], 'close')
+            self.assertTrue(json.loads(body)['error'])
+
+        health = json.loads(self.request('GET', '/health')[2])
+
+        self.assertEqual((health['requests'], health['failed'], health['bytes_received']), (5, 5, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
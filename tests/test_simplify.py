@@ -0,0 +1,107 @@
+"""Testing module for the tolerance based simplification of the toolpaths"""
+
+from contextlib import redirect_stdout
+from io import StringIO
+from math import cos, sin
+import random
+from typing import List
+import unittest
+
+from gcode2as.benchmark import SETTINGS
+from gcode2as.cli import CLICommandOptions
+from gcode2as.cli.modes import MODES
+from gcode2as.simplify import SIMPLIFY_TOLERANCE, PathSimplifier, segment_deviation, simplify_path
+from gcode2as.toolpath import Position
+
+TOLERANCE = 0.1
+
+
+def noisy_path(count: int, seed: int = 1) -> List[Position]:
+    """Returns the points of a wavy path in a plane with some noise"""
+    generator = random.Random(seed)
+
+    return [
+        (i * 0.5 + generator.uniform(-0.05, 0.05), 10 * sin(i / 15) + generator.uniform(-0.05, 0.05), 1.0)
+        for i in range(count)
+    ]
+
+
+class TestSimplify(unittest.TestCase):
+    """Test case for the Douglas-Peucker simplification of the paths"""
+
+    def assertWithinTolerance(self, points: List[Position], kept: List[int], tolerance: float):
+        """Asserts that every dropped point lies within the tolerance of the kept segment around it"""
+        for start, end in zip(kept, kept[1:]):
+            for index in range(start + 1, end):
+                self.assertLessEqual(segment_deviation(points[index], points[start], points[end]), tolerance)
+
+    def test_tolerance(self):
+        """Tests that the dropped points stay within the tolerance and the ends are kept"""
+        points = noisy_path(2000)
+
+        for tolerance in (0.01, TOLERANCE, 1.0):
+            kept = simplify_path(points, tolerance)
+
+            self.assertEqual((kept[0], kept[-1]), (0, len(points) - 1))
+            self.assertEqual(kept, sorted(set(kept)))
+            self.assertLess(len(kept), len(points))
+            self.assertWithinTolerance(points, kept, tolerance)
+
+        # a larger tolerance never keeps more points
+        self.assertLessEqual(len(simplify_path(points, 1.0)), len(simplify_path(points, TOLERANCE)))
+        self.assertEqual(simplify_path(points[:2], TOLERANCE), [0, 1])
+        self.assertEqual(simplify_path([(0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (2.0, 0.0, 0.0)], TOLERANCE), [0, 2])
+
+    def test_z_changes(self):
+        """Tests that both ends of the segments changing z are kept, unless the z changes are simplified"""
+        # a helix rising along a circle, and a flat path with a single step up in the middle
+        helix = [(10 * cos(i / 20), 10 * sin(i / 20), i * 0.002) for i in range(500)]
+        step = [(i * 0.1, 0.0, 1.0 if i < 50 else 2.0) for i in range(100)]
+
+        self.assertEqual(simplify_path(helix, TOLERANCE), list(range(len(helix))))
+        self.assertEqual(simplify_path(step, TOLERANCE), [0, 49, 50, 99])
+
+        # in vase mode the rising path is simplified like any other
+        kept = simplify_path(helix, TOLERANCE, keep_z_changes=False)
+
+        self.assertLess(len(kept), len(helix) // 2)
+        self.assertWithinTolerance(helix, kept, TOLERANCE)
+        self.assertEqual(simplify_path(step, TOLERANCE, keep_z_changes=False), [0, 49, 50, 99])
+
+    def test_simplifier(self):
+        """Tests that the buffered path emits the payloads of the kept points, without the anchor"""
+        points = noisy_path(300)
+        simplifier: PathSimplifier[int] = PathSimplifier(TOLERANCE)
+
+        for index, point in enumerate(points[1:], 1):
+            simplifier.add(points[0], point, index)
+
+        kept = simplifier.flush()
+
+        self.assertEqual(kept, simplify_path(points, TOLERANCE)[1:])
+        self.assertEqual(len(simplifier), 0)
+        self.assertEqual(simplifier.flush(), [])
+
+    def test_vase_mode(self):
+        """Tests that a welded ramp is only simplified in vase mode"""
+        ramp = ''.join(f'G1 X{i * 0.5} Y0 Z{i * 0.01:.2f} E{i}\n' for i in range(1, 200))
+        text = f'G0 X0 Y0 Z0\n{ramp}G0 X0 Y50 Z5\n'
+        welds = {}
+
+        for vase_mode in (False, True):
+            with redirect_stdout(StringIO()):
+                mode = MODES['metal']()
+                mode.configure({**SETTINGS['metal'], 'vase_mode': vase_mode})
+
+                options = CLICommandOptions(
+                    file=StringIO(text), min_distance=2, verbose=False, simplification=SIMPLIFY_TOLERANCE,
+                    tolerance=TOLERANCE
+                )
+                welds[vase_mode] = [line for line in mode.convert(options) if line.startswith(('LWC', 'LWE'))]
+
+        self.assertEqual(len(welds[False]), 199)
+        self.assertEqual(welds[True], ['LWE SHIFT(a BY 99.5, 0.0, 1.99), 1, 1\n'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Testing module for the startup time of the command line entry points"""
+
+import subprocess
+import sys
+import unittest
+
+# the modules only needed once a conversion or a prompt runs
+DEFERRED_MODULES = (
+    'pyfiglet',
+    'inquirer',
+    'numpy',
+    'gcodeparser',
+    'progress',
+    'gcode2as.cli.fdm',
+    'gcode2as.cli.metal',
+    'gcode2as.cli.laser_cut',
+    'gcode2as.converter',
+)
+
+# the cumulative import time of an entry point, in microseconds
+IMPORT_TIME_BUDGET = 100_000
+
+
+def import_in_subprocess(module: str) -> subprocess.CompletedProcess:
+    """Imports the module in a new interpreter, printing the names of the loaded modules"""
+    return subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import sys, {module}; print(*sys.modules)'],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+
+def import_time(stderr: str, module: str) -> int:
+    """Returns the cumulative import time of the module from the -X importtime output"""
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        _, cumulative, name = line.removeprefix('import time:').split('|')
+
+        if name.strip() == module:
+            return int(cumulative)
+
+    raise ValueError(f'{module} was not imported')
+
+
+class TestStartup(unittest.TestCase):
+    """Test case for the modules imported by the entry points"""
+
+    def check_entry_point(self, module: str):
+        result = import_in_subprocess(module)
+        loaded = set(result.stdout.split())
+
+        for deferred in DEFERRED_MODULES:
+            self.assertNotIn(deferred, loaded, f'{module} imports {deferred} on startup')
+
+        self.assertLess(import_time(result.stderr, module), IMPORT_TIME_BUDGET)
+
+    def test_main(self):
+        """Tests that the interactive command does not load the prompts or the modes on startup"""
+        self.check_entry_point('gcode2as.main')
+
+    def test_headless(self):
+        """Tests that the headless commands do not load the conversion on startup"""
+        self.check_entry_point('gcode2as.headless')
+
+    def test_headless_module(self):
+        """Tests that the headless commands also run with python -m"""
+        result = subprocess.run(
+            [sys.executable, '-m', 'gcode2as.headless', '--help'], capture_output=True, text=True, check=True
+        )
+
+        self.assertIn('batch', result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Testing module for converting the G-code files dropped into a watched folder"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import time
+import unittest
+
+from gcode2as.batch import profile_job, run_job
+from gcode2as.benchmark import GENERATORS, SETTINGS
+from gcode2as.watch import FolderWatcher, WatchedFolder
+
+# the seconds a file is given to be converted
+TIMEOUT = 60
+
+
+class TestWatch(unittest.TestCase):
+    """Test case for the watched folders"""
+
+    def poll_until(self, watcher: FolderWatcher, count: int) -> list:
+        """Polls the watcher until the conversions of count files finished"""
+        results = []
+        deadline = time.monotonic() + TIMEOUT
+
+        while len(results) < count:
+            self.assertLess(time.monotonic(), deadline, 'the files were not converted in time')
+            results.extend(watcher.poll())
+            time.sleep(0.05)
+
+        return results
+
+    def test_watch(self):
+        """Tests that the new and changed files are converted once, like in a batch"""
+        values = {'mode': 'fdm', 'min_distance': 2, 'settings': SETTINGS['fdm']}
+
+        with TemporaryDirectory() as directory:
+            inbox = Path(directory, 'inbox')
+            outbox = Path(directory, 'outbox')
+            inbox.mkdir()
+
+            for name in ('first', 'second', 'third'):
+                inbox.joinpath(f'{name}.gcode').write_text(''.join(GENERATORS['fdm'](500)))
+
+            inbox.joinpath('notes.txt').write_text('not G-code')
+
+            with FolderWatcher([WatchedFolder(inbox, values, outbox)], workers=1) as watcher:
+                results = self.poll_until(watcher, 3)
+
+                self.assertTrue(all(result.succeeded for result in results))
+                self.assertEqual(sorted(path.name for path in outbox.iterdir()), ['first.pg', 'second.pg', 'third.pg'])
+
+                # the converted files are not converted again
+                for _ in range(3):
+                    self.assertEqual(watcher.poll(), [])
+
+                self.assertEqual(watcher.pending, 0)
+
+                changed = inbox.joinpath('second.gcode')
+                changed.write_text(''.join(GENERATORS['fdm'](800)))
+                results = self.poll_until(watcher, 1)
+
+                self.assertEqual([Path(result.input_path) for result in results], [changed])
+
+            expected = Path(directory, 'expected.pg')
+            run_job(profile_job(values, changed, expected))
+
+            self.assertEqual(outbox.joinpath('second.pg').read_text(), expected.read_text())
+
+            # a restarted watcher skips the files converted before
+            with FolderWatcher([WatchedFolder(inbox, values, outbox)], workers=1) as watcher:
+                for _ in range(3):
+                    self.assertEqual(watcher.poll(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()